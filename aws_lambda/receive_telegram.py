@@ -1,39 +1,181 @@
 import json
 import logging
-import os
-from typing import Any, Dict
+import time
+from typing import Any, Dict, List, Optional, Sequence
 
 from bridge.app import create_app
-from bridge.providers import Providers, create_message_provider
-from bridge.repository import StateRepository
+from bridge.deadline import Deadline
+from bridge.prewarm import prewarm
+from bridge.profiling import profile_handler
+from bridge.providers import (
+    Message,
+    Providers,
+    SendResult,
+    create_message_provider,
+)
+from bridge.repository import (
+    ALL_BUILDINGS,
+    create_state_repository,
+    create_subscription_repository,
+)
 
 
+COMMANDS_HELP = (
+    'Commands: /start, /stop, /subscribe <building number|all>, '
+    '/unsubscribe <building number|all>'
+)
+
 app = create_app()
 log = logging.getLogger(__name__)
 telegram_provider = create_message_provider(app.config, Providers.TELEGRAM)
 twilio_provider = create_message_provider(app.config, Providers.TWILIO)
-repository = StateRepository(os.environ['state_dynamodb_table'])
+repository = create_state_repository(app.config)
+subscriptions = create_subscription_repository(app.config)
+prewarm_seconds: Optional[float] = None
+if app.config.prewarm.enabled:
+    prewarm_seconds = prewarm({
+        'telegram': telegram_provider.warm,
+        'twilio': twilio_provider.warm,
+        'state': repository.warm,
+        'subscriptions': subscriptions.warm,
+    }, app.config.prewarm.budget)
+
+
+def handle_command(message: Message, deadline: Deadline) -> str:
+    """ Applies a user command and returns the reply text. """
+    command, _, argument = message.text.strip().partition(' ')
+    command = command.split('@')[0]
+    building = argument.strip()
+    if building == 'all':
+        building = ALL_BUILDINGS
+
+    command = command.lstrip('/')
+
+    if command in ('subscribe', 'unsubscribe'):
+        if not building:
+            return f'Usage: /{command} <building number|all>'
+        if command == 'subscribe':
+            # A subscription is only delivered to active users.
+            repository.put_active(message.source, True, deadline)
+            subscriptions.subscribe(building, message.source, deadline)
+            return f'Subscribed to {argument.strip()}'
+        subscriptions.unsubscribe(building, message.source, deadline)
+        return f'Unsubscribed from {argument.strip()}'
+
+    if command in ('start', 'stop'):
+        active: bool = command == 'start'
+        repository.put_active(message.source, active, deadline)
+        return f'Set active state to {active}'
+
+    return COMMANDS_HELP
+
+
+def resolve_buildings(data: Dict[str, Any]) -> List[str]:
+    """ Returns unique building numbers of a dispatch, expanding groups. """
+    names: List[str] = data.get('buildings') or [data['building']]
+    if isinstance(names, str):
+        names = [names]
+    buildings: List[str] = []
+    for name in names:
+        buildings.extend(app.config.building_groups.get(name, (name,)))
+    return list(dict.fromkeys(buildings))
 
 
+def format_summary(results: Sequence[SendResult], elapsed: float) -> str:
+    """ Returns a reply listing delivered and failed buildings. """
+    delivered = [result for result in results if result.delivered]
+    lines = [
+        f'Delivered to {len(delivered)}/{len(results)} buildings '
+        f'in {elapsed:.2f}s'
+    ]
+    for result in results:
+        if result.delivered:
+            status = 'delivered'
+        elif result.attempted:
+            status = f'failed: {result.error}'
+        else:
+            status = 'not attempted'
+        lines.append(
+            f'{result.message.destination} {status} '
+            f'({result.elapsed:.2f}s)'
+        )
+    return '\n'.join(lines)
+
+
+def dispatch(
+        source: str,
+        data: Dict[str, Any],
+        media: List[str],
+        deadline: Deadline) -> str:
+    """ Sends a text and media to buildings, returns a send summary.
+
+    Only chats listed in dispatch.admin_chat_ids may dispatch, and to at
+    most dispatch.max_recipients buildings after expanding groups. Media
+    are Telegram file ids, resolved only once both checks passed.
+    """
+    config = app.config.dispatch
+    if source not in config.admin_chat_ids:
+        log.warning(f'Rejected dispatch from unauthorized chat {source}')
+        return 'This chat is not allowed to message buildings'
+    try:
+        buildings = resolve_buildings(data)
+        text: str = data['text']
+    except (KeyError, TypeError):
+        return 'Usage: {"buildings": [<building number|group>], "text": ...}'
+    if len(buildings) > config.max_recipients:
+        log.warning(
+            f'Rejected dispatch from {source} to {len(buildings)} buildings')
+        return (
+            f'Too many buildings: {len(buildings)}, '
+            f'at most {config.max_recipients} are allowed'
+        )
+
+    start = time.monotonic()
+    media = telegram_provider.resolve_media(media)
+    results = twilio_provider.send_many([
+        Message(
+            source=app.config.message_providers.twilio.number,
+            destination=building,
+            text=text,
+            media=list(media),
+        )
+        for building in buildings
+    ], deadline)
+    for result in results:
+        if not result.delivered:
+            log.error(f'Failed delivery: {result}')
+    return format_summary(results, time.monotonic() - start)
+
+
+@profile_handler(app.config)
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     log.info(f'Received event: {event}')
+    deadline = Deadline.from_context(context, app.config.deadline_margin)
     message = telegram_provider.parse_message(event['body'])
     try:
-        data: Dict[str, Any] = json.loads(message.text)
-        message.source = app.config['message_providers']['twilio']['number']
-        message.destination = data['building']
-        message.text = data['text']
-        twilio_provider.send_message(message)
+        data: Any = json.loads(message.text)
     except json.decoder.JSONDecodeError:
-        active: bool = message.text == 'start'
-        repository.put_active(message.source, active)
-        message.destination = message.source
-        message.text = f'Set active state to {active}'
-        telegram_provider.send_message(message)
+        data = None
+    if isinstance(data, dict):
+        reply = dispatch(message.source, data, message.media, deadline)
+    elif message.media:
+        reply = (
+            'Forward files with a caption '
+            '{"buildings": [<building number|group>], "text": ...}'
+        )
+    else:
+        reply = handle_command(message, deadline)
+
+    body = telegram_provider.reply(Message(
+        source=message.source,
+        destination=message.source,
+        text=reply,
+        media=[],
+    ), deadline)
 
     return {
         'statusCode': 200,
-        'headers': {},
+        'headers': {'Content-Type': 'application/json'} if body else {},
         'isBase64Encoded': False,
-        'body': '',
+        'body': body or '',
     }
@@ -1,30 +1,138 @@
 import logging
-import os
-from typing import Any, Dict
+import uuid
+from typing import Any, Dict, List, Optional
 
 from bridge.app import create_app
-from bridge.providers import Providers, create_message_provider
-from bridge.repository import StateRepository
+from bridge.broadcast import Broadcaster, BroadcastResult
+from bridge.coalescing import CoalescedMessage, Coalescer, create_burst_buffer
+from bridge.deadline import Deadline, DeadlineExceededError
+from bridge.prewarm import prewarm
+from bridge.profiling import profile_handler
+from bridge.providers import (
+    Providers,
+    create_message_provider,
+    delivery_report,
+)
+from bridge.repository import (
+    create_broadcast_repository,
+    create_state_repository,
+    create_subscription_repository,
+)
 
 
 app = create_app()
 log = logging.getLogger(__name__)
 telegram_provider = create_message_provider(app.config, Providers.TELEGRAM)
 twilio_provider = create_message_provider(app.config, Providers.TWILIO)
-repository = StateRepository(os.environ['state_dynamodb_table'])
+repository = create_state_repository(app.config)
+subscriptions = create_subscription_repository(app.config)
+broadcaster = Broadcaster(
+    telegram_provider,
+    create_broadcast_repository(app.config),
+    app.config.broadcast_checkpoint_size,
+    app.config.broadcast_max_attempts,
+)
+coalescer = Coalescer(
+    create_burst_buffer(app.config),
+    app.config.coalescing.window,
+    app.config.coalescing.stale_after,
+    app.config.coalescing.reserve,
+)
+prewarm_seconds: Optional[float] = None
+if app.config.prewarm.enabled:
+    prewarm_seconds = prewarm({
+        'telegram': telegram_provider.warm,
+        'state': repository.warm,
+        'subscriptions': subscriptions.warm,
+        'broadcasts': broadcaster.repository.warm,
+    }, app.config.prewarm.budget)
 
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    log.info(f'Received event: {event}')
-    message = twilio_provider.parse_message(event['body'])
-    message.text = f'Building: {message.source}\n\n{message.text}'
-    for number in repository.get_active_numbers():
-        message.destination = number
-        telegram_provider.send_message(message)
+def log_broadcast_result(result: BroadcastResult) -> None:
+    report = delivery_report(result.results)
+    log.info(
+        f'Broadcast {result.broadcast_id} delivered to '
+        f'{len(report["delivered"])}/{len(result.results)}'
+    )
+    if report['failed'] or report['not_attempted']:
+        log.error(f'Undelivered recipients: {report}')
+    if result.failed:
+        log.error(
+            f'Broadcast {result.broadcast_id} gave up on {result.failed} '
+            f'recipients'
+        )
+    if not result.complete:
+        log.error(
+            f'Broadcast {result.broadcast_id} has {result.pending} pending '
+            f'recipients, resume with {{"broadcast_id": '
+            f'"{result.broadcast_id}"}}'
+        )
+
+
+def resume_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """ Continues a broadcast, sending only to undelivered recipients. """
+    deadline = Deadline.from_context(context, app.config.deadline_margin)
+    result = broadcaster.resume(event['broadcast_id'], deadline)
+    log_broadcast_result(result)
 
     return {
-        'statusCode': 200,
+        'broadcast_id': result.broadcast_id,
+        'pending': result.pending,
+    }
+
+
+def store(coalesced: CoalescedMessage, deadline: Deadline) -> str:
+    """ Stores a broadcast of a message to active subscribers of its
+    building and returns its id.
+    """
+    message = coalesced.message
+    broadcast_id = message.message_id or str(uuid.uuid4())
+    text = f'Building: {message.source}\n\n{message.text}'
+    subscribers = subscriptions.get_subscribers(message.source, deadline)
+    numbers: List[str] = list(
+        repository.filter_active(subscribers, deadline))
+    broadcaster.store(
+        broadcast_id, message.source, text, numbers, deadline)
+    if coalesced.merged > 1:
+        log.info(
+            f'Merged {coalesced.merged} messages from {message.source}, '
+            f'avoided {coalesced.sends_avoided(len(numbers))} sends'
+        )
+    return broadcast_id
+
+
+def twiml_response(status: int) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
         'headers': {'Content-Type': 'text/html'},
         'isBase64Encoded': False,
         'body': '<Response></Response>',
     }
+
+
+@profile_handler(app.config)
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    log.info(f'Received event: {event}')
+    if 'broadcast_id' in event:
+        return resume_handler(event, context)
+
+    deadline = Deadline.from_context(context, app.config.deadline_margin)
+    message = twilio_provider.parse_message(event['body'])
+    try:
+        broadcast_ids = coalescer.submit(message, store, deadline)
+    except DeadlineExceededError:
+        # Nothing was stored and the message is still buffered, a failed
+        # response makes Twilio retry the webhook.
+        log.error('Deadline exceeded before the broadcast was stored')
+        return twiml_response(503)
+
+    for broadcast_id in broadcast_ids:
+        try:
+            log_broadcast_result(broadcaster.resume(broadcast_id, deadline))
+        except DeadlineExceededError:
+            log.error(
+                f'Deadline exceeded sending broadcast {broadcast_id}, '
+                f'resume with {{"broadcast_id": "{broadcast_id}"}}'
+            )
+
+    return twiml_response(200)
@@ -2,7 +2,6 @@
 import logging
 import os
 from enum import Enum
-from typing import Any, Dict
 
 from bridge.configuration import Configuration, load_config
 from bridge.logger import initialize_logger
@@ -28,8 +27,8 @@ class App:
         self._config = config
 
     @property
-    def config(self) -> Dict[str, Any]:
-        return self._config.config
+    def config(self) -> Configuration:
+        return self._config
 
     @property
     def environment(self) -> Environment:
@@ -44,7 +43,7 @@ def create_app() -> App:
 
     config_path = os.environ.get('bridge_config', None)
     config = load_config(config_path)
-    initialize_logger(config.config)
+    initialize_logger(config.logger_conf)
 
     app: App = App(config, app_env)
     log.info(f'initialized {app_env} environment')
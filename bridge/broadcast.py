@@ -0,0 +1,180 @@
+""" Resumable message broadcasts. """
+import logging
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from bridge.deadline import Deadline
+from bridge.providers import Message, MessageProvider, SendResult
+from bridge.repository import BroadcastRepository
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LEASE = 300.0
+
+Tally = Tuple[Set[str], Dict[str, int], Set[str]]
+
+
+class UnknownBroadcastError(KeyError):
+    """ Models an error for a broadcast missing from the repository. """
+
+
+class BroadcastResult():
+    """ Models an outcome of a single broadcast run. """
+
+    def __init__(
+            self,
+            broadcast_id: str,
+            results: List[SendResult],
+            pending: int,
+            failed: int = 0) -> None:
+        self.broadcast_id = broadcast_id
+        self.results = results
+        self.pending = pending
+        self.failed = failed
+
+    @property
+    def complete(self) -> bool:
+        return self.pending == 0
+
+    def __repr__(self):
+        return (
+            f'BroadcastResult(broadcast_id={self.broadcast_id}, '
+            f'sent={len(self.results)}, pending={self.pending}, '
+            f'failed={self.failed})'
+        )
+
+
+class Broadcaster():
+    """ Models a broadcast sender checkpointing its progress.
+
+    Each batch of recipients is leased before it is sent, so concurrent
+    runs of the same broadcast never send a batch twice. Recipients that
+    failed max_attempts sends are given up on.
+    """
+
+    def __init__(
+            self,
+            provider: MessageProvider,
+            repository: BroadcastRepository,
+            checkpoint_size: int = 50,
+            max_attempts: int = 3,
+            lease: float = DEFAULT_LEASE) -> None:
+        self.provider = provider
+        self.repository = repository
+        self.checkpoint_size = checkpoint_size
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+    def store(
+            self,
+            broadcast_id: str,
+            source: str,
+            text: str,
+            recipients: Iterable[str],
+            deadline: Optional[Deadline] = None) -> bool:
+        """ Stores a broadcast, returns False if it already exists. """
+        created = self.repository.create(
+            broadcast_id, source, text, recipients,
+            self.checkpoint_size, deadline)
+        if not created:
+            log.info(f'broadcast {broadcast_id} already exists')
+        return created
+
+    def start(
+            self,
+            broadcast_id: str,
+            source: str,
+            text: str,
+            recipients: Iterable[str],
+            deadline: Optional[Deadline] = None) -> BroadcastResult:
+        """ Stores and runs a broadcast, resuming it if it already exists. """
+        deadline = deadline or Deadline()
+        self.store(broadcast_id, source, text, recipients, deadline)
+        return self.resume(broadcast_id, deadline)
+
+    def lease_seconds(self, deadline: Deadline) -> float:
+        """ Returns a lease outlasting all sends started before deadline. """
+        remaining = deadline.remaining()
+        if remaining is None:
+            return self.lease
+        return remaining + deadline.margin
+
+    def resume(
+            self,
+            broadcast_id: str,
+            deadline: Optional[Deadline] = None) -> BroadcastResult:
+        """ Sends a broadcast to its recipients not yet delivered to. """
+        deadline = deadline or Deadline()
+        broadcast = self.repository.get(broadcast_id, deadline)
+        if broadcast is None:
+            raise UnknownBroadcastError(broadcast_id)
+
+        batches: List[Dict[str, Any]] = [
+            batch for batch in broadcast['batches'] if batch['pending']]
+        log.info(
+            f'broadcast {broadcast_id} has '
+            f'{sum(len(batch["pending"]) for batch in batches)} pending '
+            f'recipients in {len(batches)} batches'
+        )
+        prepared = self.provider.prepare(Message(
+            source=broadcast['source'],
+            destination='',
+            text=broadcast['text'],
+            media=[],
+        ))
+        owner = uuid.uuid4().hex
+        results: List[SendResult] = []
+        pending = 0
+        failed = 0
+        for batch in batches:
+            claimed = None
+            if not deadline.expired:
+                claimed = self.repository.claim(
+                    broadcast_id, batch['index'], owner,
+                    self.lease_seconds(deadline), deadline)
+            if claimed is None:
+                if not deadline.expired:
+                    log.info(
+                        f'batch {batch["index"]} of broadcast '
+                        f'{broadcast_id} is leased by another sender')
+                pending += len(batch['pending'])
+                continue
+
+            numbers = sorted(claimed['pending'])
+            batch_results = self.provider.send_many(
+                [prepared.to(number) for number in numbers], deadline)
+            results.extend(batch_results)
+            delivered, attempts, exhausted = self.tally(
+                batch_results, claimed['attempts'])
+            self.repository.complete(
+                broadcast_id, batch['index'], owner,
+                delivered, attempts, exhausted)
+            if exhausted:
+                log.error(
+                    f'broadcast {broadcast_id} gave up on {sorted(exhausted)}'
+                    f' after {self.max_attempts} attempts')
+            pending += len(numbers) - len(delivered) - len(exhausted)
+            failed += len(exhausted)
+
+        return BroadcastResult(broadcast_id, results, pending, failed)
+
+    def tally(
+            self,
+            results: List[SendResult],
+            attempts: Dict[str, int]) -> Tally:
+        """ Splits results into delivered, retried and given up numbers. """
+        delivered: Set[str] = set()
+        counts: Dict[str, int] = {}
+        exhausted: Set[str] = set()
+        for result in results:
+            number = result.message.destination
+            if result.delivered:
+                delivered.add(number)
+            elif result.attempted:
+                count = attempts.get(number, 0) + 1
+                if count >= self.max_attempts:
+                    exhausted.add(number)
+                else:
+                    counts[number] = count
+        return delivered, counts, exhausted
@@ -0,0 +1,428 @@
+""" Coalescing of message bursts from the same source.
+
+The first message of a source opens a window and its sender becomes the
+leader. Messages arriving within the window are appended to a short-lived
+buffer by followers, which return without sending anything. When the
+window closes the leader reads the buffer, stores a single merged message
+and only then releases the entries it read. Entries appended meanwhile are
+merged next by the same leader, and a message arriving after the buffer
+was emptied opens the next window, so none is lost or sent twice. If
+storing fails the entries are kept and the window is reopened, so the next
+message, e.g. a webhook retry, leads it again.
+"""
+import json
+import logging
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError  # type: ignore
+
+from bridge.deadline import Deadline
+from bridge.dynamodb_service import create_dynamodb_service
+from bridge.providers import Message
+from bridge.repository import SQLiteRepository, check_backend, dynamodb_table
+
+
+if TYPE_CHECKING:
+    from bridge.configuration import Configuration
+
+
+log = logging.getLogger(__name__)
+
+BURST_KEY_PREFIX = 'burst#'
+
+Entry = Dict[str, Any]
+
+
+class BurstBuffer(metaclass=ABCMeta):
+    """ Models a buffer of messages waiting for their window to close. """
+
+    @abstractmethod
+    def append(
+            self,
+            source: str,
+            entry: Entry,
+            deadline: Optional[Deadline] = None) -> Optional[float]:
+        """ Appends an entry, returns a start of an already open window. """
+
+    @abstractmethod
+    def peek(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> List[Entry]:
+        """ Returns all buffered entries of the source. """
+
+    @abstractmethod
+    def release(
+            self,
+            source: str,
+            count: int,
+            deadline: Optional[Deadline] = None) -> None:
+        """ Removes the first count entries, and the buffer once empty. """
+
+    @abstractmethod
+    def reopen(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> None:
+        """ Keeps the entries but lets the next append lead the window. """
+
+
+class MemoryBurstBuffer(BurstBuffer):
+    """ Models an in process buffer, shared by threads of one server. """
+
+    def __init__(self) -> None:
+        self._buffers: Dict[str, Tuple[Optional[float], List[Entry]]] = {}
+        self._lock = threading.Lock()
+
+    def append(
+            self,
+            source: str,
+            entry: Entry,
+            deadline: Optional[Deadline] = None) -> Optional[float]:
+        with self._lock:
+            started_at, entries = self._buffers.get(source, (None, []))
+            self._buffers[source] = (
+                time.time() if started_at is None else started_at,
+                entries + [entry],
+            )
+        return started_at
+
+    def peek(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> List[Entry]:
+        with self._lock:
+            _, entries = self._buffers.get(source, (None, []))
+        return list(entries)
+
+    def release(
+            self,
+            source: str,
+            count: int,
+            deadline: Optional[Deadline] = None) -> None:
+        with self._lock:
+            started_at, entries = self._buffers.get(source, (None, []))
+            if len(entries) > count:
+                self._buffers[source] = (started_at, entries[count:])
+            else:
+                self._buffers.pop(source, None)
+
+    def reopen(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> None:
+        with self._lock:
+            if source in self._buffers:
+                self._buffers[source] = (None, self._buffers[source][1])
+
+
+class DynamoDBBurstBuffer(BurstBuffer):
+    """ Models a buffer stored in the broadcast table.
+
+    Appends and releases are single item writes, so they are atomic
+    against each other across all concurrent invocations.
+    """
+
+    def __init__(
+            self,
+            table_name: str,
+            ttl: int = 3600,
+            implementation: str = 'resource') -> None:
+        self.table_name = table_name
+        self.ttl = ttl
+        self.dynamodb = create_dynamodb_service(
+            self.table_name, implementation)
+
+    def key(self, source: str) -> Dict[str, str]:
+        return {'broadcast_id': f'{BURST_KEY_PREFIX}{source}'}
+
+    def append(
+            self,
+            source: str,
+            entry: Entry,
+            deadline: Optional[Deadline] = None) -> Optional[float]:
+        now = time.time()
+        response = self.dynamodb.update_item(
+            deadline=deadline,
+            Key=self.key(source),
+            UpdateExpression=(
+                'SET entries = list_append('
+                'if_not_exists(entries, :empty), :entry), '
+                'started_at = if_not_exists(started_at, :now), '
+                'expires_at = :expires_at'
+            ),
+            ExpressionAttributeValues={
+                ':empty': [],
+                ':entry': [entry],
+                ':now': str(now),
+                ':expires_at': int(now) + self.ttl,
+            },
+            ReturnValues='UPDATED_OLD',
+        )
+        started_at = response.get('Attributes', {}).get('started_at')
+        return None if started_at is None else float(started_at)
+
+    def peek(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> List[Entry]:
+        item = self.dynamodb.get_item(
+            deadline=deadline,
+            Key=self.key(source),
+            ConsistentRead=True,
+        )
+        return list((item or {}).get('entries', []))
+
+    def release(
+            self,
+            source: str,
+            count: int,
+            deadline: Optional[Deadline] = None) -> None:
+        """ Deletes the buffer, or only the released entries if more were
+        appended since they were read.
+        """
+        try:
+            self.dynamodb.delete_item(
+                deadline=deadline,
+                Key=self.key(source),
+                ConditionExpression='size(#entries) <= :n',
+                ExpressionAttributeNames={'#entries': 'entries'},
+                ExpressionAttributeValues={':n': count},
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != \
+                    'ConditionalCheckFailedException':
+                raise
+
+        self.dynamodb.update_item(
+            deadline=deadline,
+            Key=self.key(source),
+            UpdateExpression='REMOVE ' + ', '.join(
+                f'entries[{i}]' for i in range(count)),
+        )
+
+    def reopen(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> None:
+        try:
+            self.dynamodb.update_item(
+                deadline=deadline,
+                Key=self.key(source),
+                UpdateExpression='REMOVE started_at',
+                ConditionExpression='attribute_exists(broadcast_id)',
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != \
+                    'ConditionalCheckFailedException':
+                raise
+
+
+class SQLiteBurstBuffer(SQLiteRepository, BurstBuffer):
+    """ Models a buffer in a SQLite database, shared by server processes. """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS burst ('
+        'source TEXT PRIMARY KEY, '
+        'started_at REAL'
+        ')',
+        'CREATE TABLE IF NOT EXISTS burst_entry ('
+        'source TEXT NOT NULL, '
+        'seq INTEGER NOT NULL, '
+        'entry TEXT NOT NULL, '
+        'PRIMARY KEY (source, seq)'
+        ') WITHOUT ROWID',
+    )
+
+    def append(
+            self,
+            source: str,
+            entry: Entry,
+            deadline: Optional[Deadline] = None) -> Optional[float]:
+        if deadline:
+            deadline.check()
+        with self.connection as connection:
+            # The insert takes the write lock before the window is read
+            connection.execute(
+                'INSERT OR IGNORE INTO burst (source) VALUES (?)', (source,))
+            started_at, = connection.execute(
+                'SELECT started_at FROM burst WHERE source = ?', (source,),
+            ).fetchone()
+            if started_at is None:
+                connection.execute(
+                    'UPDATE burst SET started_at = ? WHERE source = ?',
+                    (time.time(), source),
+                )
+            connection.execute(
+                'INSERT INTO burst_entry (source, seq, entry) '
+                'SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM burst_entry '
+                'WHERE source = ?',
+                (source, json.dumps(entry), source),
+            )
+        return started_at
+
+    def peek(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> List[Entry]:
+        if deadline:
+            deadline.check()
+        rows = self.connection.execute(
+            'SELECT entry FROM burst_entry WHERE source = ? ORDER BY seq',
+            (source,),
+        )
+        return [json.loads(entry) for entry, in rows]
+
+    def release(
+            self,
+            source: str,
+            count: int,
+            deadline: Optional[Deadline] = None) -> None:
+        with self.connection as connection:
+            connection.execute(
+                'DELETE FROM burst_entry WHERE source = ? AND seq IN ('
+                'SELECT seq FROM burst_entry WHERE source = ? '
+                'ORDER BY seq LIMIT ?)',
+                (source, source, count),
+            )
+            connection.execute(
+                'DELETE FROM burst WHERE source = ? AND NOT EXISTS ('
+                'SELECT 1 FROM burst_entry WHERE source = ?)',
+                (source, source),
+            )
+
+    def reopen(
+            self,
+            source: str,
+            deadline: Optional[Deadline] = None) -> None:
+        with self.connection as connection:
+            connection.execute(
+                'UPDATE burst SET started_at = NULL WHERE source = ?',
+                (source,),
+            )
+
+
+class CoalescedMessage():
+    """ Models a message merged from a burst. """
+
+    def __init__(self, message: Message, merged: int) -> None:
+        self.message = message
+        self.merged = merged
+
+    def sends_avoided(self, recipients: int) -> int:
+        """ Returns a number of sends saved by merging for the recipients. """
+        return (self.merged - 1) * recipients
+
+
+Store = Callable[[CoalescedMessage, Deadline], str]
+
+
+class Coalescer():
+    """ Models a leader and follower protocol merging message bursts.
+
+    A window of zero disables coalescing and passes every message through.
+    A window left open for stale_after seconds is considered abandoned by
+    a failed leader and is taken over by the next message. The leader
+    waits for the window to close but leaves at least reserve seconds of
+    its budget for storing the merged message.
+    """
+
+    def __init__(
+            self,
+            buffer: BurstBuffer,
+            window: float,
+            stale_after: float = 60.0,
+            reserve: float = 3.0) -> None:
+        self.buffer = buffer
+        self.window = window
+        self.stale_after = stale_after
+        self.reserve = reserve
+
+    def submit(
+            self,
+            message: Message,
+            store: Store,
+            deadline: Optional[Deadline] = None) -> List[str]:
+        """ Stores merged messages this message leads.
+
+        Returns the values store returned, none if another message leads
+        the window. Entries are released only after store returned for
+        them, if it raises they stay buffered and the window is reopened.
+        """
+        deadline = deadline or Deadline()
+        if self.window <= 0:
+            return [store(CoalescedMessage(message, 1), deadline)]
+
+        started_at = self.buffer.append(message.source, {
+            'message_id': message.message_id or '',
+            'text': message.text,
+            'media': list(message.media),
+        }, deadline)
+        if started_at is not None \
+                and time.time() - started_at < self.stale_after:
+            log.info(f'buffered message from {message.source}')
+            return []
+
+        remaining = deadline.remaining()
+        time.sleep(max(0.0, min(
+            self.window,
+            self.window if remaining is None else remaining - self.reserve,
+        )))
+        ret: List[str] = []
+        try:
+            while True:
+                entries = self.buffer.peek(message.source, deadline)
+                if not entries:
+                    return ret
+                ret.append(store(self.merge(message, entries), deadline))
+                self.buffer.release(message.source, len(entries))
+        except Exception:
+            self.buffer.reopen(message.source)
+            raise
+
+    def merge(
+            self,
+            message: Message,
+            entries: List[Entry]) -> CoalescedMessage:
+        """ Returns one message of unique entries.
+
+        The merged message id derives from the entries, so merging the same
+        entries again yields the same id.
+        """
+        unique: Dict[str, Entry] = {}
+        for i, entry in enumerate(entries):
+            unique.setdefault(entry['message_id'] or str(i), entry)
+        log.info(
+            f'merged {len(unique)} messages from {message.source}')
+        first_id = entries[0]['message_id'] or None
+        if first_id and len(unique) > 1:
+            first_id = f'{first_id}+{len(unique)}'
+
+        return CoalescedMessage(Message(
+            source=message.source,
+            destination=message.destination,
+            text='\n\n'.join(entry['text'] for entry in unique.values()),
+            media=[
+                media for entry in unique.values() for media in entry['media']
+            ],
+            message_id=first_id,
+        ), len(unique))
+
+
+def create_burst_buffer(config: 'Configuration') -> BurstBuffer:
+    """ Returns the configured buffer, by default of the storage backend. """
+    name = config.coalescing.buffer or check_backend(config)
+    if name == 'dynamodb':
+        return DynamoDBBurstBuffer(
+            dynamodb_table('broadcast'),
+            implementation=config.dynamodb.implementation,
+        )
+    elif name == 'sqlite':
+        return SQLiteBurstBuffer(config.storage.sqlite_path)
+    elif name == 'memory':
+        return MemoryBurstBuffer()
+    else:
+        raise ValueError(f'Unknown burst buffer: {name}')
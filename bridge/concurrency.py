@@ -0,0 +1,138 @@
+""" Adaptive concurrency limits of outbound provider calls. """
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Dict, Optional
+
+from bridge.configuration import ConcurrencyConfig
+from bridge.deadline import Deadline
+
+
+log = logging.getLogger(__name__)
+
+
+class Outcome(Enum):
+    """ Models what a finished call says about provider capacity. """
+    SUCCESS = 'success'
+    THROTTLED = 'throttled'
+    FAILED = 'failed'
+    IGNORED = 'ignored'
+
+
+class AdaptiveLimiter():
+    """ Models an AIMD limit of calls in flight to a provider.
+
+    Every successful call within the latency target raises the limit by
+    one per limit calls, so by about one per round of calls. A throttled
+    or failed call, or one slower than the target, cuts the limit by the
+    backoff factor. Calls started before the last cut do not cut it again,
+    a burst of failures from one round counts once. Calls failing for
+    reasons unrelated to load leave the limit as is.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            max_limit: int,
+            initial_limit: int = 4,
+            min_limit: int = 1,
+            backoff: float = 0.5,
+            latency_target: float = 0.0) -> None:
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(
+            max(self.min_limit, min(initial_limit, self.max_limit)))
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.backed_off_at = 0.0
+        self.counters: Dict[str, int] = {
+            'success': 0,
+            'throttled': 0,
+            'failed': 0,
+            'slow': 0,
+            'increases': 0,
+            'decreases': 0,
+        }
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline: Deadline) -> bool:
+        """ Waits for a free slot, False if the deadline is reached first. """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline.remaining()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def release(self, started: float, outcome: Outcome) -> None:
+        """ Frees the slot of a call started at a monotonic time. """
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            reason: Optional[str] = None
+            if outcome in (Outcome.THROTTLED, Outcome.FAILED):
+                reason = outcome.value
+            elif outcome is Outcome.SUCCESS and self.latency_target \
+                    and now - started > self.latency_target:
+                reason = 'slow'
+            if outcome is not Outcome.IGNORED:
+                self.counters[reason or outcome.value] += 1
+
+            if reason and started >= self.backed_off_at:
+                self._decrease(now, reason)
+            elif outcome is Outcome.SUCCESS and not reason:
+                self._increase()
+            self._condition.notify_all()
+
+    def _decrease(self, now: float, reason: str) -> None:
+        old = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self.backed_off_at = now
+        self.counters['decreases'] += 1
+        log.info(
+            f'{self.name} concurrency limit {old} -> {int(self.limit)}, '
+            f'{reason}')
+
+    def _increase(self) -> None:
+        if self.limit >= self.max_limit:
+            return
+        old = int(self.limit)
+        self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        if int(self.limit) > old:
+            self.counters['increases'] += 1
+            log.debug(
+                f'{self.name} concurrency limit {old} -> {int(self.limit)}')
+
+    def metrics(self) -> Dict[str, int]:
+        """ Returns the limit, calls in flight and decision counts. """
+        with self._condition:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                **self.counters,
+            }
+
+
+def create_limiter(
+        config: ConcurrencyConfig,
+        name: str,
+        max_limit: int) -> Optional[AdaptiveLimiter]:
+    """ Returns a limiter of a provider, None for fixed concurrency. """
+    if not config.adaptive:
+        return None
+    return AdaptiveLimiter(
+        name,
+        max_limit,
+        initial_limit=config.initial_limit,
+        min_limit=config.min_limit,
+        backoff=config.backoff,
+        latency_target=config.latency_target,
+    )
@@ -1,83 +1,410 @@
 """ Setups an application configuration. """
+import collections.abc
 import json
 import logging
+import math
 import os
-from typing import Any, Dict, Optional
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
+from bridge.fileio.path import PathType, SSMPath, get_path_type
 from bridge.fileio.retrieval import get_retrieval_factory
+from bridge.ssm_service import ParameterNotFoundError, create_ssm_service
 
 
 log = logging.getLogger(__name__)
 
-_DEFAULTS = {
-    'logger_conf': [
-        {
-            'level': 'DEBUG',
-            'handler': 'stdout',
-            'formatter': (
-                '%(process)d %(threadName)-10s %(asctime)s'
-                ' %(levelname)-7s: %(message)s '
-            ),
-        },
-    ],
-    'message_providers': {
-        'telegram': {
-            'token': '',
-            'base_url': 'https://api.telegram.org/bot{}',
-        },
-        'twilio': {
-            'sid': '',
-            'token': '',
-            'number': '',
-        },
+
+class ConfigurationError(ValueError):
+    """ Models an error for an invalid configuration. """
+
+
+class LoggerConfig(NamedTuple):
+    """ Models a single logging handler configuration. """
+    level: str = 'DEBUG'
+    handler: str = 'stdout'
+    formatter: str = (
+        '%(process)d %(threadName)-10s %(asctime)s'
+        ' %(levelname)-7s: %(message)s '
+    )
+
+
+class ConcurrencyConfig(NamedTuple):
+    """ Models an adaptive concurrency configuration of a provider. """
+    adaptive: bool = False
+    initial_limit: int = 4
+    min_limit: int = 1
+    backoff: float = 0.5
+    latency_target: float = 0.0
+
+
+class TelegramConfig(NamedTuple):
+    """ Models a Telegram provider configuration. """
+    token: str = ''
+    base_url: str = 'https://api.telegram.org/bot{}'
+    file_base_url: str = 'https://api.telegram.org/file/bot{}'
+    max_workers: int = 10
+    timeout: float = 10.0
+    inline_reply: bool = True
+    file_cache_ttl: float = 3000.0
+    media_output: str = ''
+    media_url_ttl: int = 900
+    concurrency: ConcurrencyConfig = ConcurrencyConfig()
+    bot_url: str = ''
+    send_message_url: str = ''
+    file_url: str = ''
+
+    def derive(self) -> 'TelegramConfig':
+        bot_url = self.base_url.format(self.token)
+        return self._replace(
+            bot_url=bot_url,
+            send_message_url=f'{bot_url}/sendMessage',
+            file_url=self.file_base_url.format(self.token),
+        )
+
+
+# Fields computed by derive() that may not be set in a configuration file
+DERIVED_FIELDS: Dict[Any, Tuple[str, ...]] = {
+    TelegramConfig: ('bot_url', 'send_message_url', 'file_url'),
+}
+
+
+class TwilioConfig(NamedTuple):
+    """ Models a Twilio provider configuration. """
+    sid: str = ''
+    token: str = ''
+    number: str = ''
+    messaging_service_sid: str = ''
+    max_workers: int = 10
+    timeout: float = 10.0
+    concurrency: ConcurrencyConfig = ConcurrencyConfig()
+
+
+class SSMConfig(NamedTuple):
+    """ Models a SSM Parameter Store source configuration. """
+    endpoint_url: str = ''
+    cache_ttl: float = 300.0
+
+
+class PrewarmConfig(NamedTuple):
+    """ Models an init phase connection pre-warming configuration. """
+    enabled: bool = False
+    budget: float = 1.0
+
+
+class CoalescingConfig(NamedTuple):
+    """ Models a configuration of merging bursts of messages. """
+    window: float = 0.0
+    buffer: str = ''
+    stale_after: float = 60.0
+    reserve: float = 3.0
+
+
+class ProfilingConfig(NamedTuple):
+    """ Models a sampling profiler configuration. """
+    sample_rate: float = 0.0
+    output: str = ''
+
+
+class DispatchConfig(NamedTuple):
+    """ Models who may send SMS to buildings and to how many at once. """
+    admin_chat_ids: Tuple[str, ...] = ()
+    max_recipients: int = 20
+
+
+class DynamoDBConfig(NamedTuple):
+    """ Models a DynamoDB access configuration. """
+    implementation: str = 'resource'
+
+
+class StorageConfig(NamedTuple):
+    """ Models a storage configuration of all repositories. """
+    backend: str = 'dynamodb'
+    sqlite_path: str = 'bridge.db'
+
+
+class MessageProvidersConfig(NamedTuple):
+    """ Models message providers configuration. """
+    telegram: TelegramConfig = TelegramConfig().derive()
+    twilio: TwilioConfig = TwilioConfig()
+
+
+class Configuration(NamedTuple):
+    """ Models an immutable application configuration. """
+    logger_conf: Tuple[LoggerConfig, ...] = (LoggerConfig(),)
+    message_providers: MessageProvidersConfig = MessageProvidersConfig()
+    deadline_margin: float = 2.0
+    broadcast_checkpoint_size: int = 50
+    broadcast_max_attempts: int = 3
+    ssm: SSMConfig = SSMConfig()
+    prewarm: PrewarmConfig = PrewarmConfig()
+    coalescing: CoalescingConfig = CoalescingConfig()
+    building_groups: Mapping[str, Tuple[str, ...]] = MappingProxyType({})
+    dispatch: DispatchConfig = DispatchConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
+    dynamodb: DynamoDBConfig = DynamoDBConfig()
+    storage: StorageConfig = StorageConfig()
+
+
+STORAGE_BACKENDS = ('dynamodb', 'sqlite')
+DYNAMODB_IMPLEMENTATIONS = ('resource', 'client')
+
+Check = Callable[[Any], Optional[str]]
+
+
+def in_range(
+        low: float,
+        high: float = math.inf,
+        include_low: bool = True) -> Check:
+    """ Returns a check of a number lying between low and high. """
+    def check(value: Any) -> Optional[str]:
+        if (value >= low if include_low else value > low) and value <= high:
+            return None
+        bounds = f'{"[" if include_low else "("}{low}, {high}]'
+        return f'expected a value in {bounds}, got {value}'
+    return check
+
+
+def one_of(*choices: str) -> Check:
+    """ Returns a check of a value being one of the choices. """
+    def check(value: Any) -> Optional[str]:
+        if value in choices:
+            return None
+        return f'expected one of {list(choices)}, got {value!r}'
+    return check
+
+
+POSITIVE = in_range(0, include_low=False)
+NON_NEGATIVE = in_range(0)
+AT_LEAST_ONE = in_range(1)
+
+# Checks of field values beyond their types, run when a section is parsed
+FIELD_CHECKS: Dict[Any, Dict[str, Check]] = {
+    LoggerConfig: {
+        'level': one_of(
+            'CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'NOTSET'),
+        'handler': one_of('stdout'),
+    },
+    ConcurrencyConfig: {
+        'initial_limit': AT_LEAST_ONE,
+        'min_limit': AT_LEAST_ONE,
+        'backoff': in_range(0, 1, include_low=False),
+        'latency_target': NON_NEGATIVE,
+    },
+    TelegramConfig: {
+        'max_workers': AT_LEAST_ONE,
+        'timeout': POSITIVE,
+        'file_cache_ttl': NON_NEGATIVE,
+        # Presigned URLs are valid for at most seven days
+        'media_url_ttl': in_range(1, 7 * 24 * 3600),
+    },
+    TwilioConfig: {
+        'max_workers': AT_LEAST_ONE,
+        'timeout': POSITIVE,
+    },
+    SSMConfig: {
+        'cache_ttl': NON_NEGATIVE,
+    },
+    PrewarmConfig: {
+        'budget': POSITIVE,
+    },
+    CoalescingConfig: {
+        'window': NON_NEGATIVE,
+        'buffer': one_of('', 'memory', *STORAGE_BACKENDS),
+        'stale_after': POSITIVE,
+        'reserve': NON_NEGATIVE,
+    },
+    ProfilingConfig: {
+        'sample_rate': in_range(0, 1),
+    },
+    DispatchConfig: {
+        'max_recipients': AT_LEAST_ONE,
+    },
+    DynamoDBConfig: {
+        'implementation': one_of(*DYNAMODB_IMPLEMENTATIONS),
+    },
+    StorageConfig: {
+        'backend': one_of(*STORAGE_BACKENDS),
+    },
+    Configuration: {
+        'deadline_margin': NON_NEGATIVE,
+        'broadcast_checkpoint_size': AT_LEAST_ONE,
+        'broadcast_max_attempts': AT_LEAST_ONE,
     },
 }
-_CURRENT_DIR_PATH = os.path.abspath(os.path.dirname(__file__))
 
 
-class Configuration:
-    """ Models an application configuration from input dictionary. """
+def _convert(field_type: Any, value: Any, path: str) -> Any:
+    """ Validates a value against a field type and converts it. """
+    origin = getattr(field_type, '__origin__', None)
+    if hasattr(field_type, '_fields'):
+        return parse_section(field_type, value, path)
+    if origin in (tuple, Tuple):
+        if not isinstance(value, list):
+            raise ConfigurationError(f'{path}: expected a list')
+        item_type = field_type.__args__[0]
+        return tuple(
+            _convert(item_type, item, f'{path}[{i}]')
+            for i, item in enumerate(value)
+        )
+    if origin in (dict, Dict, Mapping, collections.abc.Mapping):
+        if not isinstance(value, dict):
+            raise ConfigurationError(f'{path}: expected a mapping')
+        item_type = field_type.__args__[1]
+        return MappingProxyType({
+            str(key): _convert(item_type, item, f'{path}.{key}')
+            for key, item in value.items()
+        })
+    if field_type is float and isinstance(value, int) \
+            and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, field_type) or (
+            isinstance(value, bool) and field_type is not bool):
+        raise ConfigurationError(
+            f'{path}: expected {field_type.__name__}, '
+            f'got {type(value).__name__}')
+    return value
+
+
+def parse_section(section_type: Any, data: Any, path: str = '') -> Any:
+    """ Builds a configuration section, using defaults for missing keys. """
+    if not isinstance(data, dict):
+        raise ConfigurationError(f'{path or "config"}: expected a mapping')
+
+    derived = DERIVED_FIELDS.get(section_type, ())
+    unknown = (set(data) - set(section_type._fields)) | (
+        set(data) & set(derived))
+    if unknown:
+        raise ConfigurationError(
+            f'{path or "config"}: unknown keys {sorted(unknown)}')
+
+    types = section_type.__annotations__
+    checks = FIELD_CHECKS.get(section_type, {})
+    values: Dict[str, Any] = {}
+    for name in section_type._fields:
+        if name not in data:
+            continue
+        field_path = f'{path}.{name}' if path else name
+        values[name] = _convert(types[name], data[name], field_path)
+        error = checks[name](values[name]) if name in checks else None
+        if error:
+            raise ConfigurationError(f'{field_path}: {error}')
+    ret = section_type(**values)
+    if derived:
+        ret = ret.derive()
+    return ret
+
+
+def _find_references(data: Any) -> Iterable[str]:
+    if isinstance(data, dict):
+        data = list(data.values())
+    if isinstance(data, list):
+        for item in data:
+            yield from _find_references(item)
+    elif isinstance(data, str) and data.startswith('ssm://'):
+        yield data
+
 
-    def __init__(self, init_config: Dict[str, Any]) -> None:
-        self._init_conf = dict(init_config)
-        self.config = dict(self._init_conf)
+def _replace_references(data: Any, values: Dict[str, str]) -> Any:
+    if isinstance(data, dict):
+        return {
+            key: _replace_references(item, values)
+            for key, item in data.items()
+        }
+    if isinstance(data, list):
+        return [_replace_references(item, values) for item in data]
+    if isinstance(data, str) and data in values:
+        return values[data]
+    return data
 
-    @property
-    def config(self) -> Dict[str, Any]:
-        return self._config
 
-    @config.setter
-    def config(self, new_config: Dict[str, Any]) -> None:
-        """ Reloads configuration dictionary. """
-        if new_config:
-            self._config = dict(new_config)
-            log.info('configuration successfully updated')
-        else:
-            raise ValueError('unable to set empty configuration')
+def resolve_references(data: Dict[str, Any]) -> Dict[str, Any]:
+    """ Replaces ``ssm://`` references with parameter values.
 
-    def reset(self) -> None:
-        """ Resets configuration to default. """
-        self.config = dict(self._init_conf)
+    All referenced parameters are fetched in as few GetParameters calls as
+    possible and cached in process.
+    """
+    references = [
+        reference for reference in _find_references(data)
+        if get_path_type(reference) == PathType.ssm
+    ]
+    if not references or not isinstance(data, dict):
+        return data
 
-    def update_from_json(self, json_path: str) -> None:
-        """ Reloads configuration from input json file. """
-        if not os.path.exists(json_path) and not os.path.isfile(json_path):
-            raise Exception(f'unable to load conf path {json_path}')
-        with open(json_path) as f:
-            self.config = json.load(f)
+    ssm_service = create_ssm_service(
+        parse_section(SSMConfig, data.get('ssm', {}), 'ssm'))
+    names = {reference: SSMPath(reference).name for reference in references}
+    try:
+        parameters = ssm_service.get_parameters(names.values())
+    except ParameterNotFoundError as e:
+        raise ConfigurationError(str(e))
+    return _replace_references(data, {
+        reference: parameters[name] for reference, name in names.items()
+    })
+
+
+def parse_config(data: Dict[str, Any]) -> Configuration:
+    """ Validates a configuration dictionary and returns its model. """
+    return parse_section(Configuration, data)
 
 
 def default_config() -> Configuration:
     """ Returns default configuration. """
-    return Configuration(_DEFAULTS)
+    return Configuration()
+
+
+def read_json(json_path: str) -> Dict[str, Any]:
+    """ Reads a configuration document from a local json file. """
+    if not os.path.exists(json_path) and not os.path.isfile(json_path):
+        raise ConfigurationError(f'unable to load conf path {json_path}')
+    with open(json_path) as f:
+        try:
+            data = json.load(f)
+        except json.decoder.JSONDecodeError as e:
+            raise ConfigurationError(f'{json_path}: invalid JSON, {e}')
+    if not isinstance(data, dict):
+        raise ConfigurationError(f'{json_path}: expected a mapping')
+    return data
+
+
+def merge_documents(
+        base: Dict[str, Any],
+        overlay: Dict[str, Any]) -> Dict[str, Any]:
+    """ Returns base updated by overlay, merging nested mappings. """
+    ret = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(ret.get(key), dict):
+            value = merge_documents(ret[key], value)
+        ret[key] = value
+    return ret
 
 
 def load_config(config_path: Optional[str]) -> Configuration:
-    """ Loads configuration from path. """
+    """ Loads configuration from a path or comma separated paths.
+
+    Several documents, e.g. a base file and an allow-list kept in SSM, are
+    fetched concurrently and merged in the given order, later documents
+    overriding keys of earlier ones.
+    """
     ret = default_config()
-    retrieval_factory = get_retrieval_factory(ret.config)
-    if config_path:
-        with retrieval_factory.get_retrieval(
-                config_path).retrieve(config_path) as downloaded_conf:
-            ret.update_from_json(downloaded_conf)
+    paths = [
+        path.strip() for path in (config_path or '').split(',')
+        if path.strip()
+    ]
+    if paths:
+        with get_retrieval_factory(ret).retrieve_many(paths) as downloaded:
+            data: Dict[str, Any] = {}
+            for path in paths:
+                data = merge_documents(data, read_json(downloaded[path]))
+        ret = parse_config(resolve_references(data))
+        log.info('configuration successfully loaded')
     return ret
@@ -0,0 +1,59 @@
+""" Invocation time budget tracking. """
+import logging
+import time
+from typing import Any, Optional
+
+
+log = logging.getLogger(__name__)
+
+
+class DeadlineExceededError(Exception):
+    """ Models an error for work started after the deadline. """
+
+
+class Deadline:
+    """ Models a point in time by which an invocation has to finish. """
+
+    def __init__(
+            self,
+            expires_at: Optional[float] = None,
+            margin: float = 0.0) -> None:
+        self.expires_at = expires_at
+        self.margin = margin
+
+    @classmethod
+    def from_context(cls, context: Any, margin: float) -> 'Deadline':
+        """ Creates a deadline from a Lambda context remaining time. """
+        get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        if get_remaining is None:
+            return cls(margin=margin)
+
+        remaining: float = get_remaining() / 1000
+        log.debug(f'invocation has {remaining:.3f}s remaining')
+        return cls(time.monotonic() + remaining, margin)
+
+    def remaining(self) -> Optional[float]:
+        """ Returns seconds left before the safety margin is reached. """
+        if self.expires_at is None:
+            return None
+        return self.expires_at - self.margin - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self) -> None:
+        """ Raises an error if no time is left to start new work. """
+        if self.expired:
+            raise DeadlineExceededError('invocation deadline exceeded')
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """ Returns a call timeout bounded by the remaining budget. """
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if default is None:
+            return remaining
+        return min(default, remaining)
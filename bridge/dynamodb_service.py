@@ -1,31 +1,131 @@
 """ DynamoDB AWS service. """
 import logging
-from typing import Any, Dict, Iterable
+import threading
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 import boto3  # type: ignore
+from botocore.config import Config  # type: ignore
+
+from bridge.deadline import Deadline
 
 
 log = logging.getLogger(__name__)
 
+BATCH_GET_SIZE = 100
+CLIENT_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=5,
+    retries={'max_attempts': 3},
+)
+ENCODED_PARAMETERS = ('Item', 'Key', 'ExpressionAttributeValues')
+
+
+def encode_value(value: Any) -> Dict[str, Any]:
+    """ Returns a DynamoDB attribute value of a Python value. """
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (int, float, Decimal)):
+        return {'N': str(value)}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, (set, frozenset)):
+        if all(isinstance(item, str) for item in value):
+            return {'SS': list(value)}
+        return {'NS': [str(item) for item in value]}
+    if isinstance(value, (list, tuple)):
+        return {'L': [encode_value(item) for item in value]}
+    if isinstance(value, dict):
+        return {'M': encode_item(value)}
+    raise TypeError(f'unsupported DynamoDB type {type(value).__name__}')
+
+
+def decode_value(value: Dict[str, Any]) -> Any:
+    """ Returns a Python value of a DynamoDB attribute value. """
+    (kind, data), = value.items()
+    if kind == 'S' or kind == 'BOOL' or kind == 'B':
+        return data
+    if kind == 'N':
+        return Decimal(data)
+    if kind == 'NULL':
+        return None
+    if kind == 'SS' or kind == 'BS':
+        return set(data)
+    if kind == 'NS':
+        return set(Decimal(item) for item in data)
+    if kind == 'L':
+        return [decode_value(item) for item in data]
+    if kind == 'M':
+        return decode_item(data)
+    raise TypeError(f'unsupported DynamoDB type {kind}')
+
+
+def encode_item(item: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {name: encode_value(value) for name, value in item.items()}
+
+
+def decode_item(item: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return {name: decode_value(value) for name, value in item.items()}
+
 
 class DynamoDBService:
-    """ Models a DynamoDB AWS Service. """
+    """ Models a DynamoDB AWS Service.
+
+    boto3 resources are not thread-safe, so every thread, such as each
+    handler thread of server.py, uses a resource of its own. A resource
+    opened by warm() is handed to the first thread needing one, so the
+    pre-warmed connection is not lost to the warming thread.
+    """
 
     def __init__(self, table) -> None:
         self.table = table
-        self.session = boto3.Session()
+        self.local = threading.local()
+        self._lock = threading.Lock()
+        self._warmed: List[Any] = []
+
+    def _session(self):
+        # Sessions are not thread-safe to create concurrently either
+        with self._lock:
+            return boto3.Session()
+
+    def _resource(self):
+        return self._session().resource('dynamodb', config=CLIENT_CONFIG)
+
+    @property
+    def resource(self):
+        if not hasattr(self.local, 'resource'):
+            with self._lock:
+                resource = self._warmed.pop() if self._warmed else None
+            self.local.resource = resource or self._resource()
+            self.local.connection = self.local.resource.Table(self.table)
+        return self.local.resource
 
     @property
     def dynamodb_table(self):
-        if hasattr(self, 'connection'):
-            return self.connection
+        self.resource
+        return self.local.connection
 
-        self.connection = self.session.resource('dynamodb').Table(self.table)
-        return self.connection
+    def warm(self, key: Dict[str, Any]) -> None:
+        """ Opens a pooled connection with a read of the given key. """
+        resource = self._resource()
+        resource.Table(self.table).get_item(Key=key)
+        with self._lock:
+            self._warmed.append(resource)
 
-    def scan(self, **kwargs) -> Iterable[Dict[str, Any]]:
+    def _paginate(
+            self,
+            operation: Callable[..., Dict[str, Any]],
+            deadline: Optional[Deadline],
+            kwargs: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        """ Yields items of all pages, checking the deadline before each. """
         while True:
-            response = self.dynamodb_table.scan(**kwargs)
+            if deadline:
+                deadline.check()
+            response = operation(**kwargs)
             for item in response.get('Items', []):
                 yield item
 
@@ -34,5 +134,184 @@ class DynamoDBService:
             if kwargs['ExclusiveStartKey'] is None:
                 break
 
-    def put_item(self, **kwargs) -> Any:
+    def scan(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Iterable[Dict[str, Any]]:
+        return self._paginate(self.dynamodb_table.scan, deadline, kwargs)
+
+    def query(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Iterable[Dict[str, Any]]:
+        return self._paginate(self.dynamodb_table.query, deadline, kwargs)
+
+    def batch_get(
+            self,
+            keys: List[Dict[str, Any]],
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Iterable[Dict[str, Any]]:
+        """ Yields items for keys, fetching up to 100 keys per request. """
+        dynamodb_table = self.dynamodb_table
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            request: Dict[str, Any] = {
+                dynamodb_table.name: dict(
+                    kwargs, Keys=keys[start:start + BATCH_GET_SIZE]),
+            }
+            while request:
+                if deadline:
+                    deadline.check()
+                response = self.resource.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(
+                        dynamodb_table.name, []):
+                    yield item
+                request = response.get('UnprocessedKeys')
+
+    def put_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Any:
+        if deadline:
+            deadline.check()
         return self.dynamodb_table.put_item(**kwargs)
+
+    def get_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Optional[Dict[str, Any]]:
+        if deadline:
+            deadline.check()
+        return self.dynamodb_table.get_item(**kwargs).get('Item')
+
+    def update_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Any:
+        if deadline:
+            deadline.check()
+        return self.dynamodb_table.update_item(**kwargs)
+
+    def delete_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Any:
+        if deadline:
+            deadline.check()
+        return self.dynamodb_table.delete_item(**kwargs)
+
+
+class ClientDynamoDBService(DynamoDBService):
+    """ Models a DynamoDB service on the low level client.
+
+    Takes and returns the same plain Python values as the resource based
+    service, but encodes and decodes them by hand, skipping the resource
+    model and the boto3 type (de)serializers. Conditions have to be
+    passed as string expressions.
+    """
+
+    @property
+    def client(self):
+        # Clients are thread-safe, only their creation needs the lock
+        with self._lock:
+            if not hasattr(self, '_client'):
+                self._client = boto3.Session().client(
+                    'dynamodb', config=CLIENT_CONFIG)
+        return self._client
+
+    def _request(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        request = dict(kwargs, TableName=self.table)
+        for name in ENCODED_PARAMETERS:
+            if name in request:
+                request[name] = encode_item(request[name])
+        return request
+
+    def _call(self, operation: str, **kwargs) -> Dict[str, Any]:
+        response = getattr(self.client, operation)(**self._request(kwargs))
+        if 'Items' in response:
+            response['Items'] = [
+                decode_item(item) for item in response['Items']]
+        for name in ('Item', 'Attributes'):
+            if name in response:
+                response[name] = decode_item(response[name])
+        return response
+
+    def warm(self, key: Dict[str, Any]) -> None:
+        self._call('get_item', Key=key)
+
+    def scan(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Iterable[Dict[str, Any]]:
+        return self._paginate(
+            lambda **kw: self._call('scan', **kw), deadline, kwargs)
+
+    def query(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Iterable[Dict[str, Any]]:
+        return self._paginate(
+            lambda **kw: self._call('query', **kw), deadline, kwargs)
+
+    def batch_get(
+            self,
+            keys: List[Dict[str, Any]],
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Iterable[Dict[str, Any]]:
+        """ Yields items for keys, fetching up to 100 keys per request. """
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            request: Dict[str, Any] = {
+                self.table: dict(kwargs, Keys=[
+                    encode_item(key)
+                    for key in keys[start:start + BATCH_GET_SIZE]
+                ]),
+            }
+            while request:
+                if deadline:
+                    deadline.check()
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(self.table, []):
+                    yield decode_item(item)
+                request = response.get('UnprocessedKeys')
+
+    def put_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Any:
+        if deadline:
+            deadline.check()
+        return self._call('put_item', **kwargs)
+
+    def get_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Optional[Dict[str, Any]]:
+        if deadline:
+            deadline.check()
+        return self._call('get_item', **kwargs).get('Item')
+
+    def update_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Any:
+        if deadline:
+            deadline.check()
+        return self._call('update_item', **kwargs)
+
+    def delete_item(
+            self,
+            deadline: Optional[Deadline] = None,
+            **kwargs) -> Any:
+        if deadline:
+            deadline.check()
+        return self._call('delete_item', **kwargs)
+
+
+def create_dynamodb_service(
+        table: str,
+        implementation: str = 'resource') -> DynamoDBService:
+    if implementation == 'resource':
+        return DynamoDBService(table)
+    elif implementation == 'client':
+        return ClientDynamoDBService(table)
+    else:
+        raise ValueError(f'Unknown DynamoDB implementation: {implementation}')
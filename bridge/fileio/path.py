@@ -17,6 +17,7 @@ class PathType(Enum):
     local = 0
     file = 0
     s3 = 1
+    ssm = 2
 
 
 class S3Path:
@@ -38,6 +39,29 @@ class S3Path:
         return ret
 
 
+class SSMPath:
+    """ Models a SSM parameter path parser.
+
+    Both ``ssm:///sms-bridge/token`` and ``ssm://sms-bridge-token`` forms
+    are accepted, the former referencing a hierarchical parameter name.
+    """
+
+    def __init__(self, input_path: str) -> None:
+        self.full_path = input_path
+        self.parsed_path = urlparse(input_path)
+
+    @property
+    def name(self) -> str:
+        return self.parsed_path.netloc + self.parsed_path.path
+
+
+def get_scheme(path: str) -> str:
+    """ Returns a path scheme, ``file`` for plain local paths. """
+    if not path:
+        raise UnknownPathTypeError('not existing path')
+    return urlparse(path).scheme or 'file'
+
+
 def get_path_type(path: str) -> PathType:
     """ Returns a path type from input path. """
     ret: Optional[PathType] = None
@@ -1,17 +1,39 @@
 """ Resource retrievals from various sources. """
 import logging
 import os
+import shutil
+import threading
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from tempfile import TemporaryDirectory
-from typing import Any, Dict, Generator, Optional
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+)
+from urllib.parse import urlparse
 
-from bridge.fileio.path import PathType, S3Path, get_path_type
-from bridge.s3_service import S3Service, create_s3_service
+import requests
+
+from bridge.fileio.path import S3Path, SSMPath, get_scheme
+from bridge.s3_service import S3Service, cache_connection, create_s3_service
+from bridge.ssm_service import SSMService, create_ssm_service
+
+
+if TYPE_CHECKING:
+    from bridge.configuration import Configuration
 
 
 log = logging.getLogger(__name__)
 
+STAND_IN_ROOT_ENV = 'bridge_stand_in_root'
+STAND_IN_SCHEMES = ('s3', 'ssm', 'http', 'https')
+
 
 class UnknownRetrievalTypeError(ValueError):
     """ Models an error for unknown retrieval type. """
@@ -37,11 +59,27 @@ class FileRetrieval(metaclass=ABCMeta):
         """ Remove used copy file. """
 
 
+RetrievalBuilder = Callable[['Configuration'], FileRetrieval]
+
+_RETRIEVALS: Dict[str, RetrievalBuilder] = {}
+
+
+def register_retrieval(scheme: str, builder: RetrievalBuilder) -> None:
+    """ Registers a retrieval builder for paths with the given scheme.
+
+    Registering an already known scheme replaces its retrieval, which lets
+    local runs swap a remote source for a local stand-in.
+    """
+    _RETRIEVALS[scheme] = builder
+
+
 class LocalFileRetrieval(FileRetrieval):
     """ Models a local file loader. """
 
     def download(self, input_path: str) -> str:
         """ Returns the same input path. """
+        if '://' in input_path:
+            return urlparse(input_path).path
         return input_path
 
     def remove_copy(self, input_path) -> None:
@@ -49,22 +87,55 @@ class LocalFileRetrieval(FileRetrieval):
         return None
 
 
-class S3FileRetrieval(FileRetrieval):
-    """ Models a S3 file downloader. """
+class LocalStandInRetrieval(LocalFileRetrieval):
+    """ Models a local directory standing in for a remote source.
 
-    def __init__(self, s3_service: S3Service) -> None:
+    A path ``scheme://host/some/key`` is read from ``root/host/some/key``.
+    """
+
+    def __init__(self, root: str) -> None:
+        super().__init__()
+        self.root = root
+
+    def download(self, input_path: str) -> str:
+        """ Returns a path of the file in the local directory. """
+        parsed_path = urlparse(input_path)
+        return os.path.join(
+            self.root, parsed_path.netloc, parsed_path.path.lstrip('/'))
+
+
+class TemporaryFileRetrieval(FileRetrieval):
+    """ Models a retrieval storing downloaded files in a temporary dir. """
+
+    def __init__(self) -> None:
         super().__init__()
-        self.s3_service = s3_service
         self.tmp_dir = TemporaryDirectory()
 
     def __del__(self) -> None:
         self.tmp_dir.cleanup()
 
+    def local_path(self, filename: str) -> str:
+        """ Returns a unique local path for a file with the given name. """
+        return os.path.join(
+            mkdtemp(dir=self.tmp_dir.name), filename or 'download')
+
+    def remove_copy(self, input_path: str) -> None:
+        """ Removes downloaded copy of the file. """
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        log.info(f'removed file {input_path}')
+
+
+class S3FileRetrieval(TemporaryFileRetrieval):
+    """ Models a S3 file downloader. """
+
+    def __init__(self, s3_service: S3Service) -> None:
+        super().__init__()
+        self.s3_service = s3_service
+
     def download(self, input_path: str) -> str:
         """ Downloadsfrom the S3 and returns a local path of the file. """
         s3_path = S3Path(input_path)
-        filename = os.path.basename(s3_path.key)
-        out_path = os.path.join(self.tmp_dir.name, filename)
+        out_path = self.local_path(os.path.basename(s3_path.key))
         log.info(f'downloading file from {input_path} to {out_path}')
         self.s3_service.client.download_file(
             Bucket=s3_path.bucket_name,
@@ -74,33 +145,126 @@ class S3FileRetrieval(FileRetrieval):
             f'finished download {input_path} to {out_path}')
         return out_path
 
-    def remove_copy(self, input_path: str) -> None:
-        """ Removes downloaded copy of the file. """
-        os.remove(input_path)
-        log.info(f'removed file {input_path}')
+
+class SSMParameterRetrieval(TemporaryFileRetrieval):
+    """ Models a SSM parameter loader storing the value in a file. """
+
+    def __init__(self, ssm_service: SSMService) -> None:
+        super().__init__()
+        self.ssm_service = ssm_service
+
+    def download(self, input_path: str) -> str:
+        """ Fetches the parameter and returns a local path of its value. """
+        name = SSMPath(input_path).name
+        out_path = self.local_path(os.path.basename(name))
+        log.info(f'fetching parameter {name} to {out_path}')
+        value = self.ssm_service.get_parameters([name])[name]
+        with open(out_path, 'w') as f:
+            f.write(value)
+        return out_path
+
+
+class HTTPFileRetrieval(TemporaryFileRetrieval):
+    """ Models a HTTP(S) file downloader. """
+
+    def __init__(self, timeout: float = 10) -> None:
+        super().__init__()
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def download(self, input_path: str) -> str:
+        """ Downloads the URL and returns a local path of the file. """
+        out_path = self.local_path(
+            os.path.basename(urlparse(input_path).path))
+        log.info(f'downloading file from {input_path} to {out_path}')
+        with self.session.get(
+                input_path, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            with open(out_path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        log.info(f'finished download {input_path} to {out_path}')
+        return out_path
+
+
+register_retrieval('file', lambda config: LocalFileRetrieval())
+register_retrieval(
+    's3', lambda config: S3FileRetrieval(create_s3_service(config)))
+register_retrieval(
+    'ssm', lambda config: SSMParameterRetrieval(
+        create_ssm_service(config.ssm)))
+register_retrieval('http', lambda config: HTTPFileRetrieval())
+register_retrieval('https', lambda config: HTTPFileRetrieval())
+
+
+def register_stand_in(root: str) -> None:
+    """ Serves remote paths from a local directory, e.g. for local runs. """
+    for scheme in STAND_IN_SCHEMES:
+        register_retrieval(
+            scheme, lambda config: LocalStandInRetrieval(root))
+
+
+if os.environ.get(STAND_IN_ROOT_ENV):
+    register_stand_in(os.environ[STAND_IN_ROOT_ENV])
 
 
 class RetrievalFactory:
-    """ Models a retrieval factory for file download. """
+    """ Models a retrieval factory for file download.
 
-    def __init__(self, config: Dict[str, Any]) -> None:
+    Retrievals are created once per scheme and reused for the lifetime of
+    the factory.
+    """
+
+    def __init__(
+            self,
+            config: 'Configuration',
+            max_workers: int = 8) -> None:
         self.config = config
+        self.max_workers = max_workers
+        self._retrievals: Dict[str, FileRetrieval] = {}
+        self._lock = threading.Lock()
 
     def get_retrieval(self, input_path: str) -> FileRetrieval:
         """ Returns a retrieval based in input path type. """
-        path_type = get_path_type(input_path)
-        ret: Optional[FileRetrieval] = None
-        if path_type == PathType.local:
-            ret = LocalFileRetrieval()
-        elif path_type == PathType.s3:
-            ret = S3FileRetrieval(create_s3_service(self.config))
-        else:
-            raise UnknownRetrievalTypeError(
-                f'unable to instantiate {path_type} retrieval')
+        scheme = get_scheme(input_path)
+        with self._lock:
+            ret: Optional[FileRetrieval] = self._retrievals.get(scheme)
+            if ret is None:
+                try:
+                    builder = _RETRIEVALS[scheme]
+                except KeyError:
+                    raise UnknownRetrievalTypeError(
+                        f'unable to instantiate {scheme} retrieval')
+                ret = builder(self.config)
+                self._retrievals[scheme] = ret
 
         return ret
 
+    @contextmanager
+    def retrieve_many(
+            self,
+            input_paths: Iterable[str],
+    ) -> Generator[Dict[str, str], None, None]:
+        """ Downloads files concurrently and yields their local paths. """
+        paths: List[str] = list(dict.fromkeys(input_paths))
+        retrievals = [self.get_retrieval(path) for path in paths]
+        downloaded: Dict[str, str] = {}
+
+        def download(index: int) -> None:
+            downloaded[paths[index]] = retrievals[index].download(
+                paths[index])
+
+        try:
+            workers = max(1, min(self.max_workers, len(paths)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(download, range(len(paths))))
+            yield dict(downloaded)
+        finally:
+            for path, local_path in downloaded.items():
+                self.get_retrieval(path).remove_copy(local_path)
+
 
-def get_retrieval_factory(config: Dict[str, Any]) -> RetrievalFactory:
-    """ Returns retrieval factory. """
+@cache_connection
+def get_retrieval_factory(config: 'Configuration') -> RetrievalFactory:
+    """ Returns a process wide retrieval factory of a configuration. """
     return RetrievalFactory(config)
@@ -2,27 +2,31 @@
 import logging
 import sys
 from logging import Formatter, Handler, StreamHandler
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Iterable, Optional
 
 
-def get_handler(conf: Dict[str, Any]) -> Handler:
-    """Create handler from configuration dictionary."""
+if TYPE_CHECKING:
+    from bridge.configuration import LoggerConfig
 
-    log_type = conf['handler']
+
+def get_handler(conf: 'LoggerConfig') -> Handler:
+    """Create handler from logger configuration."""
+
+    log_type = conf.handler
     ret_handler: Optional[Handler] = None
-    formatter = Formatter(conf['formatter'])
+    formatter = Formatter(conf.formatter)
 
     if log_type == 'stdout':
         ret_handler = StreamHandler(sys.stdout)
         ret_handler.setFormatter(formatter)
-        ret_handler.setLevel(conf['level'])
+        ret_handler.setLevel(conf.level)
     else:
         raise Exception(f'unknown log type {log_type}')
 
     return ret_handler
 
 
-def initialize_logger(conf: Dict[str, Any]) -> None:
+def initialize_logger(conf: Iterable['LoggerConfig']) -> None:
     """Initializes an application logging."""
 
     root = logging.getLogger()
@@ -30,6 +34,6 @@ def initialize_logger(conf: Dict[str, Any]) -> None:
     for handler in list(root.handlers):
         root.removeHandler(handler)
 
-    for logger_conf in conf.get('logger_conf', list()):
+    for logger_conf in conf:
         handler = get_handler(logger_conf)
         root.addHandler(handler)
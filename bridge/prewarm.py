@@ -0,0 +1,47 @@
+""" Init phase connection pre-warming. """
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict
+
+
+log = logging.getLogger(__name__)
+
+Warmer = Callable[[float], None]
+
+
+def prewarm(warmers: Dict[str, Warmer], budget: float) -> float:
+    """ Runs warmers in parallel for at most budget seconds.
+
+    Each warmer opens and keeps connections to one endpoint and gets the
+    budget as its request timeout. Warmers still running when the budget
+    runs out are left behind rather than delaying the init. Returns the
+    elapsed time.
+    """
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, len(warmers)),
+        thread_name_prefix='prewarm',
+    )
+    futures = {
+        executor.submit(warmer, budget): name
+        for name, warmer in warmers.items()
+    }
+    done, not_done = wait(futures, timeout=budget)
+    executor.shutdown(wait=False)
+
+    warmed = 0
+    for future in done:
+        if future.exception() is None:
+            warmed += 1
+        else:
+            log.warning(
+                f'failed to prewarm {futures[future]}: {future.exception()}')
+    if not_done:
+        log.warning(
+            'prewarm budget exceeded by '
+            f'{sorted(futures[future] for future in not_done)}')
+
+    elapsed = time.monotonic() - start
+    log.info(f'prewarmed {warmed}/{len(futures)} in {elapsed:.3f}s')
+    return elapsed
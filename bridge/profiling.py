@@ -0,0 +1,149 @@
+""" Sampling cProfile hook for Lambda handlers. """
+import cProfile
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+from bridge.fileio.path import S3Path, get_scheme
+from bridge.s3_service import create_s3_service
+
+
+if TYPE_CHECKING:
+    from bridge.configuration import Configuration
+
+
+log = logging.getLogger(__name__)
+
+PROFILE_DIR = '/tmp/profiles'
+SAMPLE_RATE_ENV = 'bridge_profile_rate'
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+# cProfile on sys.monitoring sees every thread, but only one may run
+PER_THREAD = sys.version_info < (3, 12)
+
+_profiling = threading.Lock()
+
+
+def sample_rate(config: 'Configuration') -> float:
+    """ Returns a profiled fraction of invocations, the env var wins. """
+    return float(os.environ.get(
+        SAMPLE_RATE_ENV, config.profiling.sample_rate))
+
+
+class ThreadProfiler():
+    """ Models cProfile of a call and of the threads started during it.
+
+    cProfile only sees the thread that enables it, so a threading profile
+    hook enables another profiler in every thread started while the call
+    runs, e.g. the workers of send_many. Their stats are merged into the
+    calling thread's when the call returns.
+    """
+
+    def __init__(self) -> None:
+        self.profiler = cProfile.Profile()
+        self.thread_profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _start_thread(self, frame: Any, event: str, arg: Any) -> None:
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.thread_profilers.append(profiler)
+        profiler.enable()
+
+    def runcall(self, func: Handler, *args: Any) -> Dict[str, Any]:
+        if PER_THREAD:
+            threading.setprofile(self._start_thread)
+        try:
+            return self.profiler.runcall(func, *args)
+        finally:
+            if PER_THREAD:
+                threading.setprofile(None)
+
+    def stats(self) -> pstats.Stats:
+        """ Returns stats of the call merged with those of its threads. """
+        stats = pstats.Stats(self.profiler)
+        with self._lock:
+            profilers = list(self.thread_profilers)
+        for profiler in profilers:
+            stats.add(profiler)
+        return stats
+
+
+def save_profile(
+        profiler: ThreadProfiler,
+        name: str,
+        context: Any,
+        config: 'Configuration') -> str:
+    """ Dumps pstats to /tmp and uploads them if an S3 output is set.
+
+    Returns where the stats are kept, an uploaded file is removed from
+    /tmp so samples do not fill it up across warm invocations.
+    """
+    request_id = getattr(
+        context, 'aws_request_id', str(int(time.time() * 1000)))
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{name}-{request_id}.pstats')
+    stats = profiler.stats()
+    stats.dump_stats(path)
+    log.info(
+        f'saved profile {path} of {len(profiler.thread_profilers) + 1} '
+        f'threads')
+
+    output = config.profiling.output
+    if output and get_scheme(output) == 's3':
+        s3_path = S3Path(output)
+        key = '/'.join(filter(None, [
+            s3_path.key.strip('/'), os.path.basename(path)]))
+        try:
+            create_s3_service(config).client.upload_file(
+                path, s3_path.bucket_name, key)
+        finally:
+            os.remove(path)
+        log.info(f'uploaded profile to s3://{s3_path.bucket_name}/{key}')
+        return f's3://{s3_path.bucket_name}/{key}'
+    return path
+
+
+def profile_handler(config: 'Configuration') -> Callable[[Handler], Handler]:
+    """ Profiles a sample of handler invocations with cProfile.
+
+    The handler is returned unwrapped when profiling is disabled, so there
+    is no overhead unless a sample rate is set. The thread hook is process
+    wide, so only one invocation at a time is profiled and sampling is
+    meant for Lambda, which runs one invocation per process. server.py
+    sets the sample rate to 0 before loading the handlers.
+    """
+    rate = sample_rate(config)
+
+    def decorator(func: Handler) -> Handler:
+        if rate <= 0:
+            return func
+
+        name = f'{func.__module__}.{func.__name__}'
+
+        @wraps(func)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            if random.random() >= rate \
+                    or not _profiling.acquire(blocking=False):
+                return func(event, context)
+
+            profiler = ThreadProfiler()
+            try:
+                return profiler.runcall(func, event, context)
+            finally:
+                try:
+                    save_profile(profiler, name, context, config)
+                except Exception as e:
+                    log.error(f'failed to save profile of {name}: {e}')
+                finally:
+                    _profiling.release()
+        return wrapper
+    return decorator
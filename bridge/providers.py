@@ -1,18 +1,44 @@
 import json
 import logging
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from urllib.parse import parse_qs
 
 import requests
+from botocore.exceptions import BotoCoreError, ClientError  # type: ignore
+from requests.adapters import HTTPAdapter
 from requests.models import Response
+from twilio.http.http_client import TwilioHttpClient  # type: ignore
 from twilio.rest import Client  # type: ignore
 
+from bridge.cache import TTLCache
+from bridge.concurrency import AdaptiveLimiter, Outcome, create_limiter
+from bridge.configuration import Configuration, TelegramConfig, TwilioConfig
+from bridge.deadline import Deadline, DeadlineExceededError
+from bridge.fileio.path import S3Path, get_scheme
+from bridge.s3_service import S3Service, create_s3_service
+
 
 log = logging.getLogger(__name__)
 
+TWILIO_API_URL = 'https://api.twilio.com'
+TELEGRAM_MAX_TEXT_LENGTH = 4096
+SPLIT_BOUNDARIES = ('\n\n', '\n', '. ', ' ')
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+class DeliveryError(Exception):
+    """ Models a send rejected by a provider with an HTTP status. """
+
+    def __init__(self, error: str, status: int) -> None:
+        super().__init__(error)
+        self.status = status
+
 
 class InvalidMessageError(Exception):
     """ Models an error for an invalid received message. """
@@ -32,7 +58,8 @@ class Message():
             destination: str,
             text: str,
             media: List[str],
-            timestamp: Optional[datetime] = None) -> None:
+            timestamp: Optional[datetime] = None,
+            message_id: Optional[str] = None) -> None:
         if not timestamp:
             timestamp = datetime.now()
 
@@ -41,6 +68,7 @@ class Message():
         self.destination = destination
         self.text = text
         self.media = media
+        self.message_id = message_id
 
     def __repr__(self):
         return (
@@ -50,97 +78,573 @@ class Message():
         )
 
 
+class PreparedMessage():
+    """ Models a message rendered once for sending to many recipients.
+
+    A provider stores its recipient independent request payload, so a
+    fan-out only inserts each recipient instead of rendering the message
+    again.
+    """
+
+    __slots__ = ('message', 'payload')
+
+    def __init__(self, message: Message, payload: Any = None) -> None:
+        self.message = message
+        self.payload = payload
+
+    def to(self, destination: str) -> 'RecipientView':
+        return RecipientView(self, destination)
+
+
+class RecipientView(Message):
+    """ Models an immutable view of a prepared message for one recipient. """
+
+    __slots__ = ('prepared', '_destination')
+    prepared: PreparedMessage
+    _destination: str
+
+    def __init__(
+            self,
+            prepared: PreparedMessage,
+            destination: str) -> None:
+        object.__setattr__(self, 'prepared', prepared)
+        object.__setattr__(self, '_destination', destination)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    @property  # type: ignore
+    def destination(self) -> str:  # type: ignore
+        return self._destination
+
+    @property  # type: ignore
+    def source(self) -> str:  # type: ignore
+        return self.prepared.message.source
+
+    @property  # type: ignore
+    def text(self) -> str:  # type: ignore
+        return self.prepared.message.text
+
+    @property  # type: ignore
+    def media(self) -> List[str]:  # type: ignore
+        return self.prepared.message.media
+
+    @property  # type: ignore
+    def timestamp(self) -> datetime:  # type: ignore
+        return self.prepared.message.timestamp
+
+    @property  # type: ignore
+    def message_id(self) -> Optional[str]:  # type: ignore
+        return self.prepared.message.message_id
+
+    @property
+    def payload(self) -> Any:
+        return self.prepared.payload
+
+
+class SendResult():
+    """ Models an outcome of a single sent message. """
+
+    def __init__(
+            self,
+            message: Message,
+            error: Optional[str] = None,
+            elapsed: float = 0.0,
+            attempted: bool = True,
+            status: Optional[int] = None) -> None:
+        self.message = message
+        self.error = error
+        self.elapsed = elapsed
+        self.attempted = attempted
+        self.status = status
+
+    @property
+    def delivered(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return (
+            f'SendResult(destination={self.message.destination}, '
+            f'delivered={self.delivered}, attempted={self.attempted}, '
+            f'error={self.error}, elapsed={self.elapsed:.3f})'
+        )
+
+
+def delivery_report(results: Sequence[SendResult]) -> Dict[str, List[str]]:
+    """ Groups result destinations by their delivery outcome. """
+    report: Dict[str, List[str]] = {
+        'delivered': [],
+        'failed': [],
+        'not_attempted': [],
+    }
+    for result in results:
+        if result.delivered:
+            outcome = 'delivered'
+        elif result.attempted:
+            outcome = 'failed'
+        else:
+            outcome = 'not_attempted'
+        report[outcome].append(result.message.destination)
+
+    return report
+
+
+def send_outcome(
+        error: Optional[str],
+        status: Optional[int],
+        exception: Optional[Exception] = None) -> Outcome:
+    """ Classifies a send by what it says about provider capacity.
+
+    Rate limiting, server errors, timeouts and refused connections signal
+    overload, other errors such as invalid recipients do not.
+    """
+    if error is None:
+        return Outcome.SUCCESS
+    if status == 429:
+        return Outcome.THROTTLED
+    if (status or 0) >= 500 or isinstance(
+            exception, (requests.Timeout, requests.ConnectionError)):
+        return Outcome.FAILED
+    return Outcome.IGNORED
+
+
+def split_text(
+        text: str,
+        limit: int = TELEGRAM_MAX_TEXT_LENGTH) -> List[str]:
+    """ Splits a text into parts of at most limit characters.
+
+    Parts end at the last paragraph, line, sentence or word boundary that
+    fits, falling back to a hard cut for text without any.
+    """
+    parts: List[str] = []
+    while len(text) > limit:
+        cut = -1
+        for boundary in SPLIT_BOUNDARIES:
+            cut = text.rfind(boundary, 0, limit - len(boundary) + 1)
+            if cut > 0:
+                cut += len(boundary)
+                break
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
 class MessageProvider(metaclass=ABCMeta):
     """ Models a Message provider. """
 
+    provider: Providers
+    max_workers: int = 1
+    limiter: Optional[AdaptiveLimiter] = None
+
     @abstractmethod
-    def send_message(self, message: Message) -> None:
+    def send_message(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> None:
         """ Sends a message. """
 
+    def send_many(
+            self,
+            messages: Sequence[Message],
+            deadline: Optional[Deadline] = None) -> List[SendResult]:
+        """ Sends messages and returns a result per message.
+
+        No new sends are started once the deadline is reached, remaining
+        messages and sends left without budget for their request are
+        reported as not attempted. With an adaptive limiter
+        at most its current limit of sends are in flight.
+        """
+        deadline = deadline or Deadline()
+        workers = min(self.max_workers, len(messages))
+        if workers <= 1:
+            results = [
+                self._send_one(message, deadline) for message in messages]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    lambda message: self._send_one(message, deadline),
+                    messages,
+                ))
+
+        if self.limiter:
+            log.info(
+                f'{self.limiter.name} concurrency {self.limiter.metrics()}')
+        return results
+
+    def _send_one(self, message: Message, deadline: Deadline) -> SendResult:
+        if deadline.expired or (
+                self.limiter and not self.limiter.acquire(deadline)):
+            return SendResult(
+                message, error='deadline exceeded', attempted=False)
+
+        start = time.monotonic()
+        status: Optional[int] = None
+        exception: Optional[Exception] = None
+        try:
+            error = self._deliver(message, deadline)
+        except DeadlineExceededError:
+            if self.limiter:
+                self.limiter.release(start, Outcome.IGNORED)
+            return SendResult(
+                message, error='deadline exceeded', attempted=False,
+                elapsed=time.monotonic() - start)
+        except DeliveryError as e:
+            error, status = str(e), e.status
+        except Exception as e:
+            log.error(f'failed to send {message}: {e}')
+            error, status = str(e), getattr(e, 'status', None)
+            exception = e
+        if self.limiter:
+            self.limiter.release(
+                start, send_outcome(error, status, exception))
+
+        return SendResult(
+            message, error=error, elapsed=time.monotonic() - start,
+            status=status)
+
+    def _deliver(self, message: Message, deadline: Deadline) -> Optional[str]:
+        """ Sends a message and returns an error description on failure. """
+        self.send_message(message, deadline)
+        return None
+
     @abstractmethod
     def parse_message(self, raw_message: Any) -> Message:
         """ Parse a received message. """
 
+    def warm(self, timeout: float) -> None:
+        """ Opens a pooled connection ahead of the first send. """
+
+    def resolve_media(self, media: List[str]) -> List[str]:
+        """ Returns URLs other providers can fetch of parsed media. """
+        return list(media)
+
+    def render(self, message: Message) -> Any:
+        """ Returns a recipient independent payload of a message. """
+        return None
+
+    def prepare(self, message: Message) -> PreparedMessage:
+        """ Renders a message once for sending to many recipients. """
+        message = Message(
+            source=message.source,
+            destination='',
+            text=message.text,
+            media=list(message.media),
+            timestamp=message.timestamp,
+            message_id=message.message_id,
+        )
+        return PreparedMessage(message, self.render(message))
+
+    def reply(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> Optional[str]:
+        """ Replies to a received webhook message.
+
+        Returns a webhook response body carrying the reply if the provider
+        can answer inline, otherwise sends the reply and returns None.
+        """
+        self.send_many([message], deadline)
+        return None
+
 
 class TelegramMessageProvider(MessageProvider):
-    def __init__(self, config: Dict[str, Any]) -> None:
+    def __init__(
+            self,
+            config: TelegramConfig,
+            s3: Optional[S3Service] = None) -> None:
         self.config = config
+        self.s3 = s3
         self.provider: Providers = Providers.TELEGRAM
-        self.bot_token: str = self.config['token']
-        self.base_url: str = self.config['base_url'].format(self.bot_token)
+        self.bot_token: str = self.config.token
+        self.base_url: str = self.config.bot_url
+        self.max_workers: int = self.config.max_workers
+        self.timeout: float = self.config.timeout
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_workers,
+        ))
+        self.file_keys: TTLCache[str] = TTLCache(
+            maxsize=256, ttl=self.config.file_cache_ttl)
+        self.limiter = create_limiter(
+            self.config.concurrency, self.provider.value, self.max_workers)
 
-    def handle_requests_response(self, r: Response):
+    def handle_requests_response(self, r: Response) -> Optional[str]:
+        """ Logs and returns an error description of a failed request. """
         if r.status_code // 100 >= 4:
-            if r.headers['Content-Type'] == 'application/json':
-                log.error(r.json())
+            if r.headers.get('Content-Type') == 'application/json':
+                error = str(r.json())
             else:
-                log.error(r.content.decode('UTF-8'))
+                error = r.content.decode('UTF-8')
+            log.error(error)
+            return error
+
+        return None
+
+    def render(self, message: Message) -> List[Tuple[bytes, bytes]]:
+        """ Returns JSON bodies of message parts split around the chat id. """
+        return [
+            (
+                b'{"chat_id": ',
+                b', ' + json.dumps({'text': part}).encode('UTF-8')[1:],
+            )
+            for part in split_text(self.message_text(message))
+        ]
+
+    def request_bodies(self, message: Message) -> List[bytes]:
+        """ Returns sendMessage request bodies of a message. """
+        payload = getattr(message, 'payload', None)
+        if payload is None:
+            payload = self.render(message)
+        chat_id = b'%d' % int(message.destination)
+        return [prefix + chat_id + suffix for prefix, suffix in payload]
+
+    def _deliver(self, message: Message, deadline: Deadline) -> Optional[str]:
+        for body in self.request_bodies(message):
+            r: Response = self.session.post(
+                self.config.send_message_url,
+                data=body,
+                headers=JSON_HEADERS,
+                timeout=deadline.timeout(self.timeout),
+            )
+            error = self.handle_requests_response(r)
+            if error:
+                raise DeliveryError(error, r.status_code)
+
+        return None
 
-    def send_message(self, message: Message) -> None:
-        chat_id: int = int(message.destination)
-        text: str = '\n\n'.join([
+    def message_text(self, message: Message) -> str:
+        return '\n\n'.join([
             message.text,
             *message.media,
         ])
-        r: Response = requests.post(f'{self.base_url}/sendMessage', json={
-            'chat_id': chat_id,
-            'text': text,
+
+    def warm(self, timeout: float) -> None:
+        self.session.get(f'{self.base_url}/getMe', timeout=timeout)
+
+    def reply(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> Optional[str]:
+        """ Answers with a sendMessage call in the webhook response.
+
+        Falls back to sending when inline replies are disabled or the text
+        needs more than one message.
+        """
+        parts = split_text(self.message_text(message))
+        if not self.config.inline_reply or len(parts) > 1:
+            return super().reply(message, deadline)
+
+        return json.dumps({
+            'method': 'sendMessage',
+            'chat_id': int(message.destination),
+            'text': parts[0],
         })
-        self.handle_requests_response(r)
+
+    def send_message(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> None:
+        self._deliver(message, deadline or Deadline())
+
+    def resolve_file(self, file_id: str) -> str:
+        """ Returns a presigned URL of a copy of a file in media_output.
+
+        Telegram download links embed the bot token, so files are copied
+        to S3 and Twilio fetches them from a URL valid for media_url_ttl
+        seconds instead. Copies are cached by file id, so repeated forwards
+        of the same file download it once.
+        """
+        output = self.config.media_output
+        if self.s3 is None or not output or get_scheme(output) != 's3':
+            raise InvalidMessageError('No S3 media output configured')
+
+        s3_path = S3Path(output)
+        key = self.file_keys.get(file_id)
+        if key is None:
+            result, r = self.download_file(file_id)
+            key = '/'.join(filter(None, [
+                s3_path.key.strip('/'),
+                result.get('file_unique_id', file_id),
+                result['file_path'].rsplit('/', 1)[-1],
+            ]))
+            self.s3.client.put_object(
+                Bucket=s3_path.bucket_name,
+                Key=key,
+                Body=r.content,
+                ContentType=r.headers.get(
+                    'Content-Type', 'application/octet-stream'),
+            )
+            log.info(f'copied file {file_id} to {key}')
+            self.file_keys.set(file_id, key)
+
+        return self.s3.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': s3_path.bucket_name, 'Key': key},
+            ExpiresIn=self.config.media_url_ttl,
+        )
+
+    def download_file(self, file_id: str) -> Tuple[Dict[str, Any], Response]:
+        """ Returns the getFile result and the download of a file. """
+        r: Response = self.session.get(
+            f'{self.base_url}/getFile',
+            params={'file_id': file_id},
+            timeout=self.timeout,
+        )
+        error = self.handle_requests_response(r)
+        if error:
+            raise InvalidMessageError(f'Unable to resolve file: {error}')
+        result: Dict[str, Any] = r.json()['result']
+
+        try:
+            r = self.session.get(
+                f'{self.config.file_url}/{result["file_path"]}',
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            # The exception text holds the download URL and so the token
+            raise InvalidMessageError(
+                f'Unable to download file: {type(e).__name__}')
+        error = self.handle_requests_response(r)
+        if error:
+            raise InvalidMessageError(f'Unable to download file: {error}')
+        return result, r
+
+    def parse_media(self, data: Dict[str, Any]) -> List[str]:
+        """ Returns file ids of the photo or document of a message.
+
+        Files are not fetched while parsing, see resolve_media, so only
+        authorized senders cause downloads and S3 writes.
+        """
+        file_ids: List[str] = []
+        if data.get('photo'):
+            file_ids.append(data['photo'][-1]['file_id'])
+        if data.get('document'):
+            file_ids.append(data['document']['file_id'])
+        return file_ids
+
+    def resolve_media(self, media: List[str]) -> List[str]:
+        """ Returns presigned URLs of files, dropping unresolvable ones. """
+        urls: List[str] = []
+        for file_id in media:
+            try:
+                urls.append(self.resolve_file(file_id))
+            except (
+                    InvalidMessageError,
+                    requests.RequestException,
+                    BotoCoreError,
+                    ClientError) as e:
+                log.error(f'Dropping file {file_id}: {e}')
+        return urls
 
     def parse_message(self, raw_message: str) -> Message:
         data: Dict[str, Any] = json.loads(raw_message)
         try:
             source: str = str(data['message']['chat']['id'])
-            text: str = data['message']['text']
+            message: Dict[str, Any] = data['message']
         except KeyError as e:
             raise InvalidMessageError(
                 f'Missing parameter "{e.args[0]}" in request data')
+        text: Optional[str] = message.get('text', message.get('caption'))
+        media = self.parse_media(message)
+        if text is None and not media:
+            raise InvalidMessageError(
+                'Missing parameter "text" in request data')
 
         return Message(
             source=source,
             destination='',
-            text=text,
-            media=[],
+            text=text or '',
+            media=media,
         )
 
 
+class DeadlineHttpClient(TwilioHttpClient):
+    """ Models a Twilio HTTP client bounding timeouts by a deadline. """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.local = threading.local()
+
+    def request(self, *args, **kwargs):
+        deadline: Optional[Deadline] = getattr(self.local, 'deadline', None)
+        if deadline and kwargs.get('timeout') is None:
+            kwargs['timeout'] = deadline.timeout(self.timeout)
+        return super().request(*args, **kwargs)
+
+
 class TwilioMessageProvider(MessageProvider):
-    def __init__(self, config: Dict[str, Any]) -> None:
+    def __init__(self, config: TwilioConfig) -> None:
         self.provider: Providers = Providers.TWILIO
-        self.client = Client(config['sid'], config['token'])
-
-    def send_message(self, message: Message) -> None:
-        self.client.messages.create(
-            body=message.text,
-            media_url=message.media,
-            from_=message.source,
-            to=message.destination,
+        self.max_workers: int = config.max_workers
+        self.messaging_service_sid: str = config.messaging_service_sid
+        self.http_client = DeadlineHttpClient(
+            pool_connections=True,
+            timeout=config.timeout,
+        )
+        self.http_client.session.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.max_workers,
+        ))
+        self.client = Client(
+            config.sid, config.token,
+            http_client=self.http_client,
         )
+        self.limiter = create_limiter(
+            config.concurrency, self.provider.value, self.max_workers)
+
+    def send_message(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> None:
+        sender: Dict[str, str] = {'from_': message.source}
+        if self.messaging_service_sid:
+            sender = {'messaging_service_sid': self.messaging_service_sid}
+        self.http_client.local.deadline = deadline
+        try:
+            self.client.messages.create(
+                body=message.text,
+                media_url=message.media,
+                to=message.destination,
+                **sender,
+            )
+        finally:
+            self.http_client.local.deadline = None
+
+    def warm(self, timeout: float) -> None:
+        self.http_client.session.head(TWILIO_API_URL, timeout=timeout)
 
     def parse_message(self, raw_message: str) -> Message:
         data: Dict[str, List[str]] = parse_qs(raw_message)
         text = data['Body'][0]
         building = data['From'][0]
+        message_sid: Optional[str] = data.get('MessageSid', [None])[0]
 
         return Message(
             source=building,
             destination='',
             text=text,
             media=[],
+            message_id=message_sid,
         )
 
 
 def create_message_provider(
-        config: Dict[str, Any],
+        config: Configuration,
         provider_name: Providers) -> MessageProvider:
     if provider_name == Providers.TELEGRAM:
         return TelegramMessageProvider(
-            config['message_providers']['telegram'],
+            config.message_providers.telegram,
+            create_s3_service(config),
         )
     elif provider_name == Providers.TWILIO:
         return TwilioMessageProvider(
-            config['message_providers']['twilio'],
+            config.message_providers.twilio,
         )
     else:
         raise Exception(
@@ -1,22 +1,914 @@
-from typing import Iterable
+""" Storages of user states, subscriptions and broadcasts.
 
-from boto3.dynamodb.conditions import Attr
+Every storage has a DynamoDB and a SQLite implementation, chosen by
+``storage.backend``. DynamoDB table names are read from the
+``<name>_dynamodb_table`` environment variables only when that backend is
+used, so the bridge runs on SQLite without any AWS resources.
+"""
+import os
+import sqlite3
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from decimal import Decimal
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from bridge.dynamodb_service import DynamoDBService
+from botocore.exceptions import ClientError  # type: ignore
 
+from bridge.configuration import STORAGE_BACKENDS
+from bridge.deadline import Deadline
+from bridge.dynamodb_service import create_dynamodb_service
 
-class StateRepository():
-    def __init__(self, table_name: str) -> None:
+
+if TYPE_CHECKING:
+    from bridge.configuration import Configuration
+
+
+WARM_KEY = '#warm'
+SQLITE_BATCH_SIZE = 500
+
+
+def dynamodb_table(name: str) -> str:
+    """ Returns a DynamoDB table name from its environment variable. """
+    variable = f'{name}_dynamodb_table'
+    try:
+        return os.environ[variable]
+    except KeyError:
+        raise ValueError(
+            f'{variable} must be set for the dynamodb storage backend')
+
+
+def check_backend(config: 'Configuration') -> str:
+    """ Returns the configured storage backend. """
+    backend = config.storage.backend
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f'Unknown storage backend: {backend}')
+    return backend
+
+
+class SQLiteRepository():
+    """ Models a storage in a local SQLite database.
+
+    Every thread gets its own connection to a database in WAL mode, so
+    reads never wait for writers. The schema statements run on creation.
+    """
+    schema: Tuple[str, ...] = ()
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+        with self.connection as connection:
+            for statement in self.schema:
+                connection.execute(statement)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if not hasattr(self.local, 'connection'):
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self.local.connection = connection
+        return self.local.connection
+
+    def warm(self, timeout: float) -> None:
+        """ Does nothing, a connection is of no use to other threads.
+
+        The creating thread, in Lambda the one running the handler,
+        already opened its connection with the schema.
+        """
+
+
+class StateRepository(metaclass=ABCMeta):
+    """ Models a storage of user active states. """
+
+    def warm(self, timeout: float) -> None:
+        """ Opens a connection to the storage ahead of the first request. """
+
+    @abstractmethod
+    def get_active_numbers(
+            self,
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        """ Yields all active numbers. """
+
+    @abstractmethod
+    def filter_active(
+            self,
+            user_numbers: Iterable[str],
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        """ Yields those of the given numbers that are active. """
+
+    @abstractmethod
+    def put_active(
+            self,
+            user_number: str,
+            active: bool,
+            deadline: Optional[Deadline] = None) -> None:
+        """ Stores an active state of a number. """
+
+    def put_many(
+            self,
+            states: Iterable[Tuple[str, bool]],
+            deadline: Optional[Deadline] = None) -> None:
+        """ Stores active states of many numbers. """
+        for user_number, active in states:
+            self.put_active(user_number, active, deadline)
+
+
+class DynamoDBStateRepository(StateRepository):
+    def __init__(
+            self,
+            table_name: str,
+            implementation: str = 'resource') -> None:
         self.table_name = table_name
-        self.dynamodb = DynamoDBService(self.table_name)
+        self.dynamodb = create_dynamodb_service(
+            self.table_name, implementation)
 
-    def get_active_numbers(self) -> Iterable[str]:
-        items = self.dynamodb.scan(FilterExpression=Attr('active').eq(True))
+    def warm(self, timeout: float) -> None:
+        self.dynamodb.warm({'user_number': WARM_KEY})
+
+    def get_active_numbers(
+            self,
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        items = self.dynamodb.scan(
+            deadline=deadline,
+            FilterExpression='active = :active',
+            ExpressionAttributeValues={':active': True},
+        )
         for item in items:
             yield item['user_number']
 
-    def put_active(self, user_number: str, active: bool) -> None:
-        self.dynamodb.put_item(Item={
+    def filter_active(
+            self,
+            user_numbers: Iterable[str],
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        """ Yields those of the given numbers that are active. """
+        items = self.dynamodb.batch_get(
+            [{'user_number': number} for number in user_numbers],
+            deadline=deadline,
+            ProjectionExpression='user_number, active',
+        )
+        for item in items:
+            if item.get('active'):
+                yield item['user_number']
+
+    def put_active(
+            self,
+            user_number: str,
+            active: bool,
+            deadline: Optional[Deadline] = None) -> None:
+        self.dynamodb.put_item(deadline=deadline, Item={
             'user_number': user_number,
             'active': active,
         })
+
+
+class SQLiteStateRepository(SQLiteRepository, StateRepository):
+    """ Models a state storage in a local SQLite database.
+
+    Active numbers are covered by a partial index, keeping lookups in a
+    large table to a few index pages.
+    """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS state ('
+        'user_number TEXT PRIMARY KEY, '
+        'active INTEGER NOT NULL'
+        ') WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS state_active '
+        'ON state (user_number) WHERE active = 1',
+    )
+
+    def get_active_numbers(
+            self,
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        if deadline:
+            deadline.check()
+        rows = self.connection.execute(
+            'SELECT user_number FROM state WHERE active = 1')
+        for user_number, in rows:
+            yield user_number
+
+    def filter_active(
+            self,
+            user_numbers: Iterable[str],
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        numbers: List[str] = list(user_numbers)
+        for start in range(0, len(numbers), SQLITE_BATCH_SIZE):
+            if deadline:
+                deadline.check()
+            batch = numbers[start:start + SQLITE_BATCH_SIZE]
+            rows = self.connection.execute(
+                'SELECT user_number FROM state WHERE active = 1 '
+                f'AND user_number IN ({", ".join("?" * len(batch))})',
+                batch,
+            )
+            for user_number, in rows:
+                yield user_number
+
+    def put_active(
+            self,
+            user_number: str,
+            active: bool,
+            deadline: Optional[Deadline] = None) -> None:
+        self.put_many([(user_number, active)], deadline)
+
+    def put_many(
+            self,
+            states: Iterable[Tuple[str, bool]],
+            deadline: Optional[Deadline] = None) -> None:
+        """ Upserts states in a single transaction. """
+        if deadline:
+            deadline.check()
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO state (user_number, active) '
+                'VALUES (?, ?)',
+                ((user_number, int(active)) for user_number, active in states),
+            )
+
+
+def create_state_repository(config: 'Configuration') -> StateRepository:
+    """ Returns a state repository of the configured backend. """
+    if check_backend(config) == 'dynamodb':
+        return DynamoDBStateRepository(
+            dynamodb_table('state'), config.dynamodb.implementation)
+    return SQLiteStateRepository(config.storage.sqlite_path)
+
+
+ALL_BUILDINGS = '*'
+
+
+class SubscriptionRepository(metaclass=ABCMeta):
+    """ Models a storage of user subscriptions to buildings. """
+
+    def warm(self, timeout: float) -> None:
+        """ Opens a connection to the storage ahead of the first request. """
+
+    @abstractmethod
+    def subscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        """ Subscribes a number to a building or to all of them. """
+
+    @abstractmethod
+    def unsubscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        """ Removes a subscription of a number to a building. """
+
+    @abstractmethod
+    def get_subscribers(
+            self,
+            building: str,
+            deadline: Optional[Deadline] = None) -> Set[str]:
+        """ Returns numbers subscribed to the building or to all of them. """
+
+
+class DynamoDBSubscriptionRepository(SubscriptionRepository):
+    def __init__(
+            self,
+            table_name: str,
+            implementation: str = 'resource') -> None:
+        self.table_name = table_name
+        self.dynamodb = create_dynamodb_service(
+            self.table_name, implementation)
+
+    def warm(self, timeout: float) -> None:
+        self.dynamodb.warm(
+            {'building': WARM_KEY, 'user_number': WARM_KEY})
+
+    def subscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        self.dynamodb.put_item(deadline=deadline, Item={
+            'building': building,
+            'user_number': user_number,
+        })
+
+    def unsubscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        self.dynamodb.delete_item(deadline=deadline, Key={
+            'building': building,
+            'user_number': user_number,
+        })
+
+    def get_subscribers(
+            self,
+            building: str,
+            deadline: Optional[Deadline] = None) -> Set[str]:
+        """ Returns numbers subscribed to the building or to all of them. """
+        ret: Set[str] = set()
+        for key in (building, ALL_BUILDINGS):
+            items = self.dynamodb.query(
+                deadline=deadline,
+                KeyConditionExpression='#building = :building',
+                ExpressionAttributeNames={'#building': 'building'},
+                ExpressionAttributeValues={':building': key},
+                ProjectionExpression='user_number',
+            )
+            ret.update(item['user_number'] for item in items)
+        return ret
+
+
+class SQLiteSubscriptionRepository(SQLiteRepository, SubscriptionRepository):
+    """ Models a subscription storage in a local SQLite database. """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS subscription ('
+        'building TEXT NOT NULL, '
+        'user_number TEXT NOT NULL, '
+        'PRIMARY KEY (building, user_number)'
+        ') WITHOUT ROWID',
+    )
+
+    def subscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        if deadline:
+            deadline.check()
+        with self.connection as connection:
+            connection.execute(
+                'INSERT OR IGNORE INTO subscription (building, user_number) '
+                'VALUES (?, ?)',
+                (building, user_number),
+            )
+
+    def unsubscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        if deadline:
+            deadline.check()
+        with self.connection as connection:
+            connection.execute(
+                'DELETE FROM subscription '
+                'WHERE building = ? AND user_number = ?',
+                (building, user_number),
+            )
+
+    def get_subscribers(
+            self,
+            building: str,
+            deadline: Optional[Deadline] = None) -> Set[str]:
+        if deadline:
+            deadline.check()
+        rows = self.connection.execute(
+            'SELECT user_number FROM subscription WHERE building IN (?, ?)',
+            (building, ALL_BUILDINGS),
+        )
+        return {user_number for user_number, in rows}
+
+
+def create_subscription_repository(
+        config: 'Configuration') -> SubscriptionRepository:
+    """ Returns a subscription repository of the configured backend. """
+    if check_backend(config) == 'dynamodb':
+        return DynamoDBSubscriptionRepository(
+            dynamodb_table('subscription'), config.dynamodb.implementation)
+    return SQLiteSubscriptionRepository(config.storage.sqlite_path)
+
+
+class BroadcastRepository(metaclass=ABCMeta):
+    """ Models a storage of broadcast progress checkpoints.
+
+    Recipients of a broadcast are split into batches. A batch is leased to
+    one sender at a time and tracks failed attempts of its pending
+    recipients. Batches are returned as dicts of their index, pending and
+    failed recipients, attempts of recipients and delivered count.
+    """
+
+    def warm(self, timeout: float) -> None:
+        """ Opens a connection to the storage ahead of the first request. """
+
+    @abstractmethod
+    def create(
+            self,
+            broadcast_id: str,
+            source: str,
+            text: str,
+            recipients: Iterable[str],
+            batch_size: int,
+            deadline: Optional[Deadline] = None) -> bool:
+        """ Stores a new broadcast, returns False if it already exists. """
+
+    @abstractmethod
+    def get(
+            self,
+            broadcast_id: str,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """ Returns a broadcast header with its batches in order. """
+
+    @abstractmethod
+    def claim(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            lease: float,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """ Leases a batch to an owner for lease seconds.
+
+        Returns the batch, or None while another owner holds the lease.
+        """
+
+    @abstractmethod
+    def complete(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            delivered: Set[str],
+            attempts: Dict[str, int],
+            exhausted: Set[str],
+            deadline: Optional[Deadline] = None) -> None:
+        """ Records a batch send and releases its lease.
+
+        Delivered recipients and those out of attempts leave the pending
+        set, the latter are kept in the failed set. Attempt counts of
+        recipients still pending are updated. If the lease was lost to
+        another owner only the delivered recipients are removed.
+        """
+
+
+class DynamoDBBroadcastRepository(BroadcastRepository):
+    """ Models a broadcast storage in a DynamoDB table.
+
+    A broadcast is stored as a header item holding the message and an item
+    per batch of recipients, keeping items far below the DynamoDB item size
+    limit for any number of recipients.
+    """
+
+    def __init__(
+            self,
+            table_name: str,
+            ttl: int = 7 * 24 * 3600,
+            implementation: str = 'resource') -> None:
+        self.table_name = table_name
+        self.ttl = ttl
+        self.dynamodb = create_dynamodb_service(
+            self.table_name, implementation)
+
+    def warm(self, timeout: float) -> None:
+        self.dynamodb.warm({'broadcast_id': WARM_KEY})
+
+    def _put_new(
+            self,
+            item: Dict[str, Any],
+            deadline: Optional[Deadline] = None) -> bool:
+        """ Stores an item, returns False if it already exists. """
+        try:
+            self.dynamodb.put_item(
+                deadline=deadline,
+                Item=item,
+                ConditionExpression='attribute_not_exists(broadcast_id)',
+            )
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+        return True
+
+    def create(
+            self,
+            broadcast_id: str,
+            source: str,
+            text: str,
+            recipients: Iterable[str],
+            batch_size: int,
+            deadline: Optional[Deadline] = None) -> bool:
+        """ Stores a new broadcast, returns False if it already exists.
+
+        Batches are written before the header, so a broadcast is only
+        visible once all of its recipients are stored. Batches left over
+        from an interrupted attempt are kept as they are.
+        """
+        expires_at = int(time.time()) + self.ttl
+        batches = split_batches(recipients, batch_size)
+        for index, batch in enumerate(batches):
+            self._put_new({
+                'broadcast_id': batch_key(broadcast_id, index),
+                'pending': set(batch),
+                'attempts': {},
+                'delivered_count': 0,
+                'expires_at': expires_at,
+            }, deadline)
+
+        return self._put_new({
+            'broadcast_id': broadcast_id,
+            'source': source,
+            'text': text,
+            'batch_count': len(batches),
+            'expires_at': expires_at,
+        }, deadline)
+
+    def get(
+            self,
+            broadcast_id: str,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        item = self.dynamodb.get_item(
+            deadline=deadline,
+            Key={'broadcast_id': broadcast_id},
+            ConsistentRead=True,
+        )
+        if item is None:
+            return None
+
+        keys = [
+            batch_key(broadcast_id, index)
+            for index in range(int(item.get('batch_count', 0)))
+        ]
+        batches = {
+            batch['broadcast_id']: batch
+            for batch in self.dynamodb.batch_get(
+                [{'broadcast_id': key} for key in keys],
+                deadline=deadline,
+                ConsistentRead=True,
+            )
+        }
+        item['batches'] = [
+            parse_batch(index, batches[key])
+            for index, key in enumerate(keys) if key in batches
+        ]
+        return item
+
+    def claim(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            lease: float,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        try:
+            response = self.dynamodb.update_item(
+                deadline=deadline,
+                Key={'broadcast_id': batch_key(broadcast_id, index)},
+                UpdateExpression=(
+                    'SET lease_owner = :owner, lease_expires = :expires'
+                ),
+                ConditionExpression=(
+                    'attribute_exists(broadcast_id) AND ('
+                    'attribute_not_exists(lease_expires) '
+                    'OR lease_expires < :now OR lease_owner = :owner)'
+                ),
+                ExpressionAttributeValues={
+                    ':owner': owner,
+                    ':expires': Decimal(str(round(now + lease, 3))),
+                    ':now': Decimal(str(round(now, 3))),
+                },
+                ReturnValues='ALL_NEW',
+            )
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code != 'ConditionalCheckFailedException':
+                raise
+            return None
+
+        return parse_batch(index, response['Attributes'])
+
+    def complete(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            delivered: Set[str],
+            attempts: Dict[str, int],
+            exhausted: Set[str],
+            deadline: Optional[Deadline] = None) -> None:
+        names: Dict[str, str] = {}
+        values: Dict[str, Any] = {':owner': owner}
+        updates: List[str] = []
+        for i, (number, count) in enumerate(sorted(attempts.items())):
+            names[f'#n{i}'] = number
+            values[f':a{i}'] = count
+            updates.append(f'attempts.#n{i} = :a{i}')
+        expression = ['REMOVE lease_owner, lease_expires']
+        if updates:
+            expression.insert(0, f'SET {", ".join(updates)}')
+        if delivered | exhausted:
+            expression.append('DELETE pending :done')
+            values[':done'] = delivered | exhausted
+        added: List[str] = []
+        if delivered:
+            added.append('delivered_count :delivered')
+            values[':delivered'] = len(delivered)
+        if exhausted:
+            added.append('failed :failed')
+            values[':failed'] = set(exhausted)
+        if added:
+            expression.append(f'ADD {", ".join(added)}')
+
+        kwargs: Dict[str, Any] = {
+            'Key': {'broadcast_id': batch_key(broadcast_id, index)},
+            'UpdateExpression': ' '.join(expression),
+            'ConditionExpression': 'lease_owner = :owner',
+            'ExpressionAttributeValues': values,
+        }
+        if names:
+            kwargs['ExpressionAttributeNames'] = names
+        try:
+            self.dynamodb.update_item(deadline=deadline, **kwargs)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code != 'ConditionalCheckFailedException':
+                raise
+            if not delivered:
+                return
+            self.dynamodb.update_item(
+                deadline=deadline,
+                Key={'broadcast_id': batch_key(broadcast_id, index)},
+                UpdateExpression=(
+                    'DELETE pending :delivered ADD delivered_count :n'
+                ),
+                ExpressionAttributeValues={
+                    ':delivered': delivered,
+                    ':n': len(delivered),
+                },
+            )
+
+
+class SQLiteBroadcastRepository(SQLiteRepository, BroadcastRepository):
+    """ Models a broadcast storage in a local SQLite database.
+
+    Recipients are rows of their batch, removed once delivered. Every
+    change of a batch is a single transaction, and expired broadcasts are
+    deleted when a new one is created.
+    """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS broadcast ('
+        'broadcast_id TEXT PRIMARY KEY, '
+        'source TEXT NOT NULL, '
+        'text TEXT NOT NULL, '
+        'batch_count INTEGER NOT NULL, '
+        'expires_at INTEGER NOT NULL'
+        ')',
+        'CREATE TABLE IF NOT EXISTS broadcast_batch ('
+        'broadcast_id TEXT NOT NULL, '
+        'batch_index INTEGER NOT NULL, '
+        'delivered_count INTEGER NOT NULL DEFAULT 0, '
+        'lease_owner TEXT, '
+        'lease_expires REAL, '
+        'PRIMARY KEY (broadcast_id, batch_index)'
+        ') WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS broadcast_recipient ('
+        'broadcast_id TEXT NOT NULL, '
+        'batch_index INTEGER NOT NULL, '
+        'user_number TEXT NOT NULL, '
+        'failed INTEGER NOT NULL DEFAULT 0, '
+        'attempts INTEGER NOT NULL DEFAULT 0, '
+        'PRIMARY KEY (broadcast_id, batch_index, user_number)'
+        ') WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS broadcast_expires '
+        'ON broadcast (expires_at)',
+    )
+
+    def __init__(self, path: str, ttl: int = 7 * 24 * 3600) -> None:
+        super().__init__(path)
+        self.ttl = ttl
+
+    def create(
+            self,
+            broadcast_id: str,
+            source: str,
+            text: str,
+            recipients: Iterable[str],
+            batch_size: int,
+            deadline: Optional[Deadline] = None) -> bool:
+        if deadline:
+            deadline.check()
+        now = int(time.time())
+        batches = split_batches(recipients, batch_size)
+        try:
+            with self.connection as connection:
+                self._delete_expired(connection, now)
+                connection.execute(
+                    'INSERT INTO broadcast (broadcast_id, source, text, '
+                    'batch_count, expires_at) VALUES (?, ?, ?, ?, ?)',
+                    (broadcast_id, source, text, len(batches),
+                     now + self.ttl),
+                )
+                connection.executemany(
+                    'INSERT INTO broadcast_batch (broadcast_id, batch_index) '
+                    'VALUES (?, ?)',
+                    ((broadcast_id, index) for index in range(len(batches))),
+                )
+                connection.executemany(
+                    'INSERT INTO broadcast_recipient '
+                    '(broadcast_id, batch_index, user_number) '
+                    'VALUES (?, ?, ?)',
+                    (
+                        (broadcast_id, index, number)
+                        for index, batch in enumerate(batches)
+                        for number in batch
+                    ),
+                )
+        except sqlite3.IntegrityError:
+            return False
+
+        return True
+
+    def _delete_expired(
+            self,
+            connection: sqlite3.Connection,
+            now: int) -> None:
+        expired = 'SELECT broadcast_id FROM broadcast WHERE expires_at < ?'
+        for table in ('broadcast_recipient', 'broadcast_batch', 'broadcast'):
+            connection.execute(
+                f'DELETE FROM {table} WHERE broadcast_id IN ({expired})',
+                (now,),
+            )
+
+    def _batch(
+            self,
+            connection: sqlite3.Connection,
+            broadcast_id: str,
+            index: int,
+            delivered_count: int) -> Dict[str, Any]:
+        batch: Dict[str, Any] = {
+            'index': index,
+            'pending': set(),
+            'failed': set(),
+            'attempts': {},
+            'delivered_count': delivered_count,
+        }
+        rows = connection.execute(
+            'SELECT user_number, failed, attempts FROM broadcast_recipient '
+            'WHERE broadcast_id = ? AND batch_index = ?',
+            (broadcast_id, index),
+        )
+        for number, failed, attempts in rows:
+            batch['failed' if failed else 'pending'].add(number)
+            if attempts:
+                batch['attempts'][number] = attempts
+        return batch
+
+    def get(
+            self,
+            broadcast_id: str,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        if deadline:
+            deadline.check()
+        connection = self.connection
+        row = connection.execute(
+            'SELECT source, text, batch_count, expires_at FROM broadcast '
+            'WHERE broadcast_id = ?',
+            (broadcast_id,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        source, text, batch_count, expires_at = row
+        batches = connection.execute(
+            'SELECT batch_index, delivered_count FROM broadcast_batch '
+            'WHERE broadcast_id = ? ORDER BY batch_index',
+            (broadcast_id,),
+        ).fetchall()
+        return {
+            'broadcast_id': broadcast_id,
+            'source': source,
+            'text': text,
+            'batch_count': batch_count,
+            'expires_at': expires_at,
+            'batches': [
+                self._batch(connection, broadcast_id, index, delivered_count)
+                for index, delivered_count in batches
+            ],
+        }
+
+    def claim(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            lease: float,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        if deadline:
+            deadline.check()
+        now = time.time()
+        with self.connection as connection:
+            cursor = connection.execute(
+                'UPDATE broadcast_batch '
+                'SET lease_owner = ?, lease_expires = ? '
+                'WHERE broadcast_id = ? AND batch_index = ? AND ('
+                'lease_expires IS NULL OR lease_expires < ? '
+                'OR lease_owner = ?)',
+                (owner, now + lease, broadcast_id, index, now, owner),
+            )
+            if not cursor.rowcount:
+                return None
+            delivered_count, = connection.execute(
+                'SELECT delivered_count FROM broadcast_batch '
+                'WHERE broadcast_id = ? AND batch_index = ?',
+                (broadcast_id, index),
+            ).fetchone()
+            return self._batch(
+                connection, broadcast_id, index, delivered_count)
+
+    def complete(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            delivered: Set[str],
+            attempts: Dict[str, int],
+            exhausted: Set[str],
+            deadline: Optional[Deadline] = None) -> None:
+        if deadline:
+            deadline.check()
+        key = (broadcast_id, index)
+        with self.connection as connection:
+            removed = connection.executemany(
+                'DELETE FROM broadcast_recipient WHERE broadcast_id = ? '
+                'AND batch_index = ? AND user_number = ? AND failed = 0',
+                ((*key, number) for number in delivered),
+            ).rowcount
+            owned = connection.execute(
+                'UPDATE broadcast_batch SET '
+                'delivered_count = delivered_count + ?, '
+                'lease_owner = NULL, lease_expires = NULL '
+                'WHERE broadcast_id = ? AND batch_index = ? '
+                'AND lease_owner = ?',
+                (max(0, removed), *key, owner),
+            ).rowcount
+            if not owned:
+                connection.execute(
+                    'UPDATE broadcast_batch SET '
+                    'delivered_count = delivered_count + ? '
+                    'WHERE broadcast_id = ? AND batch_index = ?',
+                    (max(0, removed), *key),
+                )
+                return
+
+            connection.executemany(
+                'UPDATE broadcast_recipient SET attempts = ? '
+                'WHERE broadcast_id = ? AND batch_index = ? '
+                'AND user_number = ?',
+                ((count, *key, number) for number, count in attempts.items()),
+            )
+            connection.executemany(
+                'UPDATE broadcast_recipient SET failed = 1 '
+                'WHERE broadcast_id = ? AND batch_index = ? '
+                'AND user_number = ?',
+                ((*key, number) for number in exhausted - delivered),
+            )
+
+
+def create_broadcast_repository(
+        config: 'Configuration') -> BroadcastRepository:
+    """ Returns a broadcast repository of the configured backend. """
+    if check_backend(config) == 'dynamodb':
+        return DynamoDBBroadcastRepository(
+            dynamodb_table('broadcast'),
+            implementation=config.dynamodb.implementation,
+        )
+    return SQLiteBroadcastRepository(config.storage.sqlite_path)
+
+
+def batch_key(broadcast_id: str, index: int) -> str:
+    return f'{broadcast_id}#batch#{index}'
+
+
+def split_batches(
+        recipients: Iterable[str],
+        batch_size: int) -> List[List[str]]:
+    """ Splits unique recipients into sorted batches. """
+    numbers = sorted(set(recipients))
+    return [
+        numbers[start:start + batch_size]
+        for start in range(0, len(numbers), max(1, batch_size))
+    ]
+
+
+def parse_batch(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    """ Returns a stored batch with plain Python values. """
+    return {
+        'index': index,
+        'pending': set(item.get('pending', set())),
+        'failed': set(item.get('failed', set())),
+        'attempts': {
+            number: int(count)
+            for number, count in item.get('attempts', {}).items()
+        },
+        'delivered_count': int(item.get('delivered_count', 0)),
+    }
@@ -1,42 +1,51 @@
 import logging
+import threading
 from functools import wraps
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, List, Tuple
 
 import boto3
 
 
+if TYPE_CHECKING:
+    from bridge.configuration import Configuration
+
+
 log = logging.getLogger(__name__)
 
 
 class S3Service:
     """ Models a S3 service client. """
 
-    def __init__(self, conf: Dict[str, Any]) -> None:
-        self.conf = dict(conf)
+    def __init__(self, conf: 'Configuration') -> None:
+        self.conf = conf
         self.session = boto3.Session()
+        self._lock = threading.Lock()
 
     @property
     def client(self):
-        ret = self.session.client('s3')
-        return ret
+        with self._lock:
+            if not hasattr(self, '_client'):
+                self._client = self.session.client('s3')
+        return self._client
 
 
 def cache_connection(func):
-    connection = None
+    """ Caches a created service per settings, compared by equality. """
+    connections: List[Tuple[Any, Any]] = []
+    lock = threading.Lock()
 
     @wraps(func)
     def _create(settings):
-        nonlocal connection
-        ret = None
-        if connection:
-            ret = connection
-        else:
-            ret = func(settings)
-            connection = ret
-        return ret
+        with lock:
+            for known, connection in connections:
+                if known == settings:
+                    return connection
+            connection = func(settings)
+            connections.append((settings, connection))
+            return connection
     return _create
 
 
 @cache_connection
-def create_s3_service(conf: Dict[str, Any]) -> S3Service:
+def create_s3_service(conf: 'Configuration') -> S3Service:
     return S3Service(conf)
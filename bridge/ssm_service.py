@@ -0,0 +1,72 @@
+""" SSM Parameter Store AWS service. """
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+import boto3  # type: ignore
+
+from bridge.cache import TTLCache
+from bridge.s3_service import cache_connection
+
+
+if TYPE_CHECKING:
+    from bridge.configuration import SSMConfig
+
+
+log = logging.getLogger(__name__)
+
+GET_PARAMETERS_BATCH_SIZE = 10
+
+
+class ParameterNotFoundError(KeyError):
+    """ Models an error for missing SSM parameters. """
+
+
+class SSMService:
+    """ Models a SSM Parameter Store client with cached parameters. """
+
+    def __init__(self, conf: 'SSMConfig') -> None:
+        self.conf = conf
+        self.session = boto3.Session()
+        self._lock = threading.Lock()
+        self.cache: TTLCache[str] = TTLCache(ttl=conf.cache_ttl)
+
+    @property
+    def client(self):
+        with self._lock:
+            if not hasattr(self, '_client'):
+                self._client = self.session.client(
+                    'ssm',
+                    endpoint_url=self.conf.endpoint_url or None,
+                )
+        return self._client
+
+    def get_parameters(self, names: Iterable[str]) -> Dict[str, str]:
+        """ Returns decrypted values, fetching uncached ones in batches. """
+        ret: Dict[str, str] = {}
+        missing: List[str] = []
+        for name in dict.fromkeys(names):
+            value = self.cache.get(name)
+            if value is None:
+                missing.append(name)
+            else:
+                ret[name] = value
+
+        for start in range(0, len(missing), GET_PARAMETERS_BATCH_SIZE):
+            batch = missing[start:start + GET_PARAMETERS_BATCH_SIZE]
+            log.info(f'fetching {len(batch)} SSM parameters')
+            response = self.client.get_parameters(
+                Names=batch, WithDecryption=True)
+            if response.get('InvalidParameters'):
+                raise ParameterNotFoundError(
+                    f'unknown SSM parameters {response["InvalidParameters"]}')
+            for parameter in response['Parameters']:
+                self.cache.set(parameter['Name'], parameter['Value'])
+                ret[parameter['Name']] = parameter['Value']
+
+        return ret
+
+
+@cache_connection
+def create_ssm_service(conf: 'SSMConfig') -> SSMService:
+    return SSMService(conf)
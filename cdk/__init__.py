@@ -1,6 +1,9 @@
+from typing import Dict
+
 from aws_cdk import aws_apigateway, aws_dynamodb, aws_lambda, aws_s3, core
 
 from cdk.lambda_function import SMSTelegramBridgeLambdaFunction
+from performance import architectures, docker_platform, load_profile
 
 
 class SMSTelegramBridgeStack(core.Stack):
@@ -15,7 +18,7 @@ class SMSTelegramBridgeStack(core.Stack):
 
         self.stage = stage
         self.create_dynamodb_table()
-        self.create_lambda_dependency_layer()
+        self.create_lambda_dependency_layers()
         self.config_bucket = aws_s3.Bucket.from_bucket_name(
             self, 'ConfigBucket',
             'smartcat-sms-bridge-config',
@@ -25,47 +28,66 @@ class SMSTelegramBridgeStack(core.Stack):
             self, 'SMSTelegramBridgeApi',
             rest_api_name=self.get_full_name('SMSTelegramBridgeApi'),
         )
+        telegram_profile = load_profile(stage, 'telegram')
         SMSTelegramBridgeLambdaFunction(
             self, 'TelegramLambdaFunction',
             function_name=self.get_full_name('TelegramReceiverLambdaFunction'),
             handler='aws_lambda.receive_telegram.handler',
             config_bucket=self.config_bucket,
             state_table=self.state_table,
-            dependency_layer=self.dependency_layer,
+            broadcast_table=self.broadcast_table,
+            subscription_table=self.subscription_table,
+            dependency_layer=self.dependency_layers[
+                telegram_profile['architecture']],
             api=api,
             endpoint='telegram',
+            profile=telegram_profile,
         )
+        twilio_profile = load_profile(stage, 'twilio')
         SMSTelegramBridgeLambdaFunction(
             self, 'TwilioReceiverLambdaFunction',
             function_name=self.get_full_name('TwilioReceiverLambdaFunction'),
             handler='aws_lambda.receive_twilio.handler',
             config_bucket=self.config_bucket,
             state_table=self.state_table,
-            dependency_layer=self.dependency_layer,
+            broadcast_table=self.broadcast_table,
+            subscription_table=self.subscription_table,
+            dependency_layer=self.dependency_layers[
+                twilio_profile['architecture']],
             api=api,
             endpoint='twilio',
+            profile=twilio_profile,
         )
 
     def get_full_name(self, name) -> str:
         return f'{name}-{self.stage}'
 
-    def create_lambda_dependency_layer(self) -> None:
-        dependency_asset = aws_lambda.Code.from_asset(
-            path='./',
-            bundling=core.BundlingOptions(
-                image=core.BundlingDockerImage.from_asset('./')
+    def create_lambda_dependency_layers(self) -> None:
+        """ Creates a dependency layer per architecture of the stage. """
+        self.dependency_layers: Dict[str, aws_lambda.LayerVersion] = {}
+        for architecture in architectures(self.stage):
+            platform = docker_platform(architecture)
+            dependency_asset = aws_lambda.Code.from_asset(
+                path='./',
+                bundling=core.BundlingOptions(
+                    image=core.BundlingDockerImage.from_asset(
+                        './', build_args={'PLATFORM': platform}),
+                )
             )
-        )
-        self.dependency_layer = aws_lambda.LayerVersion(
-            self, 'DependencyLayer',
-            code=dependency_asset,
-            compatible_runtimes=[
-                aws_lambda.Runtime.PYTHON_3_6,
-                aws_lambda.Runtime.PYTHON_3_7,
-                aws_lambda.Runtime.PYTHON_3_8,
-            ],
-            description='A layer containing all Python dependencies',
-        )
+            layer = aws_lambda.LayerVersion(
+                self, f'DependencyLayer-{architecture}',
+                code=dependency_asset,
+                compatible_runtimes=[
+                    aws_lambda.Runtime.PYTHON_3_6,
+                    aws_lambda.Runtime.PYTHON_3_7,
+                    aws_lambda.Runtime.PYTHON_3_8,
+                ],
+                description='A layer containing all Python dependencies',
+            )
+            # Architectures are not exposed by this CDK version
+            layer.node.default_child.add_property_override(
+                'CompatibleArchitectures', [architecture])
+            self.dependency_layers[architecture] = layer
 
     def create_dynamodb_table(self) -> None:
         self.state_table = aws_dynamodb.Table(
@@ -77,3 +99,26 @@ class SMSTelegramBridgeStack(core.Stack):
             ),
             billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
         )
+        self.subscription_table = aws_dynamodb.Table(
+            self, 'SMSTelegramBridgeSubscriptionTable',
+            table_name=self.get_full_name('sms-bridge-subscription'),
+            partition_key=aws_dynamodb.Attribute(
+                name='building',
+                type=aws_dynamodb.AttributeType.STRING,
+            ),
+            sort_key=aws_dynamodb.Attribute(
+                name='user_number',
+                type=aws_dynamodb.AttributeType.STRING,
+            ),
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        )
+        self.broadcast_table = aws_dynamodb.Table(
+            self, 'SMSTelegramBridgeBroadcastTable',
+            table_name=self.get_full_name('sms-bridge-broadcast'),
+            partition_key=aws_dynamodb.Attribute(
+                name='broadcast_id',
+                type=aws_dynamodb.AttributeType.STRING,
+            ),
+            time_to_live_attribute='expires_at',
+            billing_mode=aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        )
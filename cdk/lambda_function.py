@@ -1,7 +1,14 @@
 import os
-from typing import List
+from typing import Any, Dict, List
 
-from aws_cdk import aws_apigateway, aws_dynamodb, aws_lambda, aws_s3, core
+from aws_cdk import (
+    aws_apigateway,
+    aws_dynamodb,
+    aws_iam,
+    aws_lambda,
+    aws_s3,
+    core,
+)
 
 
 def get_lambda_exclude_list() -> List[str]:
@@ -28,15 +35,20 @@ class SMSTelegramBridgeLambdaFunction(core.Construct):
         handler: str,
         config_bucket: aws_s3.Bucket,
         state_table: aws_dynamodb.Table,
+        broadcast_table: aws_dynamodb.Table,
+        subscription_table: aws_dynamodb.Table,
         dependency_layer: aws_lambda.LayerVersion,
         api: aws_apigateway.RestApi,
         endpoint: str,
+        profile: Dict[str, Any],
     ) -> None:
         super().__init__(scope, id)
         environment = {
             'bridge_env': 'PROD',
             'bridge_config': f's3://{config_bucket.bucket_name}/bridge.json',
             'state_dynamodb_table': state_table.table_name,
+            'broadcast_dynamodb_table': broadcast_table.table_name,
+            'subscription_dynamodb_table': subscription_table.table_name,
         }
         self.function = aws_lambda.Function(
             self, function_name,
@@ -45,13 +57,51 @@ class SMSTelegramBridgeLambdaFunction(core.Construct):
             layers=[dependency_layer],
             code=code_asset,
             handler=handler,
-            timeout=core.Duration.seconds(30),
+            memory_size=profile['memory_size'],
+            timeout=core.Duration.seconds(profile['timeout']),
+            reserved_concurrent_executions=profile['reserved_concurrency'],
             retry_attempts=0,
             environment=environment,
         )
+        # Architectures are not exposed by this CDK version
+        self.function.node.default_child.add_property_override(
+            'Architectures', [profile['architecture']])
+        self.alias = self.create_alias(profile)
         function_resource = api.root.add_resource(endpoint)
         function_resource.add_method('POST', aws_apigateway.LambdaIntegration(
-            handler=self.function,
+            handler=self.alias,
         ))
         config_bucket.grant_read(self.function)
-        state_table.grant_write_data(self.function)
+        config_bucket.grant_put(self.function, 'profiles/*')
+        config_bucket.grant_put(self.function, 'media/*')
+        state_table.grant_read_write_data(self.function)
+        broadcast_table.grant_read_write_data(self.function)
+        subscription_table.grant_read_write_data(self.function)
+        self.function.add_to_role_policy(aws_iam.PolicyStatement(
+            actions=['ssm:GetParameters'],
+            resources=[core.Stack.of(self).format_arn(
+                service='ssm',
+                resource='parameter',
+                resource_name='sms-bridge/*',
+            )],
+        ))
+
+    def create_alias(self, profile: Dict[str, Any]) -> aws_lambda.Alias:
+        """ Creates a live alias with provisioned concurrency. """
+        alias = aws_lambda.Alias(
+            self, 'LiveAlias',
+            alias_name='live',
+            version=self.function.current_version,
+            provisioned_concurrent_executions=(
+                profile['provisioned_concurrency'] or None),
+        )
+        autoscaling = profile['autoscaling']
+        if autoscaling:
+            alias.add_auto_scaling(
+                min_capacity=autoscaling['min_capacity'],
+                max_capacity=autoscaling['max_capacity'],
+            ).scale_on_utilization(
+                utilization_target=autoscaling['utilization_target'],
+            )
+
+        return alias
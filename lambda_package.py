@@ -0,0 +1,165 @@
+""" Optimizes a Lambda dependency package for cold starts.
+
+The package is pruned of files never imported at runtime and all modules
+are precompiled to bytecode by the interpreter running this script, which
+has to match the target Lambda runtime. Bytecode is compiled with
+unchecked hashes, so it stays valid in reproducible zips with normalised
+timestamps and is never recompiled on a read-only Lambda file system.
+boto3 is not part of the package, the Lambda runtime provides it.
+
+Usage:
+    python lambda_package.py optimize <package_dir>
+    python lambda_package.py benchmark <requirements_file> [module ...]
+"""
+import argparse
+import compileall
+import json
+import os
+import py_compile
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+
+PRUNED_DIRS = set([
+    '__pycache__',
+    'doc',
+    'docs',
+    'example',
+    'examples',
+    'test',
+    'tests',
+    'testing',
+])
+PRUNED_SUFFIXES = (
+    '.c',
+    '.cpp',
+    '.exe',
+    '.h',
+    '.md',
+    '.pyi',
+    '.pyx',
+    '.rst',
+)
+BENCHMARK_MODULES = ['requests', 'twilio.rest']
+
+
+def package_stats(root: str) -> Dict[str, int]:
+    """ Returns a total size, file count and module count of a package. """
+    stats = {'size': 0, 'files': 0, 'modules': 0, 'bytecode': 0}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            stats['size'] += os.path.getsize(os.path.join(dirpath, filename))
+            stats['files'] += 1
+            if filename.endswith('.py'):
+                stats['modules'] += 1
+            elif filename.endswith('.pyc'):
+                stats['bytecode'] += 1
+    return stats
+
+
+def prune(root: str) -> None:
+    """ Removes tests, docs, sources of extensions and stale bytecode. """
+    shutil.rmtree(os.path.join(root, 'bin'), ignore_errors=True)
+    for dirpath, dirnames, filenames in os.walk(root):
+        for dirname in list(dirnames):
+            if dirname in PRUNED_DIRS:
+                shutil.rmtree(os.path.join(dirpath, dirname))
+                dirnames.remove(dirname)
+        for filename in filenames:
+            if filename.endswith(PRUNED_SUFFIXES):
+                os.remove(os.path.join(dirpath, filename))
+
+
+def compile_bytecode(root: str) -> None:
+    """ Precompiles all modules with the running interpreter. """
+    compiled = compileall.compile_dir(
+        root,
+        quiet=1,
+        workers=0,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+    if not compiled:
+        print('some modules failed to compile', file=sys.stderr)
+
+
+def optimize(root: str) -> Dict[str, Any]:
+    """ Optimizes a package in place and returns a size report. """
+    before = package_stats(root)
+    prune(root)
+    compile_bytecode(root)
+    after = package_stats(root)
+    return {
+        'python': sys.version.split()[0],
+        'before': before,
+        'after': after,
+    }
+
+
+def import_time(root: str, modules: List[str], runs: int) -> float:
+    """ Returns a median import time of modules in fresh interpreters. """
+    code = (
+        'import time; start = time.perf_counter(); '
+        + '; '.join(f'import {module}' for module in modules)
+        + '; print(time.perf_counter() - start)'
+    )
+    env = dict(os.environ, PYTHONPATH=root, PYTHONDONTWRITEBYTECODE='1')
+    timings = [
+        float(subprocess.check_output(
+            [sys.executable, '-S', '-c', code], env=env))
+        for _ in range(runs)
+    ]
+    return statistics.median(timings)
+
+
+def benchmark(
+        requirements: str,
+        modules: List[str],
+        runs: int) -> Dict[str, Any]:
+    """ Compares import times of a fresh install and its optimized copy.
+
+    The baseline is installed from the requirements file without bytecode,
+    the way pip leaves it before the optimize step runs.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        baseline = os.path.join(tmp_dir, 'baseline')
+        optimized = os.path.join(tmp_dir, 'optimized')
+        subprocess.check_call(
+            [sys.executable, '-m', 'pip', 'install', '--quiet',
+             '--no-compile', '-t', baseline, '-r', requirements],
+            stdout=sys.stderr,
+        )
+        shutil.copytree(baseline, optimized)
+        report = optimize(optimized)
+        report['modules'] = modules
+        report['import_seconds'] = {
+            'before': import_time(baseline, modules, runs),
+            'after': import_time(optimized, modules, runs),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('command', choices=['optimize', 'benchmark'])
+    parser.add_argument(
+        'path', help='package dir to optimize or requirements to benchmark')
+    parser.add_argument('modules', nargs='*', default=BENCHMARK_MODULES)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'optimize':
+        report = optimize(args.path)
+    else:
+        report = benchmark(args.path, args.modules, args.runs)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
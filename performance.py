@@ -0,0 +1,56 @@
+""" Per stage Lambda function profiles of performance.json.
+
+Shared by the CDK and cdktf apps and the layer build, the profile file is
+found next to this module, whatever the working directory.
+
+Usage:
+    python performance.py [stage]
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+
+PROFILE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'performance.json',
+)
+DEFAULT_STAGE = 'dev'
+# Docker platforms installing dependencies for each Lambda architecture
+DOCKER_PLATFORMS = {
+    'x86_64': 'linux/amd64',
+    'arm64': 'linux/arm64',
+}
+
+
+def load_profiles(stage: str) -> Dict[str, Dict[str, Any]]:
+    """ Returns the function performance profiles of a stage. """
+    with open(PROFILE_FILE) as f:
+        profiles = json.load(f)
+
+    return profiles.get(stage, profiles[DEFAULT_STAGE])
+
+
+def load_profile(stage: str, function: str) -> Dict[str, Any]:
+    """ Returns a function performance profile of a stage. """
+    return load_profiles(stage)[function]
+
+
+def architectures(stage: str) -> List[str]:
+    """ Returns the architectures of the functions of a stage. """
+    return sorted(set(
+        profile['architecture'] for profile in load_profiles(stage).values()
+    ))
+
+
+def docker_platform(architecture: str) -> str:
+    """ Returns the Docker platform building a layer for an architecture. """
+    return DOCKER_PLATFORMS[architecture]
+
+
+if __name__ == '__main__':
+    # Prints an architecture and Docker platform per line for make layer
+    for architecture in architectures(
+            sys.argv[1] if len(sys.argv) > 1 else DEFAULT_STAGE):
+        print(architecture, docker_platform(architecture))
@@ -0,0 +1,274 @@
+""" Long-running HTTP server serving the bridge Lambda handlers. """
+import argparse
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from bridge.profiling import SAMPLE_RATE_ENV
+
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any], Any], Dict[str, Any]]
+
+ROUTES = {
+    '/telegram': 'aws_lambda.receive_telegram',
+    '/twilio': 'aws_lambda.receive_twilio',
+}
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class BadRequestError(Exception):
+    """ Models an error for a malformed HTTP request. """
+
+
+class InvocationContext:
+    """ Models a Lambda-like context with a fixed time budget. """
+
+    def __init__(self, timeout: float) -> None:
+        self.expires_at = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.expires_at - time.monotonic()) * 1000))
+
+
+class BridgeServer:
+    """ Models an asyncio HTTP server dispatching to the Lambda handlers. """
+
+    def __init__(self, timeout: float, threads: int) -> None:
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        # The profiling thread hook is process wide and would mix the
+        # concurrent invocations of the server, so sampling is Lambda-only
+        os.environ[SAMPLE_RATE_ENV] = '0'
+        self.handlers: Dict[str, Handler] = {
+            path: importlib.import_module(module).handler  # type: ignore
+            for path, module in ROUTES.items()
+        }
+        self.in_flight: Set['asyncio.Task[Any]'] = set()
+        self.idle: Set[asyncio.StreamWriter] = set()
+        self.stopping = False
+
+    async def read_request(
+            self,
+            reader: asyncio.StreamReader,
+    ) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise BadRequestError('malformed request line')
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', '0'))
+        if length > MAX_BODY_SIZE:
+            raise BadRequestError('request body too large')
+        body = await reader.readexactly(length) if length else b''
+        return method, path.split('?', 1)[0], headers, body
+
+    def invoke(
+            self,
+            handler: Handler,
+            path: str,
+            headers: Dict[str, str],
+            body: bytes) -> Dict[str, Any]:
+        event = {
+            'httpMethod': 'POST',
+            'path': path,
+            'headers': headers,
+            'body': body.decode('UTF-8'),
+            'isBase64Encoded': False,
+        }
+        return handler(event, InvocationContext(self.timeout))
+
+    async def dispatch(
+            self,
+            method: str,
+            path: str,
+            headers: Dict[str, str],
+            body: bytes) -> Dict[str, Any]:
+        handler = self.handlers.get(path)
+        if handler is None:
+            return {'statusCode': HTTPStatus.NOT_FOUND, 'body': ''}
+        if method != 'POST':
+            return {'statusCode': HTTPStatus.METHOD_NOT_ALLOWED, 'body': ''}
+
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(
+                self.executor, self.invoke, handler, path, headers, body)
+        except Exception:
+            log.exception(f'handler for {path} failed')
+            return {'statusCode': HTTPStatus.BAD_GATEWAY, 'body': ''}
+
+    async def write_response(
+            self,
+            writer: asyncio.StreamWriter,
+            response: Dict[str, Any],
+            keep_alive: bool) -> None:
+        try:
+            status = HTTPStatus(int(response.get('statusCode', 200)))
+        except (TypeError, ValueError):
+            log.error(f'invalid status code {response.get("statusCode")!r}')
+            status, response = HTTPStatus.BAD_GATEWAY, {}
+        body = (response.get('body') or '').encode('UTF-8')
+        headers = dict(response.get('headers') or {})
+        headers['Content-Length'] = str(len(body))
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        lines: List[str] = [f'HTTP/1.1 {status.value} {status.phrase}']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+    async def handle_connection(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter) -> None:
+        try:
+            while not self.stopping:
+                self.idle.add(writer)
+                try:
+                    request = await self.read_request(reader)
+                except (BadRequestError, ValueError) as e:
+                    log.warning(f'bad request: {e}')
+                    await self.write_response(writer, {
+                        'statusCode': HTTPStatus.BAD_REQUEST,
+                    }, keep_alive=False)
+                    break
+                finally:
+                    self.idle.discard(writer)
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                task = asyncio.ensure_future(
+                    self.dispatch(method, path, headers, body))
+                self.in_flight.add(task)
+                try:
+                    response = await task
+                finally:
+                    self.in_flight.discard(task)
+
+                keep_alive = (
+                    headers.get('connection', '').lower() != 'close'
+                    and not self.stopping
+                )
+                await self.write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, sock: socket.socket) -> None:
+        loop = asyncio.get_event_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+
+        server = await asyncio.start_server(self.handle_connection, sock=sock)
+        log.info(f'worker {os.getpid()} serving on {sock.getsockname()}')
+        await stop.wait()
+
+        log.info(f'worker {os.getpid()} shutting down')
+        await self.shutdown(server)
+
+    async def shutdown(self, server: asyncio.AbstractServer) -> None:
+        """ Stops accepting, finishes requests, then closes connections.
+
+        Idle keep-alive connections are closed only after the requests in
+        flight are answered, since wait_closed waits for every connection
+        from Python 3.12.1 on.
+        """
+        self.stopping = True
+        server.close()
+        if self.in_flight:
+            await asyncio.wait(self.in_flight, timeout=self.timeout)
+        for writer in list(self.idle):
+            writer.close()
+        await server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(sock: socket.socket, timeout: float, threads: int) -> None:
+    """ Runs a server in the current process until it is signalled. """
+    server = BridgeServer(timeout, threads)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(server.serve(sock))
+    finally:
+        loop.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument(
+        '--port', type=int, default=int(os.environ.get('PORT', 8080)))
+    parser.add_argument(
+        '--workers', type=int, default=int(os.environ.get('WORKERS', 1)),
+        help='number of worker processes')
+    parser.add_argument(
+        '--threads', type=int, default=int(os.environ.get('THREADS', 16)),
+        help='number of handler threads per worker')
+    parser.add_argument(
+        '--timeout', type=float, default=30,
+        help='time budget of a single request in seconds')
+    args = parser.parse_args()
+
+    sock = create_socket(args.host, args.port)
+    if args.workers <= 1:
+        run_worker(sock, args.timeout, args.threads)
+        return
+
+    context = multiprocessing.get_context('fork')
+    workers = [
+        context.Process(
+            target=run_worker, args=(sock, args.timeout, args.threads))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def terminate(signum: int, frame: Any) -> None:
+        for worker in workers:
+            if worker.pid:
+                os.kill(worker.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import importlib
+import json
+import sys
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pytest
+from requests import Response
+
+from bridge.configuration import Configuration, StorageConfig, TelegramConfig
+from bridge.deadline import Deadline
+from bridge.providers import (
+    DeliveryError,
+    Message,
+    MessageProvider,
+    Providers,
+    TelegramMessageProvider,
+)
+from bridge.s3_service import S3Service
+
+
+class RecordingProvider(MessageProvider):
+    """ Models a provider recording sends, rejecting failing recipients. """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.provider = Providers.TELEGRAM
+        self.max_workers = max_workers
+        self.failing: Set[str] = set()
+        self.sent: List[Message] = []
+        self._lock = threading.Lock()
+
+    def send_message(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> None:
+        if message.destination in self.failing:
+            raise DeliveryError('rejected', 400)
+        with self._lock:
+            self.sent.append(message)
+
+    def parse_message(self, raw_message: Any) -> Message:
+        return Message(**json.loads(raw_message))
+
+    @property
+    def destinations(self) -> List[str]:
+        return sorted(message.destination for message in self.sent)
+
+
+class RecordingS3(S3Service):
+    """ Models an S3 service keeping uploaded objects in memory. """
+
+    def __init__(self) -> None:
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+
+    @property
+    def client(self) -> 'RecordingS3':
+        return self
+
+    def put_object(self, **kwargs: Any) -> None:
+        self.objects[(kwargs['Bucket'], kwargs['Key'])] = kwargs['Body']
+
+    def generate_presigned_url(
+            self,
+            operation: str,
+            Params: Dict[str, str],
+            ExpiresIn: int) -> str:
+        return (
+            f'https://{Params["Bucket"]}.s3.amazonaws.com/{Params["Key"]}'
+            f'?Expires={ExpiresIn}'
+        )
+
+
+class MemoryTelegramProvider(TelegramMessageProvider):
+    """ Models a Telegram provider downloading files from memory. """
+
+    def __init__(self, s3: S3Service) -> None:
+        super().__init__(TelegramConfig(
+            token='secret', media_output='s3://bucket/media').derive(), s3)
+        self.downloads: List[str] = []
+
+    def download_file(self, file_id: str) -> Tuple[Dict[str, Any], Response]:
+        self.downloads.append(file_id)
+        r = Response()
+        r.status_code = 200
+        r._content = b'image'
+        r.headers['Content-Type'] = 'image/jpeg'
+        result = {'file_unique_id': f'u{file_id}', 'file_path': 'photos/1.jpg'}
+        return result, r
+
+
+@pytest.fixture
+def provider() -> RecordingProvider:
+    return RecordingProvider()
+
+
+@pytest.fixture
+def s3() -> RecordingS3:
+    return RecordingS3()
+
+
+@pytest.fixture
+def media_provider(s3: RecordingS3) -> MemoryTelegramProvider:
+    return MemoryTelegramProvider(s3)
+
+
+@pytest.fixture
+def sqlite_config(tmp_path: Any) -> Configuration:
+    return Configuration(storage=StorageConfig(
+        backend='sqlite', sqlite_path=str(tmp_path / 'bridge.db')))
+
+
+@pytest.fixture
+def config_file(tmp_path: Any, monkeypatch: Any) -> Any:
+    """ Returns a writer of bridge.json, pointed to by bridge_config. """
+    path = tmp_path / 'bridge.json'
+
+    def write(**overrides: Any) -> Any:
+        data = {
+            'logger_conf': [{'level': 'WARNING'}],
+            'message_providers': {
+                'telegram': {'token': 'test'},
+                'twilio': {'sid': 'ACtest', 'token': 'test', 'number': '+1'},
+            },
+            'storage': {
+                'backend': 'sqlite',
+                'sqlite_path': str(tmp_path / 'bridge.db'),
+            },
+        }
+        data.update(overrides)
+        path.write_text(json.dumps(data))
+        monkeypatch.setenv('bridge_config', str(path))
+        return path
+    return write
+
+
+@pytest.fixture
+def load_handler(config_file: Any) -> Any:
+    """ Returns an importer of a handler module with a fresh config. """
+    loaded: List[str] = []
+
+    def load(name: str, **overrides: Any) -> Any:
+        config_file(**overrides)
+        sys.modules.pop(name, None)
+        loaded.append(name)
+        return importlib.import_module(name)
+
+    yield load
+    for name in loaded:
+        sys.modules.pop(name, None)
@@ -0,0 +1,92 @@
+import pytest
+
+from bridge.broadcast import Broadcaster, UnknownBroadcastError
+from bridge.repository import SQLiteBroadcastRepository
+from tools.stubs import MemoryBroadcastRepository
+
+
+NUMBERS = [str(100 + i) for i in range(7)]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def repository(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBroadcastRepository()
+    return SQLiteBroadcastRepository(str(tmp_path / 'bridge.db'))
+
+
+@pytest.fixture
+def broadcaster(provider, repository):
+    return Broadcaster(provider, repository, checkpoint_size=3, max_attempts=2)
+
+
+def test_start_sends_to_every_recipient_once(broadcaster, provider):
+    result = broadcaster.start('b1', 'src', 'text', NUMBERS + NUMBERS[:2])
+
+    assert result.complete
+    assert provider.destinations == NUMBERS
+    assert [len(batch['pending']) for batch in
+            broadcaster.repository.get('b1')['batches']] == [0, 0, 0]
+
+
+def test_recipients_are_stored_in_batches(broadcaster, repository):
+    assert broadcaster.store('b1', 'src', 'text', NUMBERS)
+    assert not broadcaster.store('b1', 'src', 'other', NUMBERS)
+
+    broadcast = repository.get('b1')
+    assert broadcast['text'] == 'text'
+    assert [sorted(batch['pending']) for batch in broadcast['batches']] == [
+        NUMBERS[0:3], NUMBERS[3:6], NUMBERS[6:]]
+
+
+def test_resume_skips_batches_leased_by_another_sender(
+        broadcaster, provider, repository):
+    broadcaster.store('b1', 'src', 'text', NUMBERS)
+    assert repository.claim('b1', 0, 'other', 60.0) is not None
+
+    result = broadcaster.resume('b1')
+
+    assert result.pending == 3
+    assert provider.destinations == NUMBERS[3:]
+
+
+def test_expired_leases_are_taken_over(broadcaster, provider, repository):
+    broadcaster.store('b1', 'src', 'text', NUMBERS)
+    repository.claim('b1', 0, 'crashed', -1.0)
+
+    assert broadcaster.resume('b1').complete
+    assert provider.destinations == NUMBERS
+
+
+def test_recipients_failing_every_attempt_are_given_up(
+        broadcaster, provider, repository):
+    provider.failing = {NUMBERS[0]}
+    broadcaster.store('b1', 'src', 'text', NUMBERS)
+
+    first = broadcaster.resume('b1')
+    second = broadcaster.resume('b1')
+    third = broadcaster.resume('b1')
+
+    assert (first.pending, first.failed) == (1, 0)
+    assert (second.pending, second.failed) == (0, 1)
+    assert third.results == []
+    assert repository.get('b1')['batches'][0]['failed'] == {NUMBERS[0]}
+
+
+def test_lost_lease_only_removes_delivered(repository):
+    repository.create('b1', 'src', 'text', NUMBERS[:2], 5)
+    repository.claim('b1', 0, 'slow', -1.0)
+    repository.claim('b1', 0, 'fast', 60.0)
+
+    repository.complete(
+        'b1', 0, 'slow', {NUMBERS[0]}, {NUMBERS[1]: 1}, {NUMBERS[1]})
+
+    batch = repository.get('b1')['batches'][0]
+    assert batch['pending'] == {NUMBERS[1]}
+    assert batch['failed'] == set()
+    assert batch['delivered_count'] == 1
+
+
+def test_unknown_broadcasts_raise(broadcaster):
+    with pytest.raises(UnknownBroadcastError):
+        broadcaster.resume('missing')
@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import List, Optional
+
+import pytest
+
+from bridge.coalescing import (
+    CoalescedMessage,
+    Coalescer,
+    MemoryBurstBuffer,
+    SQLiteBurstBuffer,
+)
+from bridge.deadline import Deadline, DeadlineExceededError
+from bridge.providers import Message
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buffer(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBurstBuffer()
+    return SQLiteBurstBuffer(str(tmp_path / 'bridge.db'))
+
+
+def message(i: int) -> Message:
+    return Message(
+        source='+1555', destination='', text=f'text {i}', media=[],
+        message_id=f'SM{i}')
+
+
+def entry(i: int):
+    return {'message_id': f'SM{i}', 'text': f'text {i}', 'media': []}
+
+
+class Store():
+    """ Models a broadcast store recording what it stored. """
+
+    def __init__(self) -> None:
+        self.stored: List[CoalescedMessage] = []
+        self.error: Optional[Exception] = None
+
+    def __call__(self, coalesced, deadline):
+        if self.error:
+            raise self.error
+        self.stored.append(coalesced)
+        return coalesced.message.message_id
+
+
+def test_zero_window_passes_messages_through(buffer):
+    store = Store()
+    ids = Coalescer(buffer, window=0).submit(message(1), store)
+
+    assert ids == ['SM1']
+    assert buffer.peek('+1555') == []
+
+
+def test_leader_merges_messages_of_its_window(buffer):
+    store = Store()
+    coalescer = Coalescer(buffer, window=0.3)
+    leader = threading.Thread(
+        target=lambda: store.stored.append(
+            coalescer.submit(message(1), store)))
+    leader.start()
+    time.sleep(0.1)
+    follower_ids = [coalescer.submit(message(i), store) for i in (2, 3)]
+    leader.join()
+
+    assert follower_ids == [[], []]
+    merged = store.stored[0]
+    assert merged.merged == 3
+    assert merged.message.message_id == 'SM1+3'
+    assert merged.message.text == 'text 1\n\ntext 2\n\ntext 3'
+    assert buffer.peek('+1555') == []
+
+
+def test_failed_store_keeps_entries_and_reopens_the_window(buffer):
+    store = Store()
+    store.error = DeadlineExceededError()
+    coalescer = Coalescer(buffer, window=0.01)
+
+    with pytest.raises(DeadlineExceededError):
+        coalescer.submit(message(1), store)
+    assert buffer.peek('+1555') == [entry(1)]
+
+    store.error = None
+    assert coalescer.submit(message(1), store) == ['SM1']
+    assert store.stored[0].merged == 1
+    assert buffer.peek('+1555') == []
+
+
+def test_release_keeps_entries_appended_after_peek(buffer):
+    assert buffer.append('+1555', entry(1)) is None
+    entries = buffer.peek('+1555')
+    assert buffer.append('+1555', entry(2)) is not None
+    buffer.release('+1555', len(entries))
+
+    assert buffer.peek('+1555') == [entry(2)]
+    buffer.release('+1555', 1)
+    assert buffer.append('+1555', entry(3)) is None
+
+
+def test_leader_leaves_the_reserve_of_its_budget(buffer):
+    store = Store()
+    coalescer = Coalescer(buffer, window=10, reserve=1)
+    start = time.monotonic()
+    coalescer.submit(message(1), store, Deadline(time.monotonic() + 1.2))
+
+    assert time.monotonic() - start < 1
+    assert len(store.stored) == 1
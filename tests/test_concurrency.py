@@ -0,0 +1,46 @@
+import time
+
+from bridge.concurrency import AdaptiveLimiter, Outcome
+from bridge.deadline import Deadline
+
+
+def run(limiter: AdaptiveLimiter, outcome: Outcome) -> None:
+    assert limiter.acquire(Deadline())
+    limiter.release(time.monotonic(), outcome)
+
+
+def test_successes_raise_the_limit_up_to_the_maximum():
+    limiter = AdaptiveLimiter('test', max_limit=6, initial_limit=2)
+    for _ in range(100):
+        run(limiter, Outcome.SUCCESS)
+
+    assert limiter.metrics()['limit'] == 6
+
+
+def test_throttling_cuts_the_limit_once_per_round():
+    limiter = AdaptiveLimiter('test', max_limit=20, initial_limit=8)
+    started = time.monotonic()
+    for _ in range(3):
+        assert limiter.acquire(Deadline())
+    for _ in range(3):
+        limiter.release(started, Outcome.THROTTLED)
+
+    metrics = limiter.metrics()
+    assert metrics['limit'] == 4
+    assert metrics['decreases'] == 1
+    assert metrics['throttled'] == 3
+
+
+def test_ignored_outcomes_keep_the_limit():
+    limiter = AdaptiveLimiter('test', max_limit=20, initial_limit=8)
+    run(limiter, Outcome.IGNORED)
+
+    assert limiter.metrics()['limit'] == 8
+    assert limiter.metrics()['in_flight'] == 0
+
+
+def test_acquire_gives_up_at_the_deadline():
+    limiter = AdaptiveLimiter('test', max_limit=1, initial_limit=1)
+    assert limiter.acquire(Deadline())
+
+    assert not limiter.acquire(Deadline(time.monotonic() + 0.05))
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from bridge.configuration import (
+    ConfigurationError,
+    load_config,
+    merge_documents,
+    parse_config,
+)
+
+
+def test_missing_keys_use_defaults():
+    config = parse_config({'message_providers': {'telegram': {'token': 'T'}}})
+
+    assert config.deadline_margin == 2.0
+    assert config.storage.backend == 'dynamodb'
+    assert config.message_providers.telegram.bot_url == \
+        'https://api.telegram.org/botT'
+
+
+@pytest.mark.parametrize('data, error', [
+    ({'unknown': 1}, 'unknown keys'),
+    ({'message_providers': {'telegram': {'bot_url': 'x'}}}, 'unknown keys'),
+    ({'deadline_margin': 'soon'}, 'expected float'),
+    ({'broadcast_max_attempts': True}, 'expected int'),
+    ({'dispatch': {'admin_chat_ids': '1'}}, 'expected a list'),
+])
+def test_invalid_documents_are_rejected(data, error):
+    with pytest.raises(ConfigurationError, match=error):
+        parse_config(data)
+
+
+@pytest.mark.parametrize('data, error', [
+    ({'broadcast_checkpoint_size': 0}, r'broadcast_checkpoint_size: .* 0'),
+    ({'message_providers': {'telegram': {'max_workers': 0}}},
+     r'message_providers\.telegram\.max_workers'),
+    ({'message_providers': {'twilio': {'timeout': 0}}},
+     r'message_providers\.twilio\.timeout'),
+    ({'message_providers': {'twilio': {'concurrency': {'backoff': 1.5}}}},
+     r'twilio\.concurrency\.backoff'),
+    ({'coalescing': {'window': -1}}, r'coalescing\.window'),
+    ({'profiling': {'sample_rate': 2}}, r'profiling\.sample_rate'),
+    ({'storage': {'backend': 'postgres'}},
+     r"storage\.backend: expected one of \['dynamodb', 'sqlite'\]"),
+    ({'dynamodb': {'implementation': 'fast'}}, r'dynamodb\.implementation'),
+    ({'logger_conf': [{'level': 'LOUD'}]}, r'logger_conf\[0\]\.level'),
+])
+def test_out_of_range_values_are_rejected(data, error):
+    with pytest.raises(ConfigurationError, match=error):
+        parse_config(data)
+
+
+def test_boundary_values_are_accepted():
+    config = parse_config({
+        'broadcast_checkpoint_size': 1,
+        'coalescing': {'window': 0, 'buffer': 'memory'},
+        'profiling': {'sample_rate': 1},
+        'storage': {'backend': 'sqlite'},
+    })
+
+    assert config.broadcast_checkpoint_size == 1
+    assert config.coalescing.window == 0.0
+
+
+def test_collections_are_immutable():
+    config = parse_config({
+        'building_groups': {'north': ['+1', '+2']},
+        'dispatch': {'admin_chat_ids': ['42']},
+    })
+
+    assert config.building_groups['north'] == ('+1', '+2')
+    assert config.dispatch.admin_chat_ids == ('42',)
+    with pytest.raises(TypeError):
+        config.building_groups['south'] = ('+3',)
+
+
+def test_merge_documents_overrides_nested_keys():
+    base = {'a': {'x': 1, 'y': 2}, 'b': [1]}
+    merged = merge_documents(base, {'a': {'y': 3}, 'b': [2]})
+
+    assert merged == {'a': {'x': 1, 'y': 3}, 'b': [2]}
+    assert base == {'a': {'x': 1, 'y': 2}, 'b': [1]}
+
+
+def test_load_config_merges_documents_in_order(tmp_path):
+    base = tmp_path / 'base.json'
+    local = tmp_path / 'local.json'
+    base.write_text(json.dumps({
+        'deadline_margin': 1.0,
+        'coalescing': {'window': 2.0},
+    }))
+    local.write_text(json.dumps({'coalescing': {'window': 0.5}}))
+
+    config = load_config(f'{base},{local}')
+
+    assert config.deadline_margin == 1.0
+    assert config.coalescing.window == 0.5
@@ -0,0 +1,139 @@
+import threading
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+from bridge.dynamodb_service import (
+    DynamoDBService,
+    create_dynamodb_service,
+    decode_item,
+    encode_item,
+    encode_value,
+)
+
+
+class Table():
+    def __init__(self, name):
+        self.name = name
+        self.reads = []
+
+    def get_item(self, Key):
+        self.reads.append(Key)
+        return {}
+
+
+class Resource():
+    def __init__(self):
+        self.tables = []
+
+    def Table(self, name):
+        self.tables.append(Table(name))
+        return self.tables[-1]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = DynamoDBService('state')
+    monkeypatch.setattr(service, '_resource', Resource)
+    return service
+
+
+def in_thread(function):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(function()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_threads_use_resources_of_their_own(service):
+    resource = service.resource
+
+    assert service.resource is resource
+    assert service.dynamodb_table.name == 'state'
+    assert in_thread(lambda: service.resource) is not resource
+
+
+def test_warmed_resources_are_handed_to_the_next_thread(service):
+    in_thread(lambda: service.warm({'user_number': '#warm'}))
+
+    warmed = in_thread(lambda: service.resource)
+
+    assert warmed.tables[0].reads == [{'user_number': '#warm'}]
+    assert service.resource is not warmed
+
+
+def test_client_is_created_once_across_threads(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    service = create_dynamodb_service('state', 'client')
+    barrier = threading.Barrier(8)
+    clients = []
+
+    def create():
+        barrier.wait()
+        clients.append(service.client)
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, clients))) == 1
+
+
+ITEM = {
+    'user_number': '+1',
+    'active': True,
+    'count': 3,
+    'ratio': Decimal('1.5'),
+    'missing': None,
+    'raw': b'\x00',
+    'tags': {'a', 'b'},
+    'numbers': {1, 2},
+    'list': ['a', 1, False],
+    'map': {'nested': {'k': 'v'}},
+}
+DECODED = dict(
+    ITEM, count=Decimal(3), numbers={Decimal(1), Decimal(2)},
+    list=['a', Decimal(1), False])
+
+
+def test_items_round_trip_through_the_encoding():
+    assert decode_item(encode_item(ITEM)) == DECODED
+
+
+def test_encoding_matches_the_boto3_serializers():
+    serializer, deserializer = TypeSerializer(), TypeDeserializer()
+    encoded = encode_item(ITEM)
+
+    assert {
+        name: deserializer.deserialize(value)
+        for name, value in encoded.items()
+    } == DECODED
+    assert decode_item({
+        name: serializer.serialize(value) for name, value in ITEM.items()
+    }) == DECODED
+
+
+def test_unsupported_values_are_refused():
+    with pytest.raises(TypeError):
+        encode_value(object())
+
+
+class Client():
+    def __init__(self):
+        self.requests = []
+
+    def get_item(self, **request):
+        self.requests.append(request)
+        return {'Item': encode_item(ITEM)}
+
+
+def test_client_service_encodes_requests_and_decodes_items():
+    service = create_dynamodb_service('state', 'client')
+    client = service._client = Client()
+
+    assert service.get_item(Key={'user_number': '+1'}) == DECODED
+    assert client.requests == [
+        {'TableName': 'state', 'Key': {'user_number': {'S': '+1'}}}]
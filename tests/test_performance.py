@@ -0,0 +1,23 @@
+import json
+
+import performance
+
+
+def test_profiles_load_from_any_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    assert performance.load_profile('prod', 'twilio')['architecture'] == \
+        'arm64'
+    assert performance.load_profile('staging', 'telegram') == \
+        performance.load_profile('dev', 'telegram')
+
+
+def test_every_stage_architecture_has_a_layer_platform():
+    with open(performance.PROFILE_FILE) as f:
+        stages = json.load(f)
+
+    for stage in stages:
+        for architecture in performance.architectures(stage):
+            assert performance.docker_platform(architecture).startswith(
+                'linux/')
+    assert performance.architectures('prod') == ['arm64']
@@ -0,0 +1,57 @@
+import logging
+import threading
+import time
+
+from bridge.prewarm import prewarm
+from bridge.repository import create_state_repository
+
+
+def test_warmers_run_in_parallel_with_the_budget_as_timeout():
+    timeouts = []
+    barrier = threading.Barrier(3, timeout=1)
+
+    def warmer(timeout):
+        timeouts.append(timeout)
+        barrier.wait()
+
+    elapsed = prewarm({name: warmer for name in 'abc'}, budget=0.5)
+
+    assert timeouts == [0.5] * 3
+    assert elapsed < 0.5
+
+
+def test_slow_and_failing_warmers_do_not_exceed_the_budget(caplog):
+    caplog.set_level(logging.INFO, 'bridge.prewarm')
+    release = threading.Event()
+
+    def fail(timeout):
+        raise ConnectionError('refused')
+
+    start = time.monotonic()
+    elapsed = prewarm({
+        'slow': lambda timeout: release.wait(5),
+        'failing': fail,
+        'fine': lambda timeout: None,
+    }, budget=0.1)
+    release.set()
+
+    assert 0.1 <= elapsed < 0.5
+    assert time.monotonic() - start < 0.5
+    assert 'failed to prewarm failing: refused' in caplog.text
+    assert "prewarm budget exceeded by ['slow']" in caplog.text
+    assert 'prewarmed 1/3' in caplog.text
+
+
+def test_sqlite_warm_opens_no_connection_on_the_warming_thread(
+        sqlite_config):
+    state = create_state_repository(sqlite_config)
+    opened = []
+
+    def warm(timeout):
+        state.warm(timeout)
+        opened.append(hasattr(state.local, 'connection'))
+
+    prewarm({'state': warm}, budget=1.0)
+
+    assert opened == [False]
+    assert hasattr(state.local, 'connection')
@@ -0,0 +1,43 @@
+import pstats
+from concurrent.futures import ThreadPoolExecutor
+
+from bridge.configuration import Configuration, ProfilingConfig
+from bridge.profiling import ThreadProfiler, profile_handler
+
+
+def busy_send(i: int) -> int:
+    return sum(range(1000))
+
+
+def handler(event, context):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return {'results': list(executor.map(busy_send, range(8)))}
+
+
+def calls_of(stats: pstats.Stats, name: str) -> int:
+    return int(stats.get_stats_profile().func_profiles[name].ncalls)
+
+
+def test_worker_threads_are_profiled():
+    profiler = ThreadProfiler()
+    profiler.runcall(handler, {}, None)
+
+    assert calls_of(profiler.stats(), 'busy_send') == 8
+
+
+def test_sampled_invocations_are_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr('bridge.profiling.PROFILE_DIR', str(tmp_path))
+    config = Configuration(profiling=ProfilingConfig(sample_rate=1.0))
+
+    class Context():
+        aws_request_id = 'request'
+
+    profile_handler(config)(handler)({}, Context())
+
+    path, = tmp_path.iterdir()
+    assert path.name == f'{__name__}.handler-request.pstats'
+    assert calls_of(pstats.Stats(str(path)), 'busy_send') == 8
+
+
+def test_disabled_profiling_returns_the_handler():
+    assert profile_handler(Configuration())(handler) is handler
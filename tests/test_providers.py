@@ -0,0 +1,171 @@
+import json
+import time
+
+import pytest
+import requests
+
+from bridge.concurrency import Outcome
+from bridge.deadline import Deadline, DeadlineExceededError
+from bridge.providers import Message, delivery_report, send_outcome, split_text
+
+
+def message(destination: str) -> Message:
+    return Message(source='src', destination=destination, text='hi', media=[])
+
+
+def test_split_text_keeps_short_text_whole():
+    assert split_text('hello') == ['hello']
+    assert split_text('') == ['']
+
+
+def test_split_text_prefers_paragraph_then_word_boundaries():
+    text = 'first paragraph\n\nsecond one here'
+    assert split_text(text, limit=20) == ['first paragraph', 'second one here']
+    assert split_text('aaa bbb ccc', limit=8) == ['aaa bbb', 'ccc']
+
+
+def test_split_text_parts_fit_the_limit_and_keep_all_words():
+    text = ' '.join(f'word{i}' for i in range(2000))
+    parts = split_text(text, limit=100)
+    assert all(len(part) <= 100 for part in parts)
+    assert ' '.join(parts).split() == text.split()
+
+
+def test_split_text_cuts_text_without_boundaries():
+    assert split_text('x' * 25, limit=10) == ['x' * 10, 'x' * 10, 'x' * 5]
+
+
+@pytest.mark.parametrize('error, status, exception, expected', [
+    (None, None, None, Outcome.SUCCESS),
+    ('busy', 429, None, Outcome.THROTTLED),
+    ('down', 503, None, Outcome.FAILED),
+    ('timeout', None, requests.Timeout(), Outcome.FAILED),
+    ('bad chat', 400, None, Outcome.IGNORED),
+])
+def test_send_outcome(error, status, exception, expected):
+    assert send_outcome(error, status, exception) is expected
+
+
+def test_send_many_reports_each_result(provider):
+    provider.failing = {'2'}
+    results = provider.send_many([message('1'), message('2'), message('3')])
+
+    assert delivery_report(results) == {
+        'delivered': ['1', '3'],
+        'failed': ['2'],
+        'not_attempted': [],
+    }
+    assert [result.status for result in results] == [None, 400, None]
+
+
+def test_send_many_starts_nothing_after_the_deadline(provider):
+    deadline = Deadline(time.monotonic() - 1)
+    results = provider.send_many([message('1'), message('2')], deadline)
+
+    assert provider.sent == []
+    assert delivery_report(results)['not_attempted'] == ['1', '2']
+
+
+def test_send_many_reports_deadline_errors_as_not_attempted(provider):
+    def send_message(message, deadline=None):
+        raise DeadlineExceededError('no budget left')
+    provider.send_message = send_message
+
+    result, = provider.send_many([message('1')])
+
+    assert not result.attempted
+    assert result.error == 'deadline exceeded'
+
+
+def telegram_update(**message):
+    return json.dumps({'message': {'chat': {'id': 7}, **message}})
+
+
+def test_parsing_telegram_media_keeps_file_ids(media_provider, s3):
+    parsed = media_provider.parse_message(telegram_update(
+        caption='{}', photo=[{'file_id': 'small'}, {'file_id': 'large'}],
+        document={'file_id': 'doc'}))
+
+    assert parsed.media == ['large', 'doc']
+    assert media_provider.downloads == []
+    assert s3.objects == {}
+
+
+def test_resolved_media_are_presigned_copies(media_provider, s3):
+    urls = media_provider.resolve_media(['large', 'large'])
+
+    assert urls == [
+        'https://bucket.s3.amazonaws.com/media/ularge/1.jpg?Expires=900'
+    ] * 2
+    assert media_provider.downloads == ['large']
+    assert s3.objects == {('bucket', 'media/ularge/1.jpg'): b'image'}
+    assert 'secret' not in urls[0]
+
+
+def test_media_without_an_output_are_dropped(media_provider, s3):
+    media_provider.config = media_provider.config._replace(media_output='')
+
+    assert media_provider.resolve_media(['large']) == []
+    assert s3.objects == {}
+
+
+def test_replies_are_inline_send_message_calls(media_provider):
+    reply = media_provider.reply(Message(
+        source='7', destination='7', text='Set active state to True',
+        media=[]))
+
+    assert json.loads(reply) == {
+        'method': 'sendMessage',
+        'chat_id': 7,
+        'text': 'Set active state to True',
+    }
+
+
+@pytest.mark.parametrize('text, inline', [
+    ('x' * 5000, True),
+    ('short', False),
+])
+def test_replies_fall_back_to_sending(media_provider, text, inline):
+    media_provider.config = media_provider.config._replace(
+        inline_reply=inline)
+    sent = []
+    media_provider.send_many = lambda messages, deadline: sent.extend(messages)
+    reply = Message(source='7', destination='7', text=text, media=[])
+
+    assert media_provider.reply(reply) is None
+    assert sent == [reply]
+
+
+def test_prepare_copies_the_message(media_provider):
+    original = Message(
+        source='src', destination='7', text='leak', media=['https://a'])
+    prepared = media_provider.prepare(original)
+    original.media.append('https://b')
+    original.text = 'changed'
+
+    assert prepared.message.text == 'leak'
+    assert prepared.message.media == ['https://a']
+    assert prepared.message.destination == ''
+
+
+def test_recipient_views_are_immutable(media_provider):
+    prepared = media_provider.prepare(message('7'))
+    first, second = prepared.to('7'), prepared.to('8')
+
+    with pytest.raises(AttributeError):
+        first.destination = '8'
+    with pytest.raises(AttributeError):
+        first.text = 'changed'
+    assert (first.destination, second.destination) == ('7', '8')
+    assert first.text == second.text == 'hi'
+
+
+def test_recipient_requests_only_insert_the_chat_id(media_provider):
+    prepared = media_provider.prepare(Message(
+        source='src', destination='', text='x' * 5000, media=[]))
+
+    bodies = media_provider.request_bodies(prepared.to('8'))
+
+    assert prepared.to('8').payload is prepared.payload
+    assert [json.loads(body) for body in bodies] == [
+        {'chat_id': 8, 'text': part} for part in split_text('x' * 5000)]
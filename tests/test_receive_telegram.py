@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from bridge.deadline import Deadline
+
+
+@pytest.fixture
+def telegram(load_handler, provider):
+    module = load_handler(
+        'aws_lambda.receive_telegram',
+        dispatch={'admin_chat_ids': ['42'], 'max_recipients': 2},
+        building_groups={'north': ['+10', '+11', '+12']},
+    )
+    module.twilio_provider = provider
+    return module
+
+
+def dispatch(telegram, source, buildings):
+    return telegram.dispatch(
+        source, {'buildings': buildings, 'text': 'water off'}, [],
+        Deadline())
+
+
+def test_admin_chats_dispatch_to_buildings(telegram, provider):
+    reply = dispatch(telegram, '42', ['+10', '+11'])
+
+    assert provider.destinations == ['+10', '+11']
+    assert reply.startswith('Delivered to 2/2 buildings')
+
+
+def test_other_chats_cannot_dispatch(telegram, provider):
+    reply = dispatch(telegram, '7', ['+10'])
+
+    assert provider.sent == []
+    assert 'not allowed' in reply
+
+
+def test_dispatches_over_the_recipient_limit_are_refused(telegram, provider):
+    reply = dispatch(telegram, '42', ['north'])
+
+    assert provider.sent == []
+    assert reply.startswith('Too many buildings: 3')
+
+
+def test_commands_update_subscriptions(telegram):
+    message = telegram.telegram_provider.parse_message(json.dumps({
+        'message': {'chat': {'id': 7}, 'text': '/subscribe +10'},
+    }))
+
+    assert telegram.handle_command(message, Deadline()) == \
+        'Subscribed to +10'
+    assert telegram.subscriptions.get_subscribers('+10') == {'7'}
+
+
+def command(telegram, text):
+    message = telegram.telegram_provider.parse_message(json.dumps({
+        'message': {'chat': {'id': 7}, 'text': text},
+    }))
+    return telegram.handle_command(message, Deadline())
+
+
+def is_active(telegram):
+    return list(telegram.repository.filter_active(['7'])) == ['7']
+
+
+def test_start_and_stop_commands_set_active_state(telegram):
+    assert command(telegram, '/start') == 'Set active state to True'
+    assert is_active(telegram)
+
+    assert command(telegram, '/stop') == 'Set active state to False'
+    assert not is_active(telegram)
+
+    command(telegram, 'start')
+    assert is_active(telegram)
+
+
+def test_other_text_keeps_active_state(telegram):
+    command(telegram, '/start')
+
+    assert command(telegram, 'hello') == telegram.COMMANDS_HELP
+    assert is_active(telegram)
+
+
+def test_commands_are_answered_in_the_webhook_response(telegram):
+    response = telegram.handler({'body': json.dumps({
+        'message': {'chat': {'id': 7}, 'text': '/start'},
+    })}, None)
+
+    assert response['headers'] == {'Content-Type': 'application/json'}
+    assert json.loads(response['body']) == {
+        'method': 'sendMessage',
+        'chat_id': 7,
+        'text': 'Set active state to True',
+    }
+
+
+def test_subscribe_activates_the_user(telegram):
+    command(telegram, '/stop')
+
+    assert command(telegram, '/subscribe all') == 'Subscribed to all'
+    assert is_active(telegram)
+
+
+def photo_event(chat_id, buildings):
+    return {'body': json.dumps({'message': {
+        'chat': {'id': chat_id},
+        'caption': json.dumps({'buildings': buildings, 'text': 'leak'}),
+        'photo': [{'file_id': 'photo'}],
+    }})}
+
+
+def test_media_of_other_chats_are_never_fetched(
+        telegram, provider, media_provider, s3):
+    telegram.telegram_provider = media_provider
+
+    response = telegram.handler(photo_event(7, ['+10']), None)
+
+    assert 'not allowed' in response['body']
+    assert media_provider.downloads == []
+    assert s3.objects == {}
+    assert provider.sent == []
+
+
+def test_media_over_the_recipient_limit_are_never_fetched(
+        telegram, media_provider, s3):
+    telegram.telegram_provider = media_provider
+
+    telegram.handler(photo_event(42, ['north']), None)
+
+    assert media_provider.downloads == []
+    assert s3.objects == {}
+
+
+def test_admin_dispatches_send_presigned_media(
+        telegram, provider, media_provider, s3):
+    telegram.telegram_provider = media_provider
+
+    telegram.handler(photo_event(42, ['+10']), None)
+
+    sent, = provider.sent
+    assert sent.media == [
+        'https://bucket.s3.amazonaws.com/media/uphoto/1.jpg?Expires=900']
+    assert list(s3.objects) == [('bucket', 'media/uphoto/1.jpg')]
@@ -0,0 +1,57 @@
+from urllib.parse import urlencode
+
+import pytest
+
+from bridge.deadline import DeadlineExceededError
+
+
+class Context():
+    def get_remaining_time_in_millis(self) -> int:
+        return 10000
+
+
+@pytest.fixture
+def twilio(load_handler, provider):
+    module = load_handler(
+        'aws_lambda.receive_twilio',
+        coalescing={'window': 0.05, 'reserve': 0.0},
+    )
+    module.broadcaster.provider = provider
+    module.repository.put_many([('1', True), ('2', True), ('3', False)])
+    for number in ('1', '2', '3'):
+        module.subscriptions.subscribe('+1555', number)
+    return module
+
+
+def event(text: str, sid: str = 'SM1'):
+    return {'body': urlencode({
+        'Body': text, 'From': '+1555', 'MessageSid': sid})}
+
+
+def test_messages_are_broadcast_to_active_subscribers(twilio, provider):
+    response = twilio.handler(event('water off'), Context())
+
+    assert response['statusCode'] == 200
+    assert provider.destinations == ['1', '2']
+    assert provider.sent[0].text == 'Building: +1555\n\nwater off'
+
+
+def test_unstored_messages_stay_buffered_for_a_retry(
+        twilio, provider, monkeypatch):
+    def get_subscribers(building, deadline=None):
+        raise DeadlineExceededError()
+    original = twilio.subscriptions.get_subscribers
+    monkeypatch.setattr(
+        twilio.subscriptions, 'get_subscribers', get_subscribers)
+
+    response = twilio.handler(event('water off'), Context())
+
+    assert response['statusCode'] == 503
+    assert [entry['message_id'] for entry in
+            twilio.coalescer.buffer.peek('+1555')] == ['SM1']
+
+    monkeypatch.setattr(
+        twilio.subscriptions, 'get_subscribers', original)
+    assert twilio.handler(event('water off'), Context())['statusCode'] == 200
+    assert provider.destinations == ['1', '2']
+    assert twilio.coalescer.buffer.peek('+1555') == []
@@ -0,0 +1,40 @@
+from tools.replay import run_step, saturated
+
+
+class Target():
+    """ Models a target answering 200 while a share of sends fail. """
+
+    def __init__(self) -> None:
+        self.delivered = 0
+        self.failed = 0
+
+    def __call__(self, route: str, body: str) -> bool:
+        self.delivered += 1
+        self.failed += 1
+        return True
+
+    def deliveries(self):
+        return self.delivered, self.failed
+
+
+def step(target, deliveries):
+    return run_step(
+        target, deliveries, [('/twilio', '')], rate=100, duration=0.1,
+        mode='constant', burst_size=1, concurrency=1)
+
+
+def test_failed_sends_count_as_delivery_errors():
+    target = Target()
+    report = step(target, target.deliveries)
+
+    assert report['http_errors'] == 0
+    assert report['delivery_errors'] == report['requests']
+    assert report['delivery_error_rate'] == 0.5
+    assert saturated(report, max_error_rate=0.01, max_p99=10.0)
+
+
+def test_remote_targets_report_no_delivery_errors():
+    report = step(lambda route, body: True, lambda: None)
+
+    assert report['delivery_errors'] is None
+    assert not saturated(report, max_error_rate=0.01, max_p99=10.0)
@@ -0,0 +1,48 @@
+import pytest
+
+from bridge.configuration import Configuration
+from bridge.repository import (
+    ALL_BUILDINGS,
+    SQLiteStateRepository,
+    SQLiteSubscriptionRepository,
+    create_broadcast_repository,
+    create_state_repository,
+    create_subscription_repository,
+)
+
+
+def test_sqlite_state_filters_active_numbers(sqlite_config):
+    state = create_state_repository(sqlite_config)
+    assert isinstance(state, SQLiteStateRepository)
+    state.put_many([('1', True), ('2', False), ('3', True)])
+    state.put_active('3', False)
+
+    assert sorted(state.get_active_numbers()) == ['1']
+    assert list(state.filter_active(['1', '2', '3', '4'])) == ['1']
+
+
+def test_sqlite_subscriptions_include_all_buildings(sqlite_config):
+    subscriptions = create_subscription_repository(sqlite_config)
+    assert isinstance(subscriptions, SQLiteSubscriptionRepository)
+    subscriptions.subscribe('+1', 'a')
+    subscriptions.subscribe('+1', 'a')
+    subscriptions.subscribe('+2', 'b')
+    subscriptions.subscribe(ALL_BUILDINGS, 'c')
+
+    assert subscriptions.get_subscribers('+1') == {'a', 'c'}
+    subscriptions.unsubscribe('+1', 'a')
+    assert subscriptions.get_subscribers('+1') == {'c'}
+
+
+def test_sqlite_storage_is_shared_through_the_file(sqlite_config):
+    create_subscription_repository(sqlite_config).subscribe('+1', 'a')
+
+    assert create_subscription_repository(
+        sqlite_config).get_subscribers('+1') == {'a'}
+
+
+def test_dynamodb_backend_requires_table_names(monkeypatch):
+    monkeypatch.delenv('broadcast_dynamodb_table', raising=False)
+
+    with pytest.raises(ValueError, match='broadcast_dynamodb_table'):
+        create_broadcast_repository(Configuration())
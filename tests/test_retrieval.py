@@ -0,0 +1,45 @@
+from bridge.configuration import Configuration, SSMConfig
+from bridge.fileio.retrieval import get_retrieval_factory
+from bridge.s3_service import create_s3_service
+from bridge.ssm_service import create_ssm_service
+
+
+def test_ssm_services_are_cached_per_configuration():
+    default = create_ssm_service(SSMConfig())
+    local = create_ssm_service(SSMConfig(endpoint_url='http://localhost:1'))
+
+    assert local is not default
+    assert local.conf.endpoint_url == 'http://localhost:1'
+    assert create_ssm_service(SSMConfig()) is default
+    assert create_ssm_service(
+        SSMConfig(endpoint_url='http://localhost:1')) is local
+
+
+def test_s3_services_and_factories_are_cached_per_configuration():
+    config = Configuration(ssm=SSMConfig(cache_ttl=1.0))
+
+    assert create_s3_service(config) is not create_s3_service(
+        Configuration())
+    assert create_s3_service(config) is create_s3_service(
+        Configuration(ssm=SSMConfig(cache_ttl=1.0)))
+    assert get_retrieval_factory(config) is not get_retrieval_factory(
+        Configuration())
+    assert get_retrieval_factory(config).config == config
+
+
+def test_retrieve_many_reuses_retrievals(tmp_path):
+    paths = []
+    for name in ('a', 'b'):
+        path = tmp_path / f'{name}.json'
+        path.write_text(name)
+        paths.append(str(path))
+    factory = get_retrieval_factory(Configuration())
+
+    with factory.retrieve_many(paths + [f'file://{paths[0]}']) as local:
+        contents = {path: open(local[path]).read() for path in local}
+
+    assert contents[paths[0]] == 'a'
+    assert contents[paths[1]] == 'b'
+    assert contents[f'file://{paths[0]}'] == 'a'
+    assert factory.get_retrieval(paths[0]) is factory.get_retrieval(
+        paths[1])
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+import server as bridge_server
+from bridge.configuration import Configuration, ProfilingConfig
+from bridge.profiling import SAMPLE_RATE_ENV, profile_handler
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(bridge_server, 'ROUTES', {})
+    monkeypatch.setenv(SAMPLE_RATE_ENV, '0')
+    app = bridge_server.BridgeServer(timeout=5.0, threads=4)
+    app.handlers = {
+        '/echo': lambda event, context: {
+            'statusCode': 200, 'body': event['body']},
+        '/slow': lambda event, context: (
+            time.sleep(0.2) or {'statusCode': 200, 'body': 'done'}),
+        '/odd': lambda event, context: {'statusCode': 299, 'body': 'odd'},
+    }
+    return app
+
+
+async def request(reader, writer, path, body='', close=False):
+    lines = [f'POST {path} HTTP/1.1', f'Content-Length: {len(body)}']
+    if close:
+        lines.append('Connection: close')
+    writer.write(
+        ('\r\n'.join(lines) + f'\r\n\r\n{body}').encode('latin-1'))
+    status = (await reader.readline()).decode('latin-1')
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.lower()] = value.strip()
+    data = await reader.readexactly(int(headers['content-length']))
+    return int(status.split(' ')[1]), headers, data.decode('UTF-8')
+
+
+def serve(app, client):
+    async def run():
+        server = await asyncio.start_server(
+            app.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await client(server, port)
+        finally:
+            if not app.stopping:
+                await app.shutdown(server)
+    return asyncio.run(run())
+
+
+def test_requests_are_answered_over_keep_alive_connections(app):
+    async def client(server, port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        first = await request(reader, writer, '/echo', 'one')
+        second = await request(reader, writer, '/echo', 'two', close=True)
+        missing = await request(
+            *await asyncio.open_connection('127.0.0.1', port), '/nowhere')
+        return first, second, missing
+
+    first, second, missing = serve(app, client)
+
+    assert first[0] == 200 and first[2] == 'one'
+    assert first[1]['connection'] == 'keep-alive'
+    assert second[1]['connection'] == 'close'
+    assert missing[0] == 404
+
+
+def test_invalid_handler_status_codes_become_bad_gateway(app):
+    async def client(server, port):
+        return await request(
+            *await asyncio.open_connection('127.0.0.1', port), '/odd')
+
+    status, _, body = serve(app, client)
+
+    assert status == 502
+    assert body == ''
+
+
+def test_shutdown_answers_requests_and_closes_idle_connections(app):
+    async def client(server, port):
+        idle = await asyncio.open_connection('127.0.0.1', port)
+        await request(*idle, '/echo', 'warm')
+        busy = await asyncio.open_connection('127.0.0.1', port)
+        pending = asyncio.ensure_future(request(*busy, '/slow'))
+        while not app.in_flight:
+            await asyncio.sleep(0.01)
+
+        start = time.monotonic()
+        await asyncio.wait_for(app.shutdown(server), timeout=2)
+        elapsed = time.monotonic() - start
+        return await pending, await idle[0].read(), elapsed
+
+    (status, headers, body), rest, elapsed = serve(app, client)
+
+    assert (status, body) == (200, 'done')
+    assert headers['connection'] == 'close'
+    assert rest == b''
+    assert elapsed < 1
+
+
+def test_server_handlers_are_never_profiled(monkeypatch):
+    monkeypatch.setattr(bridge_server, 'ROUTES', {})
+    monkeypatch.setenv(SAMPLE_RATE_ENV, '1')
+    bridge_server.BridgeServer(timeout=5.0, threads=1).executor.shutdown()
+
+    def handler(event, context):
+        return {}
+
+    config = Configuration(profiling=ProfilingConfig(sample_rate=1.0))
+    assert profile_handler(config)(handler) is handler
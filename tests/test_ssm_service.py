@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from bridge.configuration import ConfigurationError, SSMConfig, load_config
+from bridge.ssm_service import ParameterNotFoundError, SSMService
+from tools.stub_ssm import StubSSM
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    stub = StubSSM({
+        f'/sms-bridge/parameter-{i}': f'value-{i}' for i in range(25)
+    }).start()
+    yield stub
+    stub.stop()
+
+
+def test_parameters_are_fetched_in_batches_and_cached(stub):
+    service = SSMService(SSMConfig(endpoint_url=stub.url))
+    names = [f'/sms-bridge/parameter-{i}' for i in range(25)]
+
+    values = service.get_parameters(names)
+    again = service.get_parameters(names[:3])
+
+    assert values == {name: name.replace('/sms-bridge/parameter', 'value')
+                      for name in names}
+    assert again == {name: values[name] for name in names[:3]}
+    assert [len(batch) for batch in stub.requests] == [10, 10, 5]
+
+
+def test_unknown_parameters_are_reported(stub):
+    service = SSMService(SSMConfig(endpoint_url=stub.url))
+
+    with pytest.raises(ParameterNotFoundError, match='missing'):
+        service.get_parameters(['/sms-bridge/parameter-0', '/missing'])
+
+
+def write_config(tmp_path, stub, token):
+    path = tmp_path / 'bridge.json'
+    path.write_text(json.dumps({
+        'ssm': {'endpoint_url': stub.url},
+        'message_providers': {'telegram': {'token': token}},
+    }))
+    return str(path)
+
+
+def test_configuration_references_resolve_through_the_stub(stub, tmp_path):
+    config = load_config(
+        write_config(tmp_path, stub, 'ssm:///sms-bridge/parameter-7'))
+
+    assert config.message_providers.telegram.token == 'value-7'
+    assert config.message_providers.telegram.bot_url.endswith(
+        '/botvalue-7')
+
+
+def test_unknown_references_fail_the_configuration(stub, tmp_path):
+    with pytest.raises(ConfigurationError, match='unknown SSM parameters'):
+        load_config(write_config(tmp_path, stub, 'ssm:///sms-bridge/nope'))
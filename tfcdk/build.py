@@ -1,15 +1,37 @@
+import base64
+import functools
+import hashlib
+import json
 import os
 import shutil
-from typing import Tuple
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
 
 import docker  # type: ignore
 
 
+# performance.py is shared with the CDK app at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from performance import DOCKER_PLATFORMS, docker_platform  # noqa: E402
+
+
 DOCKER_IMAGE_TAG = 'sms_bridge_layer'
 LAYER_PACKAGE_DIR = 'dist/layer_package'
 LAYER_PACKAGE_FILE = 'dist/dependency_layer'
-FUNCTION_PACKAGE_DIR = 'dist/function_package'
+LAYER_INPUTS = (
+    '../requirements.txt',
+    '../Dockerfile',
+    '../lambda_package.py',
+)
 FUNCTION_PACKAGE_FILE = 'dist/functions'
+FUNCTION_INPUTS = ('../aws_lambda', '../bridge')
+BUILD_CACHE_FILE = 'dist/build_cache.json'
+IGNORED_NAMES = set(['__pycache__'])
+HASH_CHUNK_SIZE = 1024 * 1024
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
 
 
 def print_log(logs):
@@ -20,11 +42,93 @@ def print_log(logs):
             pass
 
 
-def package_layer() -> None:
-    layer_package_dir = os.path.join(os.getcwd(), LAYER_PACKAGE_DIR)
+def update_hash(digest, path: str) -> None:
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+
+def source_hash(path: str) -> str:
+    """ Returns a base64 sha256 of a file, read in chunks. """
+    digest = hashlib.sha256()
+    update_hash(digest, path)
+    return base64.b64encode(digest.digest()).decode('UTF-8')
+
+
+def walk_files(
+        root: str,
+        bytecode: bool = False) -> Iterable[Tuple[str, str]]:
+    """ Yields sorted (path, relative path) pairs of files under root.
+
+    Bytecode is skipped unless requested, the layer ships bytecode
+    precompiled for the Lambda runtime by lambda_package.py.
+    """
+    if os.path.isfile(root):
+        yield root, os.path.basename(root)
+        return
+
+    base = os.path.dirname(os.path.abspath(root))
+    for dirpath, dirnames, filenames in os.walk(root):
+        if not bytecode:
+            dirnames[:] = set(dirnames) - IGNORED_NAMES
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.pyc') and not bytecode:
+                continue
+            path = os.path.join(dirpath, filename)
+            yield path, os.path.relpath(os.path.abspath(path), base)
+
+
+def inputs_hash(roots: Iterable[str]) -> str:
+    """ Returns a content hash of all files under the input roots. """
+    digest = hashlib.sha256()
+    for root in roots:
+        for path, name in walk_files(root):
+            digest.update(name.encode('UTF-8') + b'\0')
+            update_hash(digest, path)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def make_zip(
+        zip_file: str,
+        roots: Iterable[str],
+        strip_root: bool = False,
+        bytecode: bool = False) -> str:
+    """ Writes a reproducible zip with sorted entries and fixed metadata. """
+    zip_path = f'{zip_file}.zip'
+    tmp_path = f'{zip_path}.tmp'
+    os.makedirs(os.path.dirname(zip_path) or '.', exist_ok=True)
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root in roots:
+            for path, name in walk_files(root, bytecode):
+                if strip_root:
+                    name = os.path.relpath(
+                        os.path.abspath(path), os.path.abspath(root))
+                info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+                mode = 0o755 if os.access(path, os.X_OK) else 0o644
+                info.external_attr = (0o100000 | mode) << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, 'rb') as src, archive.open(info, 'w') as dst:
+                    shutil.copyfileobj(src, dst, HASH_CHUNK_SIZE)
+    os.replace(tmp_path, zip_path)
+    return zip_path
+
+
+def package_layer(architecture: str) -> None:
+    """ Builds the layer with dependencies for a Lambda architecture. """
+    platform = docker_platform(architecture)
+    layer_package_dir = os.path.join(
+        os.getcwd(), f'{LAYER_PACKAGE_DIR}_{architecture}')
+    shutil.rmtree(layer_package_dir, ignore_errors=True)
     os.makedirs(layer_package_dir, exist_ok=True)
     client = docker.from_env()
-    image, logs = client.images.build(path='../', tag=DOCKER_IMAGE_TAG)
+    image, logs = client.images.build(
+        path='../',
+        tag=f'{DOCKER_IMAGE_TAG}:{architecture}',
+        buildargs={'PLATFORM': platform},
+        platform=platform,
+    )
     client.containers.run(
         image=image.id,
         remove=True,
@@ -32,39 +136,74 @@ def package_layer() -> None:
             layer_package_dir: {'bind': '/asset-output', 'mode': 'rw'},
         },
     )
-    shutil.make_archive(LAYER_PACKAGE_FILE, 'zip', LAYER_PACKAGE_DIR)
-
-
-def ignore_handler(path, items):
-    return set(items) & set(['__pycache__'])
+    make_zip(
+        f'{LAYER_PACKAGE_FILE}_{architecture}', [layer_package_dir],
+        strip_root=True, bytecode=True)
 
 
 def package_function() -> None:
-    os.makedirs(FUNCTION_PACKAGE_DIR, exist_ok=True)
-    shutil.copytree(
-        '../aws_lambda',
-        os.path.join(FUNCTION_PACKAGE_DIR, 'aws_lambda'),
-        dirs_exist_ok=True,
-        ignore=ignore_handler,
-    )
-    shutil.copytree(
-        '../bridge',
-        os.path.join(FUNCTION_PACKAGE_DIR, 'bridge'),
-        dirs_exist_ok=True,
-        ignore=ignore_handler,
-    )
-    shutil.make_archive(FUNCTION_PACKAGE_FILE, 'zip', FUNCTION_PACKAGE_DIR)
-
-
-def package_assets() -> Tuple[str, str]:
-    package_layer()
-    package_function()
+    make_zip(FUNCTION_PACKAGE_FILE, FUNCTION_INPUTS)
+
+
+def load_build_cache() -> Dict[str, str]:
+    try:
+        with open(BUILD_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_build_cache(cache: Dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(BUILD_CACHE_FILE), exist_ok=True)
+    with open(BUILD_CACHE_FILE, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+
+
+def package_assets(
+        architectures: List[str]) -> Tuple[Dict[str, str], str]:
+    """ Packages layers and functions, skipping unchanged inputs.
+
+    Returns the layer package of each architecture and the function
+    package.
+    """
+    os.makedirs('dist', exist_ok=True)
+    cache = load_build_cache()
+    steps: Dict[str, Tuple[str, Iterable[str], Callable[[], None]]] = {
+        f'layer_{architecture}': (
+            f'{LAYER_PACKAGE_FILE}_{architecture}',
+            LAYER_INPUTS,
+            functools.partial(package_layer, architecture),
+        )
+        for architecture in architectures
+    }
+    steps['function'] = (
+        FUNCTION_PACKAGE_FILE, FUNCTION_INPUTS, package_function)
+
+    def run_step(name: str) -> Tuple[str, str]:
+        package_file, inputs, build = steps[name]
+        key = inputs_hash(inputs)
+        if cache.get(name) == key and os.path.exists(f'{package_file}.zip'):
+            print(f'{name} package is up to date')
+            return name, key
+
+        start = time.monotonic()
+        build()
+        print(f'{name} package built in {time.monotonic() - start:.1f}s')
+        return name, key
+
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        cache.update(executor.map(run_step, steps))
+    save_build_cache(cache)
 
     return (
-        os.path.join(os.getcwd(), f'{LAYER_PACKAGE_FILE}.zip'),
+        {
+            architecture: os.path.join(
+                os.getcwd(), f'{LAYER_PACKAGE_FILE}_{architecture}.zip')
+            for architecture in architectures
+        },
         os.path.join(os.getcwd(), f'{FUNCTION_PACKAGE_FILE}.zip'),
     )
 
 
 if __name__ == '__main__':
-    package_assets()
+    package_assets(sorted(DOCKER_PLATFORMS))
@@ -1,9 +1,7 @@
 #!/usr/bin/env python
-import base64
 import json
 import os
-from hashlib import sha256
-from typing import Dict, List
+from typing import Any, Dict, List
 
 from constructs import Construct
 from cdktf import (  # type: ignore
@@ -14,7 +12,9 @@ from cdktf import (  # type: ignore
     TerraformStack,
 )
 
-from build import package_assets  # type: ignore
+from build import package_assets, source_hash  # type: ignore
+# Importable once build added the repository root to the path
+from performance import architectures, load_profile  # type: ignore
 from imports.aws import (  # type: ignore
     AwsProvider,
     ApiGatewayDeployment,
@@ -22,19 +22,26 @@ from imports.aws import (  # type: ignore
     ApiGatewayMethod,
     ApiGatewayResource,
     ApiGatewayRestApi,
+    AppautoscalingPolicy,
+    AppautoscalingPolicyTargetTrackingScalingPolicyConfiguration,
+    AppautoscalingPolicyTargetTrackingScalingPolicyConfigurationPredefinedMetricSpecification,  # noqa: E501
+    AppautoscalingTarget,
     CloudwatchLogGroup,
     DataAwsCallerIdentity,
     DataAwsS3Bucket,
     DynamodbTable,
     DynamodbTableAttribute,
+    DynamodbTableTtl,
     IamPolicy,
     IamPolicyAttachment,
     IamRole,
+    LambdaAlias,
     LambdaFunction,
     LambdaFunctionEnvironment,
     LambdaFunctionTracingConfig,
     LambdaLayerVersion,
     LambdaPermission,
+    LambdaProvisionedConcurrencyConfig,
     S3BucketObject,
 )
 
@@ -53,27 +60,55 @@ class SMSBridgeStack(TerraformStack):
             ],
             billing_mode='PAY_PER_REQUEST',
         )
-
-    def create_dependency_layer(self, package_file: str) -> None:
-        dependency_package = S3BucketObject(
-            self, 'dependency_deployment_package',
-            bucket=self.lambda_bucket.bucket,
-            key=f'sms_bridge/{os.path.basename(package_file)}',
-            source=package_file,
+        self.subscription_table = DynamodbTable(
+            self, 'sms_bridge_subscription_dynamodb_table',
+            lifecycle=TerraformResourceLifecycle(
+                prevent_destroy=True,
+            ),
+            name='sms-bridge-subscription',
+            hash_key='building',
+            range_key='user_number',
+            attribute=[
+                DynamodbTableAttribute(name='building', type='S'),
+                DynamodbTableAttribute(name='user_number', type='S'),
+            ],
+            billing_mode='PAY_PER_REQUEST',
         )
-        with open(package_file, 'rb') as f:
-            hash_bytes = sha256(f.read()).digest()
-            source_hash = base64.b64encode(hash_bytes).decode('UTF-8')
-
-        self.dependency_layer = LambdaLayerVersion(
-            self, 'dependency_layer',
-            layer_name='SMSBridgeDependencyLayer',
-            s3_bucket=dependency_package.bucket,
-            s3_key=dependency_package.key,
-            compatible_runtimes=['python3.8'],
-            source_code_hash=source_hash,
+        self.broadcast_table = DynamodbTable(
+            self, 'sms_bridge_broadcast_dynamodb_table',
+            name='sms-bridge-broadcast',
+            hash_key='broadcast_id',
+            attribute=[
+                DynamodbTableAttribute(name='broadcast_id', type='S')
+            ],
+            ttl=[
+                DynamodbTableTtl(attribute_name='expires_at', enabled=True)
+            ],
+            billing_mode='PAY_PER_REQUEST',
         )
 
+    def create_dependency_layers(
+            self,
+            package_files: Dict[str, str]) -> None:
+        """ Creates a dependency layer per architecture. """
+        self.dependency_layers: Dict[str, LambdaLayerVersion] = {}
+        for architecture, package_file in package_files.items():
+            dependency_package = S3BucketObject(
+                self, f'dependency_deployment_package_{architecture}',
+                bucket=self.lambda_bucket.bucket,
+                key=f'sms_bridge/{os.path.basename(package_file)}',
+                source=package_file,
+            )
+            self.dependency_layers[architecture] = LambdaLayerVersion(
+                self, f'dependency_layer_{architecture}',
+                layer_name=f'SMSBridgeDependencyLayer-{architecture}',
+                s3_bucket=dependency_package.bucket,
+                s3_key=dependency_package.key,
+                compatible_runtimes=['python3.8'],
+                compatible_architectures=[architecture],
+                source_code_hash=source_hash(package_file),
+            )
+
     def create_lambda_role(self) -> IamRole:
         role = IamRole(
             self, 'lambda_execution_role',
@@ -110,11 +145,34 @@ class SMSBridgeStack(TerraformStack):
                     {
                         'Effect': 'Allow',
                         'Action': [
+                            'dynamodb:BatchGetItem',
+                            'dynamodb:GetItem',
                             'dynamodb:PutItem',
                             'dynamodb:Scan',
                         ],
                         'Resource': self.dynamodb_table.arn,
                     },
+                    {
+                        'Effect': 'Allow',
+                        'Action': [
+                            'dynamodb:DeleteItem',
+                            'dynamodb:GetItem',
+                            'dynamodb:PutItem',
+                            'dynamodb:Query',
+                        ],
+                        'Resource': self.subscription_table.arn,
+                    },
+                    {
+                        'Effect': 'Allow',
+                        'Action': [
+                            'dynamodb:BatchGetItem',
+                            'dynamodb:DeleteItem',
+                            'dynamodb:GetItem',
+                            'dynamodb:PutItem',
+                            'dynamodb:UpdateItem',
+                        ],
+                        'Resource': self.broadcast_table.arn,
+                    },
                     {
                         'Effect': 'Allow',
                         'Action': [
@@ -122,6 +180,26 @@ class SMSBridgeStack(TerraformStack):
                         ],
                         'Resource': f'{self.config_bucket.arn}/*',
                     },
+                    {
+                        'Effect': 'Allow',
+                        'Action': [
+                            's3:PutObject',
+                        ],
+                        'Resource': [
+                            f'{self.config_bucket.arn}/profiles/*',
+                            f'{self.config_bucket.arn}/media/*',
+                        ],
+                    },
+                    {
+                        'Effect': 'Allow',
+                        'Action': [
+                            'ssm:GetParameters',
+                        ],
+                        'Resource': (
+                            f'arn:aws:ssm:{self.region}:{self.account_id}:'
+                            'parameter/sms-bridge/*'
+                        ),
+                    },
                 ],
             }),
         )
@@ -134,38 +212,102 @@ class SMSBridgeStack(TerraformStack):
 
         return role
 
-    def create_lambda_function(self, path: str) -> LambdaFunction:
+    def create_lambda_function(self, path: str) -> LambdaAlias:
         function_name: str = f'{path.title()}Receiver'
+        profile = load_profile(self.stage, path)
         CloudwatchLogGroup(
             self, f'{path}_receive_log_group',
             name=f'/aws/lambda/{function_name}',
             retention_in_days=14,
         )
-        return LambdaFunction(
+        function = LambdaFunction(
             self, f'{path}_receive_function',
             function_name=function_name,
             handler=f'aws_lambda.receive_{path}.handler',
             runtime='python3.8',
             role=self.lambda_execution_role.arn,
             environment=[self.lambda_environment],
-            layers=[self.dependency_layer.arn],
-            memory_size=128,
-            timeout=30,
+            layers=[
+                self.dependency_layers[profile['architecture']].arn],
+            architectures=[profile['architecture']],
+            memory_size=profile['memory_size'],
+            timeout=profile['timeout'],
+            reserved_concurrent_executions=profile['reserved_concurrency'],
+            publish=True,
             tracing_config=[self.lambda_tracing_config],
             s3_bucket=self.function_package.bucket,
             s3_key=self.function_package.key,
             source_code_hash=self.function_source_hash,
         )
+        alias = LambdaAlias(
+            self, f'{path}_receive_function_alias',
+            name='live',
+            function_name=function.function_name,
+            function_version=function.version,
+        )
+        self.create_provisioned_concurrency(path, alias, profile)
+
+        return alias
+
+    def create_provisioned_concurrency(
+            self,
+            path: str,
+            alias: LambdaAlias,
+            profile: Dict[str, Any]) -> None:
+        if not profile['provisioned_concurrency']:
+            return
+
+        LambdaProvisionedConcurrencyConfig(
+            self, f'{path}_provisioned_concurrency',
+            function_name=alias.function_name,
+            qualifier=alias.name,
+            provisioned_concurrent_executions=(
+                profile['provisioned_concurrency']),
+        )
+        autoscaling = profile['autoscaling']
+        if not autoscaling:
+            return
+
+        target = AppautoscalingTarget(
+            self, f'{path}_provisioned_concurrency_target',
+            service_namespace='lambda',
+            scalable_dimension='lambda:function:ProvisionedConcurrency',
+            resource_id=f'function:{alias.function_name}:{alias.name}',
+            min_capacity=autoscaling['min_capacity'],
+            max_capacity=autoscaling['max_capacity'],
+        )
+        AppautoscalingPolicy(
+            self, f'{path}_provisioned_concurrency_policy',
+            name=f'{path}_provisioned_concurrency_utilization',
+            policy_type='TargetTrackingScaling',
+            service_namespace=target.service_namespace,
+            scalable_dimension=target.scalable_dimension,
+            resource_id=target.resource_id,
+            target_tracking_scaling_policy_configuration=[
+                AppautoscalingPolicyTargetTrackingScalingPolicyConfiguration(
+                    target_value=autoscaling['utilization_target'],
+                    predefined_metric_specification=[
+                        AppautoscalingPolicyTargetTrackingScalingPolicyConfigurationPredefinedMetricSpecification(  # noqa: E501
+                            predefined_metric_type=(
+                                'LambdaProvisionedConcurrencyUtilization'),
+                        ),
+                    ],
+                ),
+            ],
+        )
 
     def create_lambda_setup(self) -> None:
-        layer_package_file, function_package_file = package_assets()
-        self.create_dependency_layer(layer_package_file)
+        layer_package_files, function_package_file = package_assets(
+            architectures(self.stage))
+        self.create_dependency_layers(layer_package_files)
         self.lambda_environment: LambdaFunctionEnvironment = \
             LambdaFunctionEnvironment(variables={
                 'bridge_env': 'PROD',
                 'bridge_config':
                     f's3://{self.config_bucket.bucket}/bridge.json',
                 'state_dynamodb_table': self.dynamodb_table.name,
+                'broadcast_dynamodb_table': self.broadcast_table.name,
+                'subscription_dynamodb_table': self.subscription_table.name,
             })
         self.lambda_tracing_config: LambdaFunctionTracingConfig = \
             LambdaFunctionTracingConfig(mode='Active')
@@ -176,12 +318,9 @@ class SMSBridgeStack(TerraformStack):
             source=function_package_file,
         )
         self.lambda_execution_role: IamRole = self.create_lambda_role()
-        with open(function_package_file, 'rb') as f:
-            hash_bytes = sha256(f.read()).digest()
-            self.function_source_hash: str = base64.b64encode(
-                hash_bytes).decode('UTF-8')
+        self.function_source_hash: str = source_hash(function_package_file)
 
-        self.functions: Dict[str, LambdaFunction] = {
+        self.functions: Dict[str, LambdaAlias] = {
             path: self.create_lambda_function(path)
             for path in ('telegram', 'twilio')
         }
@@ -222,6 +361,7 @@ class SMSBridgeStack(TerraformStack):
                 statement_id='AllowExecutionFromAPIGateway',
                 action='lambda:InvokeFunction',
                 function_name=function.function_name,
+                qualifier=function.name,
                 principal='apigateway.amazonaws.com',
                 source_arn=(
                     f'arn:aws:execute-api:{self.region}:{self.account_id}:'
@@ -242,7 +382,7 @@ class SMSBridgeStack(TerraformStack):
     def __init__(self, scope: Construct, ns: str):
         super().__init__(scope, ns)
         self.region: str = 'us-east-1'
-        self.stage: str = 'dev'
+        self.stage: str = os.getenv('STAGE', 'dev')
 
         AwsProvider(self, 'aws', region=self.region)
         S3Backend(
@@ -0,0 +1,58 @@
+""" Subscribes users active before building subscriptions to all buildings.
+
+Before subscriptions every active user received messages of every
+building. This keeps them doing so after the upgrade, by subscribing
+every number active in the state storage to all buildings. Subscribing is
+idempotent, so the backfill can be run again safely. The storage is
+configured as for the handlers, for the DynamoDB backend table names are
+read from the same environment variables.
+
+Usage:
+    state_dynamodb_table=... subscription_dynamodb_table=... \
+        python -m tools.backfill_subscriptions [--dry-run]
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from bridge.configuration import load_config
+from bridge.repository import (
+    ALL_BUILDINGS,
+    create_state_repository,
+    create_subscription_repository,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true',
+        help='only count the numbers that would be subscribed')
+    parser.add_argument('--workers', type=int, default=10)
+    args = parser.parse_args()
+
+    config = load_config(os.environ.get('bridge_config'))
+    state = create_state_repository(config)
+    numbers: List[str] = list(state.get_active_numbers())
+    if not args.dry_run:
+        subscriptions = create_subscription_repository(config)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            list(executor.map(
+                lambda number: subscriptions.subscribe(
+                    ALL_BUILDINGS, number),
+                numbers,
+            ))
+
+    print(json.dumps({
+        'active_numbers': len(numbers),
+        'subscribed': 0 if args.dry_run else len(numbers),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+""" Compares fixed and adaptive send concurrency against a stub endpoint.
+
+A Telegram provider sends batches of messages to tools.stub_endpoint,
+once with a fixed number of workers and once with an adaptive limiter.
+Each run reports throughput, delivered and throttled sends, and for the
+adaptive run the limit after every batch and the limiter metrics.
+
+Usage:
+    python -m tools.bench_concurrency [--messages 1000] [--batch 50]
+        [--max-workers 20] [--capacity 8] [--latency 0.05]
+"""
+import argparse
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+from bridge.configuration import ConcurrencyConfig, TelegramConfig
+from bridge.providers import Message, TelegramMessageProvider
+from tools.stub_endpoint import StubEndpoint
+
+
+def run(
+        args: argparse.Namespace,
+        adaptive: bool) -> Dict[str, Any]:
+    """ Sends all messages in batches and returns the run report. """
+    endpoint = StubEndpoint(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        capacity=args.capacity,
+    ).start()
+    provider = TelegramMessageProvider(TelegramConfig(
+        token='bench',
+        base_url=f'{endpoint.url}/bot{{}}',
+        max_workers=args.max_workers,
+        concurrency=ConcurrencyConfig(
+            adaptive=adaptive, latency_target=args.latency_target),
+    ).derive())
+
+    limits: List[int] = []
+    delivered = 0
+    start = time.monotonic()
+    for offset in range(0, args.messages, args.batch):
+        messages = [
+            Message(source='', destination=str(100000000 + i),
+                    text='bench', media=[])
+            for i in range(offset, min(offset + args.batch, args.messages))
+        ]
+        results = provider.send_many(messages)
+        delivered += sum(result.delivered for result in results)
+        if provider.limiter:
+            limits.append(provider.limiter.metrics()['limit'])
+    elapsed = time.monotonic() - start
+    endpoint.stop()
+
+    report: Dict[str, Any] = {
+        'seconds': round(elapsed, 3),
+        'delivered': delivered,
+        'delivered_per_second': round(delivered / elapsed, 1),
+        'endpoint': endpoint.stats(),
+    }
+    if provider.limiter:
+        report['limits'] = limits
+        report['limiter'] = provider.limiter.metrics()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--max-workers', type=int, default=20)
+    parser.add_argument('--capacity', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--latency-target', type=float, default=0.0)
+    parser.add_argument(
+        '--verbose', action='store_true', help='keep bridge logs')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    print(json.dumps({
+        'fixed': run(args, adaptive=False),
+        'adaptive': run(args, adaptive=True),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
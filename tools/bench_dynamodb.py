@@ -0,0 +1,109 @@
+""" Compares the resource and low level client DynamoDB services.
+
+Client creation time and peak memory are measured in fresh interpreters,
+per-item decode cost in process on state table items. No requests are
+sent to DynamoDB.
+
+Usage:
+    python -m tools.bench_dynamodb [--runs 5] [--items 10000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import timeit
+from typing import Any, Dict, List
+
+
+IMPLEMENTATIONS = ('resource', 'client')
+
+CREATE_CODE = '''
+import json, resource, time
+start = time.perf_counter()
+from bridge.dynamodb_service import create_dynamodb_service
+service = create_dynamodb_service('bench', '{implementation}')
+if '{implementation}' == 'resource':
+    service.dynamodb_table
+else:
+    service.client
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}}))
+'''
+
+
+def create_cost(implementation: str, runs: int) -> Dict[str, float]:
+    """ Returns median import and client creation time and peak RSS. """
+    env = dict(os.environ)
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    samples: List[Dict[str, Any]] = [
+        json.loads(subprocess.check_output(
+            [sys.executable, '-c',
+             CREATE_CODE.format(implementation=implementation)],
+            env=env,
+        ))
+        for _ in range(runs)
+    ]
+    return {
+        'seconds': round(
+            statistics.median(sample['seconds'] for sample in samples), 4),
+        'max_rss_kb': statistics.median(
+            sample['max_rss_kb'] for sample in samples),
+    }
+
+
+def decode_cost(items: int, runs: int) -> Dict[str, float]:
+    """ Returns seconds per decoded item of both decoders. """
+    from boto3.dynamodb.types import TypeDeserializer  # type: ignore
+
+    from bridge.dynamodb_service import decode_item
+
+    raw: List[Dict[str, Dict[str, Any]]] = [
+        {'user_number': {'S': f'{i}'}, 'active': {'BOOL': i % 2 == 0}}
+        for i in range(items)
+    ]
+    deserializer = TypeDeserializer()
+
+    def resource_decode() -> None:
+        for item in raw:
+            {
+                name: deserializer.deserialize(value)
+                for name, value in item.items()
+            }
+
+    def client_decode() -> None:
+        for item in raw:
+            decode_item(item)
+
+    return {
+        name: min(timeit.repeat(decode, number=1, repeat=runs)) / items
+        for name, decode in (
+            ('resource', resource_decode),
+            ('client', client_decode),
+        )
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--items', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'create': {
+            implementation: create_cost(implementation, args.runs)
+            for implementation in IMPLEMENTATIONS
+        },
+        'decode_seconds_per_item': decode_cost(args.items, args.runs),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+""" Compares operation latency of the SQLite and DynamoDB storages.
+
+Each repository operation of the webhook handlers runs a number of times
+per backend, reporting median and 99th percentile latency in
+milliseconds. SQLite runs on a temporary database. DynamoDB runs only
+with --dynamodb, on the tables named by the usual environment variables,
+where it leaves inactive bench numbers and broadcasts expiring with the
+table TTL.
+
+Usage:
+    python -m tools.bench_storage [--operations 200] [--recipients 100]
+    state_dynamodb_table=... subscription_dynamodb_table=... \
+        broadcast_dynamodb_table=... \
+        python -m tools.bench_storage --dynamodb
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from bridge.coalescing import create_burst_buffer
+from bridge.configuration import Configuration, DynamoDBConfig, StorageConfig
+from bridge.repository import (
+    create_broadcast_repository,
+    create_state_repository,
+    create_subscription_repository,
+)
+
+
+BUILDING = '+15550000000'
+
+
+def measure(
+        operation: Callable[[int], Any],
+        runs: int) -> Dict[str, float]:
+    """ Returns median and p99 latency of runs of an operation in ms. """
+    samples: List[float] = []
+    for i in range(runs):
+        start = time.perf_counter()
+        operation(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(0.99 * runs))], 3),
+    }
+
+
+def run(
+        config: Configuration,
+        runs: int,
+        recipients: int) -> Dict[str, Dict[str, float]]:
+    """ Measures every handler operation on the configured storage. """
+    state = create_state_repository(config)
+    subscriptions = create_subscription_repository(config)
+    broadcasts = create_broadcast_repository(config)
+    buffer = create_burst_buffer(config)
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    numbers = [f'{prefix}-{i}' for i in range(recipients)]
+    broadcast_ids = [f'{prefix}-broadcast-{i}' for i in range(runs)]
+    owner = f'{prefix}-owner'
+
+    ret = {
+        'put_active': measure(
+            lambda i: state.put_active(numbers[i % recipients], False),
+            runs),
+        'filter_active': measure(
+            lambda i: list(state.filter_active(numbers)), runs),
+        'subscribe': measure(
+            lambda i: subscriptions.subscribe(
+                BUILDING, numbers[i % recipients]),
+            runs),
+        'get_subscribers': measure(
+            lambda i: subscriptions.get_subscribers(BUILDING), runs),
+        'create_broadcast': measure(
+            lambda i: broadcasts.create(
+                broadcast_ids[i], BUILDING, 'bench', numbers,
+                config.broadcast_checkpoint_size),
+            runs),
+        'claim_complete_batch': measure(
+            lambda i: (
+                broadcasts.claim(broadcast_ids[i], 0, owner, 60.0),
+                broadcasts.complete(
+                    broadcast_ids[i], 0, owner,
+                    set(numbers[:config.broadcast_checkpoint_size]),
+                    {}, set()),
+            ),
+            runs),
+        'buffer_cycle': measure(
+            lambda i: (
+                buffer.append(prefix, {
+                    'message_id': str(i), 'text': 'bench', 'media': []}),
+                buffer.release(prefix, len(buffer.peek(prefix))),
+            ),
+            runs),
+    }
+    for number in numbers:
+        subscriptions.unsubscribe(BUILDING, number)
+    return ret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--operations', type=int, default=200)
+    parser.add_argument('--recipients', type=int, default=100)
+    parser.add_argument(
+        '--dynamodb', action='store_true',
+        help='also measure the DynamoDB tables of the environment')
+    parser.add_argument(
+        '--implementation', choices=['resource', 'client'],
+        default='resource')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    report: Dict[str, Dict[str, Dict[str, float]]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        report['sqlite'] = run(Configuration(storage=StorageConfig(
+            backend='sqlite',
+            sqlite_path=os.path.join(directory, 'bench.db'),
+        )), args.operations, args.recipients)
+    if args.dynamodb:
+        report['dynamodb'] = run(Configuration(
+            dynamodb=DynamoDBConfig(implementation=args.implementation),
+        ), args.operations, args.recipients)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
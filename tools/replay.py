@@ -0,0 +1,384 @@
+""" Replays recorded or synthetic traffic against the bridge handlers.
+
+Requests are sent open loop at target rates, either evenly spaced or in
+bursts, to the Lambda handlers in process or to a running server. In
+process, providers and DynamoDB are replaced by the stand-ins of
+tools.stubs. Latency is measured from the scheduled send time, so queueing
+behind a saturated target shows up in it. Each rate step reports achieved
+throughput, latency percentiles, HTTP errors and, in process, provider
+delivery errors, and the first step missing its target is reported as the
+saturation point. Handlers answer 200 even when sends fail, so delivery
+errors are counted from the stub providers rather than from responses.
+
+Recorded traffic is a JSON lines file of ``{"route": "/telegram",
+"body": "..."}`` objects holding raw webhook bodies.
+
+Usage:
+    python -m tools.replay --synthetic mixed --rates 10,50,100
+    python -m tools.replay --input traffic.jsonl --url http://localhost:8080
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+
+
+Request = Tuple[str, str]
+Deliveries = Optional[Tuple[int, int]]
+
+SYNTHETIC_KINDS = ('telegram', 'twilio', 'mixed')
+REPLAY_CONFIG = {
+    'logger_conf': [{'level': 'WARNING'}],
+    'message_providers': {
+        'telegram': {'token': 'replay'},
+        'twilio': {'sid': 'ACreplay', 'token': 'replay', 'number': '+1555'},
+    },
+}
+
+
+def load_requests(path: str) -> List[Request]:
+    """ Reads recorded requests from a JSON lines file. """
+    ret: List[Request] = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                ret.append((data['route'], data['body']))
+    return ret
+
+
+def telegram_update(chat_id: int, text: str) -> Request:
+    return '/telegram', json.dumps({
+        'update_id': random.randint(1, 2 ** 31),
+        'message': {'chat': {'id': chat_id}, 'text': text},
+    })
+
+
+def twilio_form(building: str, text: str) -> Request:
+    return '/twilio', urlencode({
+        'Body': text,
+        'From': building,
+        'MessageSid': f'SM{uuid.uuid4().hex}',
+    })
+
+
+def synthetic_requests(
+        kind: str,
+        count: int,
+        buildings: List[str],
+        users: int) -> List[Request]:
+    """ Generates Telegram state changes and Twilio building messages. """
+    ret: List[Request] = []
+    for i in range(count):
+        if kind == 'telegram' or (kind == 'mixed' and i % 2):
+            ret.append(telegram_update(
+                random.randrange(users), random.choice(['start', 'stop'])))
+        else:
+            ret.append(twilio_form(
+                random.choice(buildings), f'Synthetic message {i}'))
+    return ret
+
+
+class InProcessTarget:
+    """ Models the Lambda handlers running with local stand-ins. """
+
+    def __init__(
+            self,
+            buildings: List[str],
+            users: int,
+            latency: float,
+            error_rate: float,
+            timeout: float = 30.0) -> None:
+        for name in ('state', 'broadcast', 'subscription'):
+            os.environ.setdefault(
+                f'{name}_dynamodb_table', f'replay-{name}')
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        if 'bridge_config' not in os.environ:
+            with tempfile.NamedTemporaryFile(
+                    'w', suffix='.json', delete=False) as f:
+                json.dump(REPLAY_CONFIG, f)
+            os.environ['bridge_config'] = f.name
+
+        from bridge.coalescing import MemoryBurstBuffer
+        from server import ROUTES, InvocationContext
+        from tools.stubs import (
+            MemoryBroadcastRepository,
+            MemoryStateRepository,
+            MemorySubscriptionRepository,
+            StubMessageProvider,
+        )
+
+        self.context = InvocationContext
+        self.timeout = timeout
+        modules = {
+            route: importlib.import_module(module)
+            for route, module in ROUTES.items()
+        }
+        telegram = modules['/telegram']
+        twilio = modules['/twilio']
+        self.telegram_provider = StubMessageProvider(
+            telegram.telegram_provider, latency, error_rate)  # type: ignore
+        self.twilio_provider = StubMessageProvider(
+            telegram.twilio_provider, latency, error_rate)  # type: ignore
+        state = MemoryStateRepository()
+        subscriptions = MemorySubscriptionRepository()
+        for user in range(users):
+            state.put_active(str(user), True)
+            subscriptions.subscribe(random.choice(buildings), str(user))
+
+        for module in modules.values():
+            module.telegram_provider = self.telegram_provider  # type: ignore
+            module.twilio_provider = self.twilio_provider  # type: ignore
+            module.repository = state  # type: ignore
+            module.subscriptions = subscriptions  # type: ignore
+        twilio.broadcaster.provider = self.telegram_provider  # type: ignore
+        twilio.broadcaster.repository = \
+            MemoryBroadcastRepository()  # type: ignore
+        twilio.coalescer.buffer = MemoryBurstBuffer()  # type: ignore
+        self.handlers = {
+            route: module.handler  # type: ignore
+            for route, module in modules.items()
+        }
+
+    def __call__(self, route: str, body: str) -> bool:
+        response = self.handlers[route](
+            {'httpMethod': 'POST', 'path': route, 'body': body},
+            self.context(self.timeout),
+        )
+        return response['statusCode'] < 500
+
+    def deliveries(self) -> Deliveries:
+        """ Returns delivered and failed provider sends so far. """
+        providers = (self.telegram_provider, self.twilio_provider)
+        return (
+            sum(provider.sent for provider in providers),
+            sum(provider.failed for provider in providers),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'telegram_sends': self.telegram_provider.sent,
+            'telegram_failed': self.telegram_provider.failed,
+            'twilio_sends': self.twilio_provider.sent,
+            'twilio_failed': self.twilio_provider.failed,
+        }
+
+
+class HTTPTarget:
+    """ Models a bridge server reached over HTTP. """
+
+    def __init__(self, url: str, timeout: float = 30.0) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def __call__(self, route: str, body: str) -> bool:
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        content_type = (
+            'application/json' if route == '/telegram'
+            else 'application/x-www-form-urlencoded'
+        )
+        r = self.local.session.post(
+            f'{self.url}{route}',
+            data=body.encode('UTF-8'),
+            headers={'Content-Type': content_type},
+            timeout=self.timeout,
+        )
+        return r.status_code < 500
+
+    def deliveries(self) -> Deliveries:
+        """ Returns None, sends of a remote server are not observable. """
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+def schedule(
+        count: int,
+        rate: float,
+        mode: str,
+        burst_size: int) -> List[float]:
+    """ Returns send offsets in seconds for a constant or bursty rate. """
+    if mode == 'burst':
+        return [(i // burst_size) * burst_size / rate for i in range(count)]
+    return [i / rate for i in range(count)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_step(
+        target: Callable[[str, str], bool],
+        deliveries: Callable[[], Deliveries],
+        workload: List[Request],
+        rate: float,
+        duration: float,
+        mode: str,
+        burst_size: int,
+        concurrency: int) -> Dict[str, Any]:
+    """ Replays requests at a target rate and returns the step report. """
+    count = max(1, int(rate * duration))
+    offsets = schedule(count, rate, mode, burst_size)
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    before = deliveries()
+
+    def send(request: Request, scheduled: float) -> None:
+        nonlocal errors
+        try:
+            ok = target(*request)
+        except Exception:
+            ok = False
+        latency = time.monotonic() - scheduled
+        with lock:
+            latencies.append(latency)
+            errors += not ok
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, offset in enumerate(offsets):
+            scheduled = start + offset
+            time.sleep(max(0.0, scheduled - time.monotonic()))
+            executor.submit(send, workload[i % len(workload)], scheduled)
+    elapsed = time.monotonic() - start
+    after = deliveries()
+
+    delivery_errors: Optional[int] = None
+    delivery_error_rate: Optional[float] = None
+    if before is not None and after is not None:
+        delivered = after[0] - before[0]
+        delivery_errors = after[1] - before[1]
+        delivery_error_rate = round(
+            delivery_errors / max(1, delivered + delivery_errors), 4)
+
+    return {
+        'target_rate': rate,
+        'achieved_rate': round(count / elapsed, 2),
+        'requests': count,
+        'http_errors': errors,
+        'http_error_rate': round(errors / count, 4),
+        'delivery_errors': delivery_errors,
+        'delivery_error_rate': delivery_error_rate,
+        'latency': {
+            'mean': round(statistics.mean(latencies), 4),
+            'p50': round(percentile(latencies, 0.5), 4),
+            'p90': round(percentile(latencies, 0.9), 4),
+            'p99': round(percentile(latencies, 0.99), 4),
+            'max': round(max(latencies), 4),
+        },
+    }
+
+
+def saturated(
+        step: Dict[str, Any],
+        max_error_rate: float,
+        max_p99: float) -> bool:
+    """ Returns True if a step missed its rate, error or latency target. """
+    return (
+        step['achieved_rate'] < 0.95 * step['target_rate']
+        or step['http_error_rate'] > max_error_rate
+        or (step['delivery_error_rate'] or 0.0) > max_error_rate
+        or step['latency']['p99'] > max_p99
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input', help='recorded JSON lines requests')
+    source.add_argument('--synthetic', choices=SYNTHETIC_KINDS)
+    parser.add_argument(
+        '--url', help='server URL, handlers run in process if not set')
+    parser.add_argument('--rates', default='10,20,50,100')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument(
+        '--mode', choices=['constant', 'burst'], default='constant')
+    parser.add_argument('--burst-size', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--buildings', type=int, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--provider-latency', type=float, default=0.05)
+    parser.add_argument('--provider-error-rate', type=float, default=0.0)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--max-p99', type=float, default=1.0)
+    parser.add_argument('--output', help='report file, stdout if not set')
+    parser.add_argument(
+        '--verbose', action='store_true', help='keep bridge logs')
+    args = parser.parse_args()
+
+    buildings = [f'+1555010{i:04d}' for i in range(args.buildings)]
+    rates = [float(rate) for rate in args.rates.split(',')]
+    if args.input:
+        workload = load_requests(args.input)
+    else:
+        workload = synthetic_requests(
+            args.synthetic,
+            int(max(rates) * args.duration),
+            buildings,
+            args.users,
+        )
+
+    target: Any
+    if args.url:
+        target = HTTPTarget(args.url)
+    else:
+        target = InProcessTarget(
+            buildings,
+            args.users,
+            args.provider_latency,
+            args.provider_error_rate,
+        )
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    steps: List[Dict[str, Any]] = []
+    saturation_rate: Optional[float] = None
+    for rate in rates:
+        step = run_step(
+            target, target.deliveries, workload, rate, args.duration,
+            args.mode, args.burst_size, args.concurrency)
+        steps.append(step)
+        if saturated(step, args.max_error_rate, args.max_p99):
+            saturation_rate = rate
+            break
+
+    report = json.dumps({
+        'target': args.url or 'in-process',
+        'mode': args.mode,
+        'duration': args.duration,
+        'steps': steps,
+        'saturation_rate': saturation_rate,
+        'stats': target.stats(),
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
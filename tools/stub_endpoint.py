@@ -0,0 +1,154 @@
+""" Serves a local stand-in of the Telegram Bot API with fault injection.
+
+Every request waits a latency with jitter, then fails with a 500 or a 429
+at the given rates. Requests beyond the capacity in flight are throttled
+with a 429 like a rate limited provider, so adaptive concurrency can be
+observed backing off. Point ``message_providers.telegram.base_url`` at
+``http://<host>:<port>/bot{}`` to send to it.
+
+Usage:
+    python -m tools.stub_endpoint [--port 8081] [--latency 0.05]
+        [--jitter 0.02] [--error-rate 0.0] [--throttle-rate 0.0]
+        [--capacity 0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+
+class StubEndpoint():
+    """ Models a provider API answering after a latency or with errors. """
+
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            latency: float = 0.05,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            throttle_rate: float = 0.0,
+            capacity: int = 0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.capacity = capacity
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.statuses: Counter = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.socket.getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self) -> Any:
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self.respond(*endpoint.answer())
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.respond(*endpoint.answer())
+
+            def respond(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode('UTF-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def answer(self) -> Tuple[int, Dict[str, Any]]:
+        """ Returns a status and Telegram style body of one request. """
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            overloaded = 0 < self.capacity < self.in_flight
+        try:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+            if overloaded or random.random() < self.throttle_rate:
+                status, body = 429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': 'Too Many Requests: retry after 1',
+                    'parameters': {'retry_after': 1},
+                }
+            elif random.random() < self.error_rate:
+                status, body = 500, {
+                    'ok': False,
+                    'error_code': 500,
+                    'description': 'Internal Server Error',
+                }
+            else:
+                status, body = 200, {'ok': True, 'result': {}}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.statuses[status] += 1
+        return status, body
+
+    def start(self) -> 'StubEndpoint':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'statuses': {
+                    str(status): count
+                    for status, count in sorted(self.statuses.items())
+                },
+                'peak_in_flight': self.peak_in_flight,
+            }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument(
+        '--capacity', type=int, default=0,
+        help='requests in flight before throttling, unlimited if 0')
+    args = parser.parse_args()
+
+    endpoint = StubEndpoint(
+        args.host, args.port, args.latency, args.jitter,
+        args.error_rate, args.throttle_rate, args.capacity)
+    print(f'serving on {endpoint.url}')
+    try:
+        endpoint.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(endpoint.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+""" Serves a local stand-in of SSM Parameter Store GetParameters.
+
+Parameters are read from a JSON file mapping names to values. Every
+request is recorded, so batching and caching can be observed. Point
+``ssm.endpoint_url`` at ``http://<host>:<port>`` to resolve ``ssm://``
+references from it, with any AWS credentials set since signatures are
+not checked.
+
+Usage:
+    python -m tools.stub_ssm parameters.json [--port 8082]
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+
+GET_PARAMETERS_TARGET = 'AmazonSSM.GetParameters'
+MAX_NAMES = 10
+
+
+class StubSSM():
+    """ Models an SSM endpoint answering GetParameters from a mapping. """
+
+    def __init__(
+            self,
+            parameters: Dict[str, str],
+            host: str = '127.0.0.1',
+            port: int = 0) -> None:
+        self.parameters = parameters
+        self.requests: List[List[str]] = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.socket.getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self) -> Any:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                data = self.rfile.read(
+                    int(self.headers.get('Content-Length', 0)))
+                self.respond(*stub.answer(
+                    self.headers.get('X-Amz-Target', ''), data))
+
+            def respond(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode('UTF-8')
+                self.send_response(status)
+                self.send_header(
+                    'Content-Type', 'application/x-amz-json-1.1')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def answer(
+            self,
+            target: str,
+            data: bytes) -> Tuple[int, Dict[str, Any]]:
+        """ Returns a status and body of a GetParameters request. """
+        if target != GET_PARAMETERS_TARGET:
+            return 400, {
+                '__type': 'UnknownOperationException',
+                'message': f'unsupported operation {target}',
+            }
+        names: List[str] = json.loads(data or b'{}').get('Names', [])
+        if not 0 < len(names) <= MAX_NAMES:
+            return 400, {
+                '__type': 'ValidationException',
+                'message': f'expected 1 to {MAX_NAMES} names',
+            }
+        with self._lock:
+            self.requests.append(names)
+        return 200, {
+            'Parameters': [
+                {
+                    'Name': name,
+                    'Type': 'SecureString',
+                    'Value': self.parameters[name],
+                    'Version': 1,
+                }
+                for name in names if name in self.parameters
+            ],
+            'InvalidParameters': [
+                name for name in names if name not in self.parameters
+            ],
+        }
+
+    def start(self) -> 'StubSSM':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('parameters', help='JSON file of names and values')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    args = parser.parse_args()
+
+    with open(args.parameters) as f:
+        stub = StubSSM(json.load(f), args.host, args.port)
+    print(f'serving on {stub.url}')
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps({'requests': len(stub.requests)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+""" Local stand-ins for message providers and repositories. """
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set
+
+from bridge.deadline import Deadline
+from bridge.providers import Message, MessageProvider, Providers
+from bridge.repository import (
+    ALL_BUILDINGS,
+    BroadcastRepository,
+    StateRepository,
+    SubscriptionRepository,
+    split_batches,
+)
+
+
+class StubMessageProvider(MessageProvider):
+    """ Models a provider that only waits and counts its sends.
+
+    Messages are parsed by the wrapped real provider, sends take a fixed
+    latency and fail at the given rate. Delivered and failed sends are
+    counted separately.
+    """
+
+    def __init__(
+            self,
+            provider: MessageProvider,
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            max_workers: int = 10) -> None:
+        self.provider: Providers = provider.provider
+        self.parser = provider
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_workers = max_workers
+        self.sent = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def send_message(
+            self,
+            message: Message,
+            deadline: Optional[Deadline] = None) -> None:
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            with self._lock:
+                self.failed += 1
+            raise ConnectionError('injected send error')
+        with self._lock:
+            self.sent += 1
+
+    def parse_message(self, raw_message: Any) -> Message:
+        return self.parser.parse_message(raw_message)
+
+
+class MemoryStateRepository(StateRepository):
+    """ Models an in memory StateRepository. """
+
+    def __init__(self) -> None:
+        self.active: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def get_active_numbers(
+            self,
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        with self._lock:
+            return [number for number, on in self.active.items() if on]
+
+    def filter_active(
+            self,
+            user_numbers: Iterable[str],
+            deadline: Optional[Deadline] = None) -> Iterable[str]:
+        with self._lock:
+            return [
+                number for number in user_numbers
+                if self.active.get(number)
+            ]
+
+    def put_active(
+            self,
+            user_number: str,
+            active: bool,
+            deadline: Optional[Deadline] = None) -> None:
+        with self._lock:
+            self.active[user_number] = active
+
+
+class MemorySubscriptionRepository(SubscriptionRepository):
+    """ Models an in memory SubscriptionRepository. """
+
+    def __init__(self) -> None:
+        self.subscribers: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def warm(self, timeout: float) -> None:
+        pass
+
+    def subscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        with self._lock:
+            self.subscribers.setdefault(building, set()).add(user_number)
+
+    def unsubscribe(
+            self,
+            building: str,
+            user_number: str,
+            deadline: Optional[Deadline] = None) -> None:
+        with self._lock:
+            self.subscribers.get(building, set()).discard(user_number)
+
+    def get_subscribers(
+            self,
+            building: str,
+            deadline: Optional[Deadline] = None) -> Set[str]:
+        with self._lock:
+            return self.subscribers.get(building, set()) | \
+                self.subscribers.get(ALL_BUILDINGS, set())
+
+
+class MemoryBroadcastRepository(BroadcastRepository):
+    """ Models an in memory BroadcastRepository. """
+
+    def __init__(self) -> None:
+        self.broadcasts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def warm(self, timeout: float) -> None:
+        pass
+
+    def create(
+            self,
+            broadcast_id: str,
+            source: str,
+            text: str,
+            recipients: Iterable[str],
+            batch_size: int,
+            deadline: Optional[Deadline] = None) -> bool:
+        with self._lock:
+            if broadcast_id in self.broadcasts:
+                return False
+            self.broadcasts[broadcast_id] = {
+                'broadcast_id': broadcast_id,
+                'source': source,
+                'text': text,
+                'batches': [
+                    {
+                        'index': index,
+                        'pending': set(batch),
+                        'failed': set(),
+                        'attempts': {},
+                        'delivered_count': 0,
+                        'lease_owner': None,
+                        'lease_expires': 0.0,
+                    }
+                    for index, batch in enumerate(
+                        split_batches(recipients, batch_size))
+                ],
+            }
+        return True
+
+    def _copy(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(
+            batch,
+            pending=set(batch['pending']),
+            failed=set(batch['failed']),
+            attempts=dict(batch['attempts']),
+        )
+
+    def get(
+            self,
+            broadcast_id: str,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self.broadcasts.get(broadcast_id)
+            if item is None:
+                return None
+            return dict(item, batches=[
+                self._copy(batch) for batch in item['batches']])
+
+    def claim(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            lease: float,
+            deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            batch = self.broadcasts[broadcast_id]['batches'][index]
+            if batch['lease_owner'] not in (None, owner) \
+                    and batch['lease_expires'] >= now:
+                return None
+            batch['lease_owner'] = owner
+            batch['lease_expires'] = now + lease
+            return self._copy(batch)
+
+    def complete(
+            self,
+            broadcast_id: str,
+            index: int,
+            owner: str,
+            delivered: Set[str],
+            attempts: Dict[str, int],
+            exhausted: Set[str],
+            deadline: Optional[Deadline] = None) -> None:
+        with self._lock:
+            batch = self.broadcasts[broadcast_id]['batches'][index]
+            batch['pending'].difference_update(delivered)
+            batch['delivered_count'] += len(delivered)
+            if batch['lease_owner'] != owner:
+                return
+            batch['pending'].difference_update(exhausted)
+            batch['failed'].update(exhausted)
+            batch['attempts'].update(attempts)
+            batch['lease_owner'] = None